@@ -0,0 +1,362 @@
+import argparse
+import hashlib
+import http.server
+import json
+import math
+import random
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from llm.token_budget import estimate_tokens
+
+# 人格回复的素材：随机拼句子，长度由 reply_chars 控制
+_PERSONA_SENTENCES = (
+    "我在呢，你慢慢说。",
+    "听起来今天有点累，先别急着给自己下结论。",
+    "我们可以先把最卡住你的那一件事拎出来看看。",
+    "换个角度想，这件事也许没有你现在感觉的那么糟。",
+    "你刚才说的那句话，我觉得挺关键的。",
+    "要不要先喝口水，再接着聊？",
+    "如果只能先做一小步，你会选哪一步？",
+    "这种感觉很正常，很多人在这个阶段都会有。",
+)
+
+_STATE_VALUES = {
+    "emotion": ("平静", "紧张", "疲惫", "开心"),
+    "energy": ("充沛", "正常", "疲惫"),
+    "activity": ("工作", "刷手机", "发呆", "社交"),
+    "location": ("家里", "公司", "通勤中", "外出"),
+    "need": ("陪伴", "梳理今天", "逃离任务", "等待发掘"),
+    "social_state": ("想说话", "不想社交", "需要安静"),
+    "micro_desire": ("想拖延一下", "想躺会儿", "想吃东西", "等待发掘"),
+    "body_state": ("有点困", "肩颈紧", "精神还行", "等待发掘"),
+    "concern": ("工作压力有点大", "最近睡不好", "等待发掘"),
+}
+
+_MODE_WEIGHTS = (("Q", 0.4), ("T", 0.3), ("L", 0.1), ("SUM", 0.1), ("D", 0.1))
+
+
+class LatencyModel:
+    """
+    响应延迟分布（毫秒），用字符串描述：
+        fixed:200              固定 200ms
+        uniform:100,400        100~400ms 均匀分布
+        normal:300,50          均值 300、标准差 50（截断到 >= 0）
+        lognormal:300,0.5      中位数 300、对数标准差 0.5（长尾，最像真实 API）
+    """
+
+    KINDS = ("fixed", "uniform", "normal", "lognormal")
+
+    def __init__(self, kind: str = "fixed", a: float = 0.0, b: float = 0.0):
+        if kind not in self.KINDS:
+            raise ValueError(f"未知的延迟分布: {kind}")
+        self.kind = kind
+        self.a = float(a)
+        self.b = float(b)
+
+    @classmethod
+    def parse(cls, spec: str) -> "LatencyModel":
+        kind, _, params = spec.partition(":")
+        values = [float(x) for x in params.split(",") if x.strip()] if params else []
+        kind = kind.strip().lower()
+        if kind == "fixed":
+            return cls(kind, values[0] if values else 0.0)
+        if len(values) != 2:
+            raise ValueError(f"{kind} 需要两个参数: {spec}")
+        return cls(kind, values[0], values[1])
+
+    def sample(self, rng: random.Random) -> float:
+        """返回秒。"""
+        if self.kind == "fixed":
+            ms = self.a
+        elif self.kind == "uniform":
+            ms = rng.uniform(self.a, self.b)
+        elif self.kind == "normal":
+            ms = rng.gauss(self.a, self.b)
+        else:
+            ms = self.a * math.exp(rng.gauss(0.0, self.b))
+        return max(0.0, ms) / 1000.0
+
+    def __repr__(self):
+        return f"{self.kind}:{self.a:g},{self.b:g}" if self.kind != "fixed" else f"fixed:{self.a:g}"
+
+
+def canned_reply(role: str, payload: Any, rng: random.Random, reply_chars: int = 80) -> str:
+    """按 role 造一段格式正确的回复：触发器给 JSON，人格给一段中文。"""
+    payload = payload if isinstance(payload, dict) else {}
+
+    if role == "trigger_should_speak":
+        return json.dumps({"should_reply": rng.random() < 0.7})
+
+    if role == "trigger_select_engine":
+        return json.dumps({"mode": _pick_mode(rng)})
+
+    if role == "trigger_decide_turn":
+        return json.dumps({"should_reply": rng.random() < 0.7, "mode": _pick_mode(rng), "reason": "mock"})
+
+    if role == "trigger_state_update":
+        state = {k: rng.choice(v) for k, v in _STATE_VALUES.items()}
+        state["timestamp"] = time.strftime("%Y-%m-%d %H:%M:%S")
+        return json.dumps(state, ensure_ascii=False)
+
+    if role == "trigger_perspective_move":
+        current = payload.get("current_node") or {}
+        children = [c for c in (current.get("children") or []) if isinstance(c, str)]
+        move = bool(children) and rng.random() < 0.5
+        return json.dumps({
+            "move": move,
+            "next_node_id": rng.choice(children) if move else None,
+            "need_new_tree": False,
+            "reason": "mock",
+        })
+
+    if role == "perspective_generate_engine":
+        return json.dumps(_mock_tree(rng), ensure_ascii=False)
+
+    # 人格（以及未知 role）：自然语言
+    parts: List[str] = []
+    while sum(len(p) for p in parts) < reply_chars:
+        parts.append(rng.choice(_PERSONA_SENTENCES))
+    return "".join(parts)
+
+
+def _pick_mode(rng: random.Random) -> str:
+    r = rng.random()
+    acc = 0.0
+    for mode, weight in _MODE_WEIGHTS:
+        acc += weight
+        if r < acc:
+            return mode
+    return "Q"
+
+
+def _mock_tree(rng: random.Random) -> Dict[str, Any]:
+    n = rng.randint(3, 6)
+    nodes = {}
+    for i in range(n):
+        nid = f"N{i}"
+        children = [f"N{j}" for j in (2 * i + 1, 2 * i + 2) if j < n]
+        nodes[nid] = {
+            "id": nid,
+            "title": f"观点 {i}",
+            "user_viewpoint": rng.choice(_PERSONA_SENTENCES),
+            "our_viewpoint": rng.choice(_PERSONA_SENTENCES),
+            "potential_need": ["陪伴"],
+            "children": children,
+            "is_end": not children,
+        }
+    return {"tree_id": f"mock_tree_{rng.randrange(1 << 30):08x}", "root_id": "N0", "nodes": nodes}
+
+
+class MockLLMServer:
+    """
+    本地假的 chat-completions 服务，给基准测试用，不花 API 额度：
+
+    - 按 system prompt 识别 role（register_prompts 传入 LLMClient.role_prompts）；
+    - 每个 role 的延迟按 LatencyModel 抽样（latency 的 key 可以是完整 role、
+      role 前缀如 "trigger_"，或者 "default"）；
+    - 非流式回一个带 usage 的 JSON；流式按 chunk_chars 切块，块间隔 chunk_ms；
+    - push_override(role, content) 让某个 role 的下一次调用返回指定内容
+      （例如强制 need_new_tree，测观点树重建）。
+    """
+
+    def __init__(
+        self,
+        latency: Optional[Dict[str, LatencyModel]] = None,
+        chunk_ms: float = 30.0,
+        chunk_chars: int = 8,
+        reply_chars: int = 80,
+        seed: int = 0,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ):
+        self.latency = dict(latency or {"default": LatencyModel("fixed", 0)})
+        self.chunk_ms = chunk_ms
+        self.chunk_chars = max(1, int(chunk_chars))
+        self.reply_chars = reply_chars
+        self.host = host
+        self.port = port
+
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._prompt_roles: Dict[str, str] = {}
+        self._overrides: Dict[str, List[str]] = {}
+        self._server: Optional[http.server.ThreadingHTTPServer] = None
+        self.stats: Dict[str, int] = {}
+
+    # === 配置 ===
+    def register_prompts(self, role_prompts: Dict[str, str]):
+        with self._lock:
+            for role, prompt in role_prompts.items():
+                self._prompt_roles[self._hash(prompt)] = role
+
+    def push_override(self, role: str, content: str):
+        with self._lock:
+            self._overrides.setdefault(role, []).append(content)
+
+    def clear_overrides(self):
+        with self._lock:
+            self._overrides.clear()
+
+    @staticmethod
+    def _hash(text: str) -> str:
+        return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+    def _latency_for(self, role: str) -> LatencyModel:
+        if role in self.latency:
+            return self.latency[role]
+        best = None
+        for key, model in self.latency.items():
+            if key != "default" and role.startswith(key) and (best is None or len(key) > len(best[0])):
+                best = (key, model)
+        if best is not None:
+            return best[1]
+        return self.latency.get("default") or LatencyModel("fixed", 0)
+
+    # === 请求处理 ===
+    def respond(self, system_prompt: str, user_prompt: str):
+        """返回 (role, 回复文本, 延迟秒数)。"""
+        with self._lock:
+            role = self._prompt_roles.get(self._hash(system_prompt), "unknown")
+            self.stats[role] = self.stats.get(role, 0) + 1
+            queued = self._overrides.get(role)
+            override = queued.pop(0) if queued else None
+            delay = self._latency_for(role).sample(self._rng)
+            if override is not None:
+                return role, override, delay
+            try:
+                payload = json.loads(user_prompt)
+            except Exception:
+                payload = {}
+            return role, canned_reply(role, payload, self._rng, self.reply_chars), delay
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                try:
+                    length = int(self.headers.get("Content-Length", "0"))
+                    req = json.loads(self.rfile.read(length))
+                    messages = req.get("messages") or []
+                    system_prompt = messages[0].get("content", "") if messages else ""
+                    user_prompt = messages[-1].get("content", "") if len(messages) > 1 else ""
+                except Exception:
+                    self._send_json(400, {"error": "bad request"})
+                    return
+
+                _, content, delay = server.respond(system_prompt, user_prompt)
+                usage = {
+                    "prompt_tokens": estimate_tokens(system_prompt) + estimate_tokens(user_prompt),
+                    "completion_tokens": estimate_tokens(content),
+                }
+                time.sleep(delay)
+                try:
+                    if req.get("stream"):
+                        self._send_stream(content, usage)
+                    else:
+                        self._send_json(200, {
+                            "choices": [{"message": {"role": "assistant", "content": content}}],
+                            "usage": usage,
+                        })
+                except (BrokenPipeError, ConnectionResetError):
+                    # 客户端已经取消 / 超时断开了
+                    self.close_connection = True
+
+            def _send_json(self, status: int, obj: Dict[str, Any]):
+                body = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _send_stream(self, content: str, usage: Dict[str, int]):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+
+                def event(obj):
+                    data = ("data: " + json.dumps(obj, ensure_ascii=False) + "\n\n").encode("utf-8")
+                    self.wfile.write(b"%x\r\n" % len(data) + data + b"\r\n")
+                    self.wfile.flush()
+
+                step = server.chunk_chars
+                for i in range(0, len(content), step):
+                    if i:
+                        time.sleep(server.chunk_ms / 1000.0)
+                    event({"choices": [{"delta": {"content": content[i:i + step]}}]})
+                event({"choices": [], "usage": usage})
+                done = b"data: [DONE]\n\n"
+                self.wfile.write(b"%x\r\n" % len(done) + done + b"\r\n0\r\n\r\n")
+                self.wfile.flush()
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    # === 启停 ===
+    def start(self) -> "MockLLMServer":
+        self._server = http.server.ThreadingHTTPServer((self.host, self.port), self._make_handler())
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        threading.Thread(target=self._server.serve_forever, name="mock-llm-server", daemon=True).start()
+        return self
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}/v1/chat/completions"
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+def parse_latency_args(specs: List[str]) -> Dict[str, LatencyModel]:
+    """把命令行的 ["trigger_=lognormal:400,0.4", "fixed:300"] 转成 {role前缀: LatencyModel}。"""
+    result: Dict[str, LatencyModel] = {}
+    for spec in specs or []:
+        key, sep, model = spec.partition("=")
+        if not sep:
+            key, model = "default", spec
+        result[key.strip()] = LatencyModel.parse(model.strip())
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地假的 chat-completions 服务（基准测试用）")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", action="append", default=[],
+                        help="延迟分布，可多次指定：[role或前缀=]fixed:200 / uniform:a,b / normal:mu,sd / lognormal:median,sigma")
+    parser.add_argument("--chunk-ms", type=float, default=30.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    # 不依赖客户端注册：直接从 LLMClient 里拿各 role 的 system prompt
+    from llm.client import LLMClient
+
+    server = MockLLMServer(
+        latency=parse_latency_args(args.latency) or None,
+        chunk_ms=args.chunk_ms,
+        seed=args.seed,
+        port=args.port,
+    )
+    server.register_prompts(LLMClient().role_prompts)
+    server.start()
+    print(f"[MockLLM] 已启动: {server.url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
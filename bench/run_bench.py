@@ -0,0 +1,272 @@
+import argparse
+import json
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from bench.mock_llm_server import LatencyModel, MockLLMServer, parse_latency_args
+from core.orchestrator import ConversationOrchestrator
+
+# 用户台词素材：脚本里的用户发言从这里按种子随机挑
+USER_LINES = (
+    "你好呀",
+    "最近工作压力很大，不知道怎么办",
+    "今天加班到很晚，有点累",
+    "我其实挺想换个工作的，但是又怕",
+    "你觉得我是不是太敏感了",
+    "说说看，你怎么理解我现在的状态",
+    "算了，不想聊工作了",
+    "晚上吃什么好呢",
+    "有点睡不着",
+    "我想把这周的事情理一理",
+    "帮我想一个周末计划",
+    "嗯，你说得有道理",
+)
+
+# 每一步：(种类, 参数)；种类为 user / tick / time_jump / regen
+Step = Tuple[str, Optional[str]]
+
+STEP_WEIGHTS = (("user", 0.55), ("tick", 0.25), ("time_jump", 0.1), ("regen", 0.1))
+
+
+def build_script(turns: int, seed: int = 0) -> List[Step]:
+    """按权重随机生成一段对话脚本（同一个种子结果固定），第一步总是用户发言。"""
+    rng = random.Random(seed)
+    script: List[Step] = [("user", rng.choice(USER_LINES))]
+    while len(script) < turns:
+        r = rng.random()
+        acc = 0.0
+        kind = "user"
+        for k, w in STEP_WEIGHTS:
+            acc += w
+            if r < acc:
+                kind = k
+                break
+        arg = rng.choice(USER_LINES) if kind in ("user", "regen") else None
+        script.append((kind, arg))
+    return script
+
+
+def percentile(values: List[float], p: float) -> float:
+    """最近秩法分位数；空列表返回 0。"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = max(0, min(len(ordered) - 1, int(round(p / 100.0 * len(ordered) + 0.5)) - 1))
+    return round(ordered[k], 1)
+
+
+def _llm_counts(orch: ConversationOrchestrator) -> Tuple[int, int]:
+    """(call_llm 调用次数, 实际网络请求次数)，缓存命中 / 去重只算前者。"""
+    roles = orch.llm_client.telemetry.summary()["roles"]
+    return (
+        sum(st["calls"] for st in roles.values()),
+        sum(st["attempts"] for st in roles.values()),
+    )
+
+
+def _force_regen(server: MockLLMServer):
+    """让下一次用户发言走 T 引擎，并且观点树触发器判定 need_new_tree。"""
+    server.push_override("trigger_should_speak", json.dumps({"should_reply": True}))
+    server.push_override("trigger_select_engine", json.dumps({"mode": "T"}))
+    server.push_override("trigger_decide_turn", json.dumps({"should_reply": True, "mode": "T", "reason": "bench"}))
+    server.push_override("trigger_perspective_move", json.dumps({
+        "move": False, "next_node_id": None, "need_new_tree": True, "reason": "bench",
+    }))
+
+
+def run_session(
+    server: MockLLMServer,
+    script: List[Step],
+    decision_mode: str = "split",
+    stream: bool = True,
+    base_dir: Optional[str] = None,
+    hedge: bool = False,
+    speculate: bool = False,
+) -> Dict[str, Any]:
+    """
+    用一个独立的 orchestrator（数据目录在临时目录里）同步跑完整段脚本，
+    每一步记录 耗时 / call_llm 次数 / 网络请求次数。
+    """
+    own_dir = base_dir is None
+    base_dir = base_dir or tempfile.mkdtemp(prefix="zaio-bench-")
+    orch = ConversationOrchestrator(
+        ui_callback=lambda text: None,
+        trigger_interval=10 ** 6,   # 不靠定时器，tick 由脚本显式触发
+        decision_mode=decision_mode,
+        base_dir=base_dir,
+        hedge_triggers=hedge,
+    )
+    orch.llm_client.base_url = server.url
+    orch.llm_client.api_key = None   # 不把真实 key 发给本地假服务
+    orch.speculate_persona = speculate
+    server.register_prompts(orch.llm_client.role_prompts)
+    if stream:
+        orch.register_stream_callbacks(lambda text: None, lambda text: None)
+
+    steps: List[Dict[str, Any]] = []
+    started = time.perf_counter()
+    try:
+        for kind, arg in script:
+            if kind == "regen":
+                _force_regen(server)
+                event, event_arg = "user_message", arg
+            elif kind == "user":
+                event, event_arg = "user_message", arg
+            else:
+                event, event_arg = kind, None
+
+            calls0, net0 = _llm_counts(orch)
+            t0 = time.perf_counter()
+            try:
+                orch.process_event(event, event_arg)
+                error = None
+            except Exception as e:
+                error = repr(e)
+            ms = (time.perf_counter() - t0) * 1000
+            calls1, net1 = _llm_counts(orch)
+            if kind == "regen":
+                server.clear_overrides()
+            steps.append({
+                "kind": kind,
+                "ms": round(ms, 1),
+                "llm_calls": calls1 - calls0,
+                "net_requests": net1 - net0,
+                "error": error,
+            })
+        wall = time.perf_counter() - started
+        telemetry = orch.llm_client.telemetry.summary()
+        planner = dict(orch.turn_planner.stats)
+        hedging = orch.llm_client.hedge_policy.summary() if hedge else None
+        speculation = orch.speculation_stats.summary() if speculate else None
+        cache = orch.llm_client.cache_stats()
+        backend = orch.llm_client.backend_status()
+    finally:
+        orch.stop()
+        if own_dir:
+            shutil.rmtree(base_dir, ignore_errors=True)
+
+    return {"steps": steps, "wall_s": wall, "telemetry": telemetry, "planner": planner, "hedging": hedging,
+            "speculation": speculation, "cache": cache,
+            "backend": backend}
+
+
+def summarize(sessions: List[Dict[str, Any]], wall_s: float) -> Dict[str, Any]:
+    steps = [s for sess in sessions for s in sess["steps"]]
+    by_kind: Dict[str, List[Dict[str, Any]]] = {"all": steps}
+    for s in steps:
+        by_kind.setdefault(s["kind"], []).append(s)
+
+    kinds = {}
+    for kind, items in by_kind.items():
+        ms = [s["ms"] for s in items]
+        kinds[kind] = {
+            "turns": len(items),
+            "p50_ms": percentile(ms, 50),
+            "p90_ms": percentile(ms, 90),
+            "p99_ms": percentile(ms, 99),
+            "max_ms": round(max(ms), 1) if ms else 0.0,
+            "calls_per_turn": round(sum(s["llm_calls"] for s in items) / len(items), 2) if items else 0.0,
+            "requests_per_turn": round(sum(s["net_requests"] for s in items) / len(items), 2) if items else 0.0,
+            "errors": sum(1 for s in items if s["error"]),
+        }
+
+    total_requests = sum(s["net_requests"] for s in steps)
+    return {
+        "sessions": len(sessions),
+        "wall_s": round(wall_s, 2),
+        "turns_per_s": round(len(steps) / wall_s, 2) if wall_s > 0 else 0.0,
+        "requests_per_s": round(total_requests / wall_s, 2) if wall_s > 0 else 0.0,
+        "kinds": kinds,
+    }
+
+
+def format_report(summary: Dict[str, Any]) -> str:
+    lines = [
+        f"sessions={summary['sessions']}  wall={summary['wall_s']}s  "
+        f"throughput={summary['turns_per_s']} turns/s, {summary['requests_per_s']} requests/s",
+        f"{'kind':<12}{'turns':>7}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'max ms':>10}"
+        f"{'calls/turn':>12}{'reqs/turn':>11}{'err':>5}",
+    ]
+    order = ["all", "user", "tick", "time_jump", "regen"]
+    for kind in order + sorted(k for k in summary["kinds"] if k not in order):
+        st = summary["kinds"].get(kind)
+        if not st:
+            continue
+        lines.append(
+            f"{kind:<12}{st['turns']:>7}{st['p50_ms']:>10}{st['p90_ms']:>10}{st['p99_ms']:>10}"
+            f"{st['max_ms']:>10}{st['calls_per_turn']:>12}{st['requests_per_turn']:>11}{st['errors']:>5}"
+        )
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="在哦 · 离线基准测试（本地假 LLM 服务，不花 API 额度）")
+    parser.add_argument("--turns", type=int, default=40, help="每个会话的脚本步数")
+    parser.add_argument("--sessions", type=int, default=1, help="并行会话数（各自独立的 orchestrator）")
+    parser.add_argument("--mode", choices=("split", "fused"), default="split", help="决策方式")
+    parser.add_argument("--no-stream", action="store_true", help="人格不走流式接口")
+    parser.add_argument("--hedge", action="store_true", help="对是否说话 / 引擎选择开启对冲请求")
+    parser.add_argument("--speculate", action="store_true", help="开启投机人格（引擎选择时按本地预测提前生成回复）")
+    parser.add_argument("--latency", action="append", default=[],
+                        help="延迟分布，可多次指定：[role或前缀=]fixed:200 / uniform:a,b / normal:mu,sd / lognormal:median,sigma")
+    parser.add_argument("--chunk-ms", type=float, default=30.0, help="流式回复的块间隔")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", dest="json_path", default=None, help="把汇总和每步明细写到这个 JSON 文件")
+    args = parser.parse_args()
+
+    # 默认分布大致参照线上：触发器小 JSON 几百毫秒，人格约 1 秒，生成观点树要好几秒
+    latency = parse_latency_args(args.latency) or {
+        "trigger_": LatencyModel.parse("lognormal:400,0.35"),
+        "persona_": LatencyModel.parse("lognormal:900,0.4"),
+        "perspective_generate_engine": LatencyModel.parse("lognormal:2500,0.3"),
+        "default": LatencyModel.parse("fixed:300"),
+    }
+    server = MockLLMServer(latency=latency, chunk_ms=args.chunk_ms, seed=args.seed).start()
+    print(f"[Bench] 假 LLM 服务: {server.url}")
+    print("[Bench] 延迟分布: " + ", ".join(f"{k}={v!r}" for k, v in latency.items()))
+
+    results: List[Optional[Dict[str, Any]]] = [None] * max(1, args.sessions)
+
+    def _run(i: int):
+        script = build_script(args.turns, seed=args.seed + i)
+        results[i] = run_session(server, script, decision_mode=args.mode, stream=not args.no_stream, hedge=args.hedge,
+                                 speculate=args.speculate)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=_run, args=(i,), daemon=True) for i in range(len(results))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - started
+    server.stop()
+
+    sessions = [r for r in results if r is not None]
+    summary = summarize(sessions, wall)
+    print()
+    print(format_report(summary))
+    if args.hedge:
+        for i, sess in enumerate(sessions):
+            print(f"[Bench] 会话 {i} 对冲统计: {sess['hedging']}")
+    if args.speculate:
+        for i, sess in enumerate(sessions):
+            print(f"[Bench] 会话 {i} 投机人格: {sess['speculation']}")
+    for i, sess in enumerate(sessions):
+        cache = {k: v for k, v in sess["cache"].items() if k != "roles"}
+        print(f"[Bench] 会话 {i} 回复缓存: {cache}")
+        print(f"[Bench] 会话 {i} 熔断器: {sess['backend']}")
+
+    if args.json_path:
+        os.makedirs(os.path.dirname(os.path.abspath(args.json_path)), exist_ok=True)
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "summary": summary, "sessions": sessions}, f, ensure_ascii=False, indent=2)
+        print(f"[Bench] 明细已写入 {args.json_path}")
+
+
+if __name__ == "__main__":
+    main()
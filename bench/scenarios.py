@@ -0,0 +1,173 @@
+import argparse
+import json
+import shutil
+import tempfile
+import time
+import traceback
+from typing import Callable, Dict, List
+
+from bench.mock_llm_server import LatencyModel, MockLLMServer
+from core.orchestrator import ConversationOrchestrator
+from llm.client import LLMClient
+from llm.retry_policy import RetryPolicy
+
+# 场景注册表：名字 → 函数；函数里用 assert 检查，失败直接抛 AssertionError
+SCENARIOS: Dict[str, Callable[[str], None]] = {}
+
+
+def scenario(fn: Callable[[str], None]) -> Callable[[str], None]:
+    SCENARIOS[fn.__name__] = fn
+    return fn
+
+
+def _client(server: MockLLMServer, base_dir: str, **kwargs) -> LLMClient:
+    """指向本地假服务的 LLMClient：不带 key、不缓存，日志写在临时目录里。"""
+    kwargs.setdefault("cache_roles", {})
+    client = LLMClient(prompt_log_dir=base_dir, **kwargs)
+    client.base_url = server.url
+    client.api_key = None
+    server.register_prompts(client.role_prompts)
+    return client
+
+
+def _orchestrator(server: MockLLMServer, base_dir: str) -> ConversationOrchestrator:
+    """数据目录在临时目录里、不开定时 tick 的 orchestrator（同 run_bench）。"""
+    orch = ConversationOrchestrator(
+        ui_callback=lambda text: None,
+        trigger_interval=10 ** 6,
+        base_dir=base_dir,
+    )
+    orch.llm_client.base_url = server.url
+    orch.llm_client.api_key = None
+    server.register_prompts(orch.llm_client.role_prompts)
+    return orch
+
+
+def _wait_for(cond: Callable[[], bool], timeout: float = 5.0):
+    deadline = time.time() + timeout
+    while not cond():
+        assert time.time() < deadline, "等待超时"
+        time.sleep(0.02)
+
+
+# === 场景 ===
+@scenario
+def attempt_capped_by_deadline(base_dir: str):
+    """单次尝试卡住超过 role 时限时，按时限返回，而不是把连接池的 60 秒超时等满。"""
+    server = MockLLMServer(latency={"trigger_should_speak": LatencyModel.parse("fixed:5000")}).start()
+    client = _client(server, base_dir, retry_policy=RetryPolicy(role_deadlines={"trigger_should_speak": 1.0}))
+    try:
+        t0 = time.perf_counter()
+        reply = client.call_llm("trigger_should_speak", {"recent_lines": []}, temperature=0.1)
+        elapsed = time.perf_counter() - t0
+        assert reply == "", reply
+        assert elapsed < 2.0, f"等了 {elapsed:.2f}s，时限是 1s"
+        assert client.telemetry.summary()["roles"]["trigger_should_speak"]["attempts"] == 1
+    finally:
+        client.close()
+        server.stop()
+
+
+@scenario
+def stop_cancels_tree_generation(base_dir: str):
+    """后台观点树维护正在生成新树时 stop()：掐断请求立刻返回，不等生成跑完。"""
+    server = MockLLMServer(latency={"perspective_generate_engine": LatencyModel.parse("fixed:5000")}).start()
+    orch = _orchestrator(server, base_dir)
+    try:
+        server.push_override("trigger_perspective_move", json.dumps({
+            "move": False, "next_node_id": None, "need_new_tree": True, "reason": "scenario",
+        }))
+        # 跳过本地预测，固定走观点树触发器（LLM）
+        orch.move_predictor.decide = lambda node, tree, text, fallback: (fallback(), {"drift": 0.0, "source": "llm"})
+        tree = orch.perspective_tree.get_raw_tree()
+        orch._schedule_tree_maintenance(
+            "换个完全不同的话题聊聊", "", {}, [], tree, orch.perspective_tree.version
+        )
+        _wait_for(lambda: server.stats.get("perspective_generate_engine", 0) >= 1)
+    finally:
+        t0 = time.perf_counter()
+        orch.stop()
+        elapsed = time.perf_counter() - t0
+        server.stop()
+    assert elapsed < 1.0, f"stop() 等了 {elapsed:.2f}s"
+
+
+@scenario
+def on_demand_generate_preempts_refill(base_dir: str):
+    """预生成正占着生成名额时要现场生成：预生成被取消，现场生成不用排在它后面。"""
+    server = MockLLMServer(latency={"perspective_generate_engine": LatencyModel.parse("fixed:2000")}).start()
+    orch = _orchestrator(server, base_dir)
+    pool = orch.perspective_tree_pool
+    try:
+        pool.refill({}, [{"who": "user", "text": "最近工作压力很大"}])
+        _wait_for(lambda: server.stats.get("perspective_generate_engine", 0) >= 1)
+
+        server.push_override("trigger_perspective_move", json.dumps({
+            "move": False, "next_node_id": None, "need_new_tree": True, "reason": "scenario",
+        }))
+        orch.move_predictor.decide = lambda node, tree, text, fallback: (fallback(), {"drift": 0.0, "source": "llm"})
+        t0 = time.perf_counter()
+        orch._schedule_tree_maintenance(
+            "换个完全不同的话题聊聊", "", {}, [], orch.perspective_tree.get_raw_tree(), orch.perspective_tree.version
+        )
+        orch._tree_job.result()
+        elapsed = time.perf_counter() - t0
+        assert pool.summary()["cancelled"] == 1, pool.summary()
+        # 现场生成 2s；要是排在预生成后面，得再多等它剩下的将近 2s
+        assert elapsed < 3.0, f"现场生成等了 {elapsed:.2f}s"
+    finally:
+        orch.stop()
+        server.stop()
+
+
+@scenario
+def pool_close_does_not_wait(base_dir: str):
+    """预生成正在跑时关闭观点树池：立刻返回，生成结果丢弃。"""
+    server = MockLLMServer(latency={"perspective_generate_engine": LatencyModel.parse("fixed:5000")}).start()
+    orch = _orchestrator(server, base_dir)
+    pool = orch.perspective_tree_pool
+    try:
+        pool.refill({}, [{"who": "user", "text": "最近工作压力很大"}])
+        _wait_for(lambda: server.stats.get("perspective_generate_engine", 0) >= 1)
+        t0 = time.perf_counter()
+        pool.close()
+        elapsed = time.perf_counter() - t0
+        assert elapsed < 1.0, f"close() 等了 {elapsed:.2f}s"
+        _wait_for(lambda: not pool.summary()["pending"])
+        summary = pool.summary()
+        assert summary["size"] == 0 and summary["generated"] == 0, summary
+    finally:
+        orch.stop()
+        server.stop()
+
+
+def run(names: List[str]) -> int:
+    """依次跑指定场景（为空就全跑），返回失败个数。"""
+    failed = 0
+    for name in names or list(SCENARIOS):
+        base_dir = tempfile.mkdtemp(prefix="zaio-scenario-")
+        t0 = time.perf_counter()
+        try:
+            SCENARIOS[name](base_dir)
+            print(f"[Scenario] {name}: ok ({time.perf_counter() - t0:.2f}s)")
+        except Exception:
+            failed += 1
+            print(f"[Scenario] {name}: FAILED")
+            traceback.print_exc()
+        finally:
+            shutil.rmtree(base_dir, ignore_errors=True)
+    return failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="在哦 · 回归场景（本地假 LLM 服务，检查超时 / 取消等边界行为）")
+    parser.add_argument("names", nargs="*", help="只跑这些场景，默认全跑：" + " / ".join(SCENARIOS))
+    args = parser.parse_args()
+    unknown = [n for n in args.names if n not in SCENARIOS]
+    if unknown:
+        parser.error(f"没有这些场景: {unknown}")
+    raise SystemExit(1 if run(args.names) else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,24 +1,29 @@
 import os
+import queue
 import threading
 import time
-import json
 import random
 
+from concurrent.futures import ThreadPoolExecutor
 from typing import Callable, Dict, Any, List
 
 from llm.client import LLMClient
+from llm.hedging import HedgePolicy
+from llm.http_pool import CancelToken
 from state.snapshot_manager import StateSnapshotManager
 from state.user_profile import UserProfileManager
 from state.history_manager import HistoryManager
 
 from trigger.timing_engine import TimingEngine          # 只做节奏保护
 from trigger.talk_trigger import TalkTrigger            # 新·小触发器：是否说话
+from trigger.tick_gate import TickGate                  # tick 本地预筛（不走 LLM）
 from trigger.state_update_trigger import StateUpdateTrigger
 from trigger.perspective_move_trigger import PerspectiveMoveTrigger
 
 from thinking.perspective_tree import PerspectiveTree
 from thinking.guess_engine import GuessEngine
 from trigger.engine_select_trigger import EngineSelectTrigger
+from trigger.decision_trigger import DecisionTrigger
 
 from persona.fast_engine import FastEngine
 from persona.slow_engine import SlowEngine
@@ -26,7 +31,15 @@ from persona.direct_engine import DirectEngine
 from persona.deep_engine import DeepEngine   # ← 新增
 
 from .first_turn import FirstTurnEngine
+from .turn_planner import TurnPlanner
+from .tracing import Tracer, submit_in_context
+from .speculation import SPECULATABLE_MODES, ChunkRelay, Speculation, SpeculationStats, snapshot_persona_key
+from thinking.mode_predictor import ModePredictor
 from thinking.perspective_generate_engine import PerspectiveGenerateEngine
+from thinking.perspective_tree_pool import PerspectiveTreePool, context_text
+from thinking.tree_library import TreeLibrary
+from thinking.lexical_index import TopicIndex
+from thinking.perspective_move_predictor import PerspectiveMovePredictor
 
 from persona.sum_engine import SumEngine
 
@@ -40,6 +53,10 @@ class ConversationOrchestrator:
         log_dir: str = None,
         trigger_interval: int = 9,
         snapshot_path: str = None,
+        event_queue_size: int = 16,
+        decision_mode: str = "split",
+        base_dir: str = None,
+        hedge_triggers: bool = False,
     ):
         # ====== 主动说话次数上限相关 ======
         self.auto_reply_max = 3          # 上限 3 句
@@ -48,15 +65,37 @@ class ConversationOrchestrator:
         self.ui_callback = ui_callback
         self.ui_on_thinking_start = None
         self.ui_on_thinking_end = None
-        base_dir = os.path.dirname(os.path.abspath(__file__))
-        self.base_dir = os.path.dirname(base_dir)
+        # 流式气泡：on_update(已生成的全文) / on_end(最终全文)，没注册就整段发
+        self.ui_on_stream_update = None
+        self.ui_on_stream_end = None
+        self.stream_persona = True
+        # 投机人格：引擎选择还在跑时，按本地预测的模式提前生成回复（只跑 Q / L / D），
+        # 预测对了直接用，错了丢掉；置信度低于 speculate_min_confidence 不投机。
+        # 猜错的每轮都多花一次人格调用，默认关闭；打开后最近命中率低于 speculate_min_hit_rate 会自动暂停
+        self.speculate_persona = False
+        self.speculate_min_confidence = 0.4
+        self.speculate_min_hit_rate = 0.3
+        # UI 调度：后台线程不直接碰 UI，把回调交给它转回渲染线程；为空时直接调用
+        self.ui_dispatch = None
+        self.ui_dispatch_latest = None
+        # 数据根目录：默认是项目目录（data/ 都在它下面），基准测试会指到临时目录
+        self.base_dir = base_dir or os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
         self.log_dir = log_dir or os.path.join(self.base_dir, "data", "logs")
         os.makedirs(self.log_dir, exist_ok=True)
         self.trigger_interval = trigger_interval
 
         # --- 基础组件 ---
-        self.llm_client = LLMClient()
+        self.llm_client = LLMClient(
+            cache_path=os.path.join(self.base_dir, "data", "llm_response_cache.json"),
+            telemetry_path=os.path.join(self.base_dir, "data", "llm_telemetry.json"),
+            prompt_log_dir=os.path.join(self.base_dir, "data", "prompt_logs"),
+            # hedge_triggers=True 时，是否说话 / 引擎选择 慢于历史 p90 就补发一份（额外请求量 ≤ 10%）
+            hedge_policy=HedgePolicy() if hedge_triggers else None,
+        )
+        # 链路追踪：每个事件一轮（turn），各阶段 + 每次 LLM 调用一个 span，保留最近 50 轮
+        self.tracer = Tracer(max_turns=50)
+        self.llm_client.tracer = self.tracer
         self.snapshot_manager = StateSnapshotManager(
             snapshot_path or os.path.join(self.base_dir, "data", "current_state_snapshot.json")
         )
@@ -75,16 +114,44 @@ class ConversationOrchestrator:
 
         # --- 节奏保护引擎（不走 LLM，只限制连续发言次数） ---
         self.timing_engine = TimingEngine(self.snapshot_manager, max_consecutive_ai=2)
+        # tick 本地预筛：节奏 / 对话无变化 / 静默窗口，拦不下来才问 LLM
+        self.tick_gate = TickGate(self.timing_engine, self.history_manager)
 
         # --- 思考层 ---
         self.perspective_tree = PerspectiveTree()
+        # 观点树按 version 缓存序列化结果，树没变就不重复 json.dumps
+        self.llm_client.context_builder.register_source(
+            "perspective_tree",
+            lambda: self.perspective_tree.tree,
+            lambda: self.perspective_tree.version,
+        )
+        # 本地主题索引（TF-IDF）：当前树节点，最近节点 / 跑题程度不用问 LLM
+        self.topic_index = TopicIndex(self.perspective_tree)
+        # 观点树下一步的本地预测：把握大时不调 trigger_perspective_move，决策来源 / 一致率记日志
+        self.move_predictor = PerspectiveMovePredictor(
+            self.topic_index,
+            log_path=os.path.join(self.log_dir, "perspective_move_decisions.jsonl"),
+        )
         self.guess_engine = GuessEngine(self.perspective_tree)
         # Q/T/L/SUM 引擎选择器：直接走 EngineSelectTrigger
         self.engine_select_trigger = EngineSelectTrigger(self.llm_client)
+        # 合并决策：decision_mode="fused" 时，是否说话 + 引擎选择 一次调用搞定
+        self.decision_trigger = DecisionTrigger(self.llm_client)
         # --- 观点树生成引擎 ---
+        # 观点树库：目录 + 清单（最新 / 随机 / 按相关度检索，不用每次扫目录）
+        self.tree_library = TreeLibrary(
+            os.path.join(self.base_dir, "data", "perspective_trees"),
+            os.path.join(self.base_dir, "data", "perspective_tree_index.json"),
+        )
         self.perspective_generate_engine = PerspectiveGenerateEngine(
             self.llm_client,
-            self.base_dir
+            self.base_dir,
+            library=self.tree_library,
+        )
+        # 预生成观点树池：T 轮次之后在后台按最近话题备好候选树，need_new_tree 时先从池里挑
+        self.perspective_tree_pool = PerspectiveTreePool(
+            self.perspective_generate_engine,
+            tracer=self.tracer,
         )
         # --- 人格引擎 ---
         self.fast_engine = FastEngine(self.llm_client)    # Q-Engine
@@ -93,8 +160,36 @@ class ConversationOrchestrator:
         self.sum_engine = SumEngine(self.llm_client)        # SUM-Engine 总结人格（新增）
         self.deep_engine = DeepEngine(self.llm_client)      # D-Engine 深度加强人格
         
+        # 本地模式预测：最近模式序列 + 转移计数 + 原话线索，给投机人格用
+        self.mode_predictor = ModePredictor()
+        self.speculation_stats = SpeculationStats()
+
         #self._last_mode = None  # 记录上一轮采用的模式：Q/T/L/SUM/D,未来可以有一个节奏表，或者用离散引擎输出节奏，用来指导引擎选择器。也就是收集大量的人机交互引擎交换节奏，然后模拟这个节奏。反向工程。
         
+        # 并行决策：同一轮里互不依赖的 LLM 调用同时发出
+        self._executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="zaio-turn")
+        # 投机人格单独一个线程池：被丢弃但还没跑完的投机不占下一轮决策的线程
+        self._speculation_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="zaio-spec")
+        # 观点树维护（T 回复之后的移动 / 重建）：单线程后台跑，保证按顺序落地
+        self._tree_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="zaio-tree")
+        self._tree_job = None
+        # 观点树维护的 LLM 请求都带这个 token：单线程执行，同一时间最多一个请求绑在上面；
+        # stop() 时 cancel()，正在等的请求立刻断开，之后的也不再发出
+        self._tree_cancel = CancelToken()
+        self.turn_planner = TurnPlanner(
+            self._executor,
+            self.snapshot_manager,
+            self.history_manager,
+            self.timing_engine,
+            self.state_update_trigger,
+            self.talk_trigger,
+            self.engine_select_trigger,
+            self.decision_trigger,
+            decision_mode=decision_mode,
+            tick_gate=self.tick_gate,
+            tracer=self.tracer,
+        )
+
         # 第一拍开场引擎
         self.first_turn_engine = FirstTurnEngine(
             self.llm_client,
@@ -106,6 +201,25 @@ class ConversationOrchestrator:
         # 触发循环线程
         self._trigger_thread = None
         self._trigger_running = False
+        self._trigger_stop = threading.Event()
+
+        # 事件队列 + 工作线程：用户消息 / tick / 时光飞逝 都排队，按顺序在后台处理
+        self._events: "queue.Queue" = queue.Queue(maxsize=max(1, event_queue_size))
+        self._worker_thread = None
+        self._worker_running = False
+        self._tick_pending = False
+        self._queue_lock = threading.Lock()
+        self.queue_stats = {
+            "enqueued": 0,
+            "processed": 0,
+            "dropped": 0,
+            "coalesced_ticks": 0,
+            "max_depth": 0,
+            "total_wait": 0.0,
+            "max_wait": 0.0,
+        }
+        # 退出时随埋点一起写进 data/llm_telemetry.json 的 status 字段
+        self.llm_client.telemetry.register_status("event_queue", self.queue_metrics)
         # 初次启动时，先加载一棵“初见默认树”作为占位
         self.reset_perspective_tree_to_default()
         
@@ -146,59 +260,60 @@ class ConversationOrchestrator:
         """
         try:
             default_tree = self._build_default_first_meet_tree()
-            self.perspective_tree.load_tree(default_tree)
+            # 先落盘（会补 generated_at）再加载，加载的是补全后的那份
             self.perspective_generate_engine.save_tree_to_file(default_tree)
+            self.perspective_tree.load_tree(default_tree)
+            self.tree_library.mark_active(default_tree.get("tree_id"))
             print("[Orchestrator] 观点树已重置为默认初见树")
         except Exception as e:
             print("[Orchestrator] 重置默认观点树失败:", e)
             
-    def _load_random_history_tree(self) -> bool:
+    def _load_random_history_tree(self, context: str = "") -> bool:
         """
-        从 data/perspective_trees 目录里随机挑一棵【非默认】观点树，
-        并加载到当前的 PerspectiveTree 中。
+        从观点树库里挑一棵【非默认】历史树，并加载到当前的 PerspectiveTree 中：
+        有上下文时在最相关的几棵里随机挑，一棵都不相关再完全随机。
 
         返回：
         - True  : 成功加载了一棵历史树
         - False : 没有可用的历史树（或者出错）
         """
-        trees_dir = os.path.join(self.base_dir, "data", "perspective_trees")
-        if not os.path.isdir(trees_dir):
-            print("[Orchestrator] 没找到观点树目录:", trees_dir)
-            return False
-
-        files = [f for f in os.listdir(trees_dir) if f.endswith(".json")]
-        if not files:
-            print("[Orchestrator] 观点树目录为空")
+        current_id = self.perspective_tree.tree.get("tree_id")
+        tree = None
+        top = self.tree_library.top_k(context, k=3, exclude_ids=(current_id,), min_score=0.05)
+        if top:
+            tree = self.tree_library.load(random.choice(top)[1])
+        if tree is None:
+            tree = self.tree_library.random_tree()
+        if tree is None:
+            print("[Orchestrator] 没有找到非默认观点树，全部是默认")
             return False
 
-        candidates = []
-        for fname in files:
-            lower = fname.lower()
-            # 排除默认树（包含 default / 默认 的文件名）
-            if "default" in lower or "默认" in fname:
-                continue
-            candidates.append(os.path.join(trees_dir, fname))
-
-        if not candidates:
-            print("[Orchestrator] 没有找到非默认观点树 json，全部是默认")
-            return False
-
-        path = random.choice(candidates)
         try:
-            with open(path, "r", encoding="utf-8") as f:
-                tree = json.load(f)
-
-            # 没有 tree_id 的话，用文件名兜底
-            tree.setdefault("tree_id", os.path.splitext(os.path.basename(path))[0])
-
             # 直接加载到当前观点树
             self.perspective_tree.load_tree(tree)
-            print(f"[Orchestrator] 已加载历史观点树: {os.path.basename(path)}")
+            self.tree_library.mark_active(tree["tree_id"])
+            self.tree_library.mark_used(tree["tree_id"])
+            print(f"[Orchestrator] 已加载历史观点树: {tree['tree_id']}")
             return True
         except Exception as e:
-            print("[Orchestrator] 加载历史观点树失败:", path, e)
+            print("[Orchestrator] 加载历史观点树失败:", tree.get("tree_id"), e)
             return False
-            
+
+    def _reuse_library_tree(self, user_text: str, snapshot, talk_his, min_score: float = 0.25):
+        """need_new_tree 时先看树库里有没有和当前上下文足够相关的旧树，有就直接复用。"""
+        current_id = self.perspective_tree.tree.get("tree_id")
+        top = self.tree_library.top_k(
+            context_text(user_text, snapshot, talk_his), k=1, exclude_ids=(current_id,), min_score=min_score
+        )
+        if not top:
+            return None
+        score, tree_id = top[0]
+        tree = self.tree_library.load(tree_id)
+        if tree:
+            self.tree_library.mark_used(tree_id)
+            print(f"[Orchestrator] 复用历史观点树 {tree_id}（相关度 {score:.2f}）")
+        return tree
+
     def handle_time_jump(self):
         """
         【时光飞逝一下】按钮逻辑：
@@ -222,55 +337,95 @@ class ConversationOrchestrator:
 
         # 3）决定本轮用什么人格
         use_T = (random.random() < 0.5)
-        if use_T and self._load_random_history_tree():
+        loaded = False
+        if use_T:
+            with self._span("load_history_tree"):
+                loaded = self._load_random_history_tree(
+                    context_text("", snapshot, self.history_manager.get_talk_his(limit=10))
+                )
+        if loaded:
             # 成功加载了历史树 → 强制走 T 模式
             mode = "T"
             print("[Orchestrator] 本次时光飞逝：采用 T 引擎 + 历史观点树")
         else:
             # 否则走原本的自动选择逻辑
-            mode = self.engine_select_trigger.select(
-                user_text=user_text,
-                snapshot=snapshot,
-                history=history,
-                user_triggered=False,
-            )
+            with self._span("select"):
+                mode = self.engine_select_trigger.select(
+                    user_text=user_text,
+                    snapshot=snapshot,
+                    history=history,
+                    user_triggered=False,
+                )
             print(f"[Orchestrator] 本次时光飞逝：采用默认引擎选择模式 → {mode}")
 
         # 4）执行人格行为并发送到 UI
-        reply = self._run_behavior(mode, user_text)
-        self._send_ai_message(reply)
+        self._speak(mode, user_text)
 
     # === 启动 ===
     def start(self):
-        """启动 orchestrator：目前主要是启动 tick 触发循环。"""
-        if not self._trigger_thread:
-            self._trigger_running = True
-            self._trigger_thread = threading.Thread(target=self._trigger_loop, daemon=True)
-            self._trigger_thread.start()
+        """启动 orchestrator：启动事件工作线程 + tick 触发循环。"""
+        self.start_trigger_loop()
 
         # 打第一拍
         self._send_first_message()
 
     # === 停止 ===
     def stop(self):
-        self._trigger_running = False
-        
+        self.stop_trigger_loop()
+        # 并行拉取的任务不再等待，没开始的直接取消
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        # 投机人格的结果已经没人要了，同样不等
+        self._speculation_executor.shutdown(wait=False, cancel_futures=True)
+        # 观点树维护同样不等：排着的取消，正在跑的掐断它的 LLM 请求（生成新树最长要等 150s）
+        self._tree_executor.shutdown(wait=False, cancel_futures=True)
+        self._tree_cancel.cancel()
+        self.perspective_tree_pool.close()
+        self.llm_client.close()
+
     def register_thinking_start(self, fn):
         self.ui_on_thinking_start = fn
 
     def register_thinking_end(self, fn):
         self.ui_on_thinking_end = fn
+
+    def register_stream_callbacks(self, on_update, on_end):
+        """注册流式气泡回调：on_update(已生成的全文) 随增量调用，on_end(最终全文) 收尾。"""
+        self.ui_on_stream_update = on_update
+        self.ui_on_stream_end = on_end
+
+    def register_ui_dispatch(self, post, post_latest=None):
+        """
+        注册 UI 调度函数，注册后所有 UI 回调都经由它们转回渲染线程执行：
+        - post(callback, *args)：普通排队；
+        - post_latest(key, callback, *args)：同 key 只保留最新一次（流式气泡刷新用）。
+        """
+        self.ui_dispatch = post
+        self.ui_dispatch_latest = post_latest
+
     # === UI 回调包装 ===
-    def _send_ai_message(self, text: str):
-        if not text:
+    def _call_ui(self, fn, *args, latest_key: str = None):
+        if fn is None:
             return
-        # 更新历史
-        self.history_manager.append_ai(text)
-        # UI
         try:
-            self.ui_callback(text)
+            if latest_key and self.ui_dispatch_latest is not None:
+                self.ui_dispatch_latest(latest_key, fn, *args)
+            elif self.ui_dispatch is not None:
+                self.ui_dispatch(fn, *args)
+            else:
+                fn(*args)
         except Exception:
             pass
+
+    def _send_ai_message(self, text: str, streamed: bool = False):
+        if not text:
+            return
+        # 更新历史
+        self.history_manager.append_ai(text)
+        # UI：流式气泡已经画出来了，这里只负责收尾
+        if streamed:
+            self._call_ui(self.ui_on_stream_end, text)
+        else:
+            self._call_ui(self.ui_callback, text)
         # 告诉节奏引擎：AI 说过话了
         self.timing_engine.on_ai_spoken()
 
@@ -280,7 +435,93 @@ class ConversationOrchestrator:
         text = opening.get("text") or ""
         self._send_ai_message(text)
 
-    # === 对外接口：用户输入 ===
+    # === 对外接口：事件入队（UI 线程调用，立即返回） ===
+    def submit_user_message(self, text: str) -> bool:
+        """用户消息入队。队列满时返回 False（调用方可以提示用户稍后再说）。"""
+        if not text or not text.strip():
+            return False
+        return self._enqueue("user_message", text)
+
+    def submit_time_jump(self) -> bool:
+        """【时光飞逝一下】入队。"""
+        return self._enqueue("time_jump", None)
+
+    def submit_tick(self) -> bool:
+        """tick 入队；如果已经有一个 tick 在排队，就合并掉，不重复排。"""
+        with self._queue_lock:
+            if self._tick_pending:
+                self.queue_stats["coalesced_ticks"] += 1
+                return False
+            self._tick_pending = True
+        ok = self._enqueue("tick", None)
+        if not ok:
+            with self._queue_lock:
+                self._tick_pending = False
+        return ok
+
+    def _enqueue(self, kind: str, arg) -> bool:
+        try:
+            self._events.put_nowait((kind, arg, time.time()))
+        except queue.Full:
+            with self._queue_lock:
+                self.queue_stats["dropped"] += 1
+            print(f"[Orchestrator] 事件队列已满，丢弃事件: {kind}")
+            return False
+        with self._queue_lock:
+            self.queue_stats["enqueued"] += 1
+            depth = self._events.qsize()
+            if depth > self.queue_stats["max_depth"]:
+                self.queue_stats["max_depth"] = depth
+        return True
+
+    def queue_metrics(self) -> Dict[str, Any]:
+        """事件队列的背压指标：当前深度 / 历史最大深度 / 丢弃数 / 排队等待时间。"""
+        with self._queue_lock:
+            stats = dict(self.queue_stats)
+        processed = stats["processed"]
+        stats["depth"] = self._events.qsize()
+        stats["capacity"] = self._events.maxsize
+        stats["avg_wait"] = stats["total_wait"] / processed if processed else 0.0
+        return stats
+
+    def _worker_loop(self):
+        while self._worker_running:
+            try:
+                event = self._events.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            kind, arg, enqueued_at = event
+            if kind == "stop":
+                break
+
+            waited = time.time() - enqueued_at
+            with self._queue_lock:
+                self.queue_stats["processed"] += 1
+                self.queue_stats["total_wait"] += waited
+                if waited > self.queue_stats["max_wait"]:
+                    self.queue_stats["max_wait"] = waited
+                if kind == "tick":
+                    self._tick_pending = False
+
+            try:
+                self.process_event(kind, arg, waited)
+            except Exception as e:
+                print(f"[Orchestrator] 处理事件 {kind} 出错:", e)
+
+    def process_event(self, kind: str, arg=None, waited: float = 0.0):
+        """
+        同步处理一个事件（工作线程里调用；基准测试也直接调它，一轮结束才返回）。
+        kind："user_message"（arg 为用户文本）/ "tick" / "time_jump"。
+        """
+        with self.tracer.turn(kind, queue_wait_ms=round(waited * 1000, 1)):
+            if kind == "user_message":
+                self.handle_user_message(arg)
+            elif kind == "tick":
+                self._handle_event_tick()
+            elif kind == "time_jump":
+                self.handle_time_jump()
+
+    # === 对外接口：用户输入（在工作线程里执行） ===
     def handle_user_message(self, text: str):
         user_text = text.strip()
         if not user_text:
@@ -291,140 +532,313 @@ class ConversationOrchestrator:
         # 用户开口 → 重置连续 AI 计数
         self.timing_engine.on_user_spoken()
 
-        # 用户输入 → 先更新用户状态快照
-        self._update_state_snapshot(user_text)
-
-        # 再走一轮完整决策
+        # 更新用户状态快照 + 走一轮完整决策（并行发出，见 TurnPlanner）
         self._handle_event_user_message(user_text)
 
     # === 触发循环控制 ===
     def start_trigger_loop(self):
+        if self._worker_thread is None:
+            self._worker_running = True
+            self._worker_thread = threading.Thread(target=self._worker_loop, daemon=True)
+            self._worker_thread.start()
+
         if self._trigger_thread is not None:
             return
 
         self._trigger_running = True
+        self._trigger_stop.clear()
         self._trigger_thread = threading.Thread(target=self._trigger_loop, daemon=True)
         self._trigger_thread.start()
 
     def stop_trigger_loop(self):
         self._trigger_running = False
+        self._trigger_stop.set()
         if self._trigger_thread is not None:
             self._trigger_thread.join(timeout=1.0)
+            self._trigger_thread = None
+
+        self._worker_running = False
+        if self._worker_thread is not None:
+            try:
+                self._events.put_nowait(("stop", None, time.time()))
+            except queue.Full:
+                pass
+            self._worker_thread.join(timeout=1.0)
+            self._worker_thread = None
 
     def _trigger_loop(self):
+        # tick 线程只负责按时投递事件，真正的处理在工作线程里
         while self._trigger_running:
-            time.sleep(self.trigger_interval)
-            try:
-                self._handle_event_tick()
-            except Exception as e:
-                print("[Orchestrator] trigger_loop error:", e)
+            if self._trigger_stop.wait(self.trigger_interval):
+                break
+            self.submit_tick()
 
     # === 内部辅助 ===
-    def _build_recent_lines_for_trigger(self) -> List[Dict[str, str]]:
-        """
-        给 TalkTrigger 用的 recent_lines：
-        [
-          {"time": "...", "role": "user"/"assistant", "text": "..."},
-          ...
-        ]
-        """
-        lines: List[Dict[str, str]] = []
-        for item in self.history_manager.get_recent(5):
-            lines.append(
-                {
-                    "time": item.get("time", ""),
-                    "role": item.get("role", ""),
-                    "text": item.get("text", ""),
-                }
-            )
-        return lines
-
-    def _update_state_snapshot(self, user_text: str):
-        """调用 StateUpdateTrigger 由 LLM 推断本轮需要更新的 snapshot 字段。"""
-        # 1）先拿到当前 snapshot（全字段）
-        snapshot = self.snapshot_manager.get()
-        # 2）拿最近若干轮对话历史，给 LLM 做判断依据
-        history = self.history_manager.get_recent(30)
-        # 3）让 StateUpdateTrigger 根据 user_text + history + snapshot 推断更新项
-        updates = self.state_update_trigger.infer_updates(user_text, history, snapshot)
-        # 4）有结果就批量写入 snapshot
-        if updates:
-            self.snapshot_manager.update_multi(updates)
+    def _span(self, name: str, **attrs):
+        return self.tracer.span(name, **attrs)
 
+    def set_decision_mode(self, mode: str):
+        """切换决策方式："split"（是否说话 / 引擎选择分两次调用）或 "fused"（合并一次）。"""
+        if mode in TurnPlanner.DECISION_MODES:
+            self.turn_planner.decision_mode = mode
 
     # === Tick 事件（系统主动说话） ===
     def _handle_event_tick(self):
-        recent_lines = self._build_recent_lines_for_trigger()
-
-        # 1）小触发器：是否应该继续说话？（LLM）
-        if not self.talk_trigger.should_reply(recent_lines, user_triggered=False):
-            return
-
-        # 2）节奏保护：避免 AI 连续说太多
-        if not self.timing_engine.allow_ai_speak():
+        # 1）~3）是否说话 / 节奏保护 / 选择人格：由 TurnPlanner 决定（split 或 fused）
+        with self._span("plan") as span:
+            mode = self.turn_planner.plan_tick_turn()
+            span.set(mode=mode)
+        if mode is None:
+            # 本地预筛就拦下、一次 LLM 都没调的 tick 不占追踪缓冲
+            turn = self.tracer.current_turn()
+            if turn is not None and not turn.has_span("llm:"):
+                turn.drop()
             return
 
-        # 3）选择人格（Q/T/L/SUM）——通过 EngineSelectTrigger
-        user_text = ""  # tick 场景下没有新的用户输入
-        snapshot = self.snapshot_manager.get()
-        history = self.history_manager.get_recent(limit=10)
-        mode = self.engine_select_trigger.select(
-            user_text=user_text,
-            snapshot=snapshot,
-            history=history,
-            user_triggered=False,
-        )
-        
-        
         # 4）执行人格行为
-        reply = self._run_behavior(mode, user_text)
-        self._send_ai_message(reply)
+        self._speak(mode, "")
 
     # === 用户消息事件 ===
     def _handle_event_user_message(self, user_text: str):
-        recent_lines = self._build_recent_lines_for_trigger()
+        # 0）按本地预测提前跑人格（和下面的决策并行），输出先攒着不上屏
+        speculation = self._start_speculation(user_text)
+
+        # 1）~3）状态更新 / 是否说话 / 引擎选择：由 TurnPlanner 并行发出并汇合
+        #    返回 None 表示这一轮不说话（小触发器否决或节奏保护）
+        with self._span("plan") as span:
+            mode = self.turn_planner.plan_user_turn(user_text)
+            span.set(mode=mode)
+        if mode is None:
+            self._drop_speculation(speculation, "silenced")
+            return
+
+        # 4）执行人格行为
+        self._speak(mode, user_text, speculation=speculation)
+
+    # === 投机人格 ===
+    def _start_speculation(self, user_text: str):
+        if not self.speculate_persona:
+            return None
+        mode, confidence = self.mode_predictor.predict(user_text)
+        self.speculation_stats.bump("predicted")
+        if mode not in SPECULATABLE_MODES or confidence < self.speculate_min_confidence:
+            return None
+        if self.speculation_stats.should_pause(self.speculate_min_hit_rate):
+            return None
+
+        # 用当前（旧）snapshot 跑；状态更新改了其中任何字段的值就不采用
+        user_state = self.snapshot_manager.get()
+        streaming = self.stream_persona and self.ui_on_stream_update and self.ui_on_stream_end
+        relay = ChunkRelay()
+        future = submit_in_context(
+            self._speculation_executor,
+            self._run_speculative,
+            mode,
+            confidence,
+            user_text,
+            user_state,
+            relay.push if streaming else None,
+        )
+        self.speculation_stats.bump("started")
+        return Speculation(mode, confidence, snapshot_persona_key(user_state), future, relay)
+
+    def _run_speculative(self, mode: str, confidence: float, user_text: str, user_state, on_chunk) -> str:
+        with self._span("speculate", mode=mode, confidence=confidence):
+            return self._run_behavior(mode, user_text, on_chunk=on_chunk, user_state=user_state)
+
+    def _drop_speculation(self, speculation, reason: str):
+        if speculation is None:
+            return
+        # 已经发出的请求不强行掐断（结果会进缓存 / 埋点），只是输出不再上屏
+        speculation.relay.discard()
+        self.speculation_stats.bump(reason)
+
+    def _take_speculation(self, speculation, mode: str):
+        """决策出来后判断投机结果能不能用：能用返回它，不能用丢掉并返回 None。"""
+        if speculation is None:
+            return None
+        if speculation.mode != mode:
+            self._drop_speculation(speculation, "wrong_mode")
+            return None
+        if snapshot_persona_key(self.snapshot_manager.get()) != speculation.snapshot_key:
+            self._drop_speculation(speculation, "snapshot_changed")
+            return None
+        self.speculation_stats.bump("committed")
+        return speculation
+
+    # === 说话：执行人格 + 送到 UI ===
+    def _speak(self, mode: str, user_text: str, speculation=None):
+        """
+        执行人格并把回复送到 UI。
+        注册了流式回调时，边生成边更新同一个气泡；否则整段生成完再发。
+        speculation 是提前跑的人格，模式和 snapshot 的字段值都对得上才直接用。
+        """
+        mode = (mode or "Q").upper()
+        self.mode_predictor.observe(mode)
+        with self._span("speak", mode=mode) as span:
+            speculation = self._take_speculation(speculation, mode)
+            span.set(speculative=speculation is not None)
+            self._speak_inner(mode, user_text, speculation)
+
+    def _speak_inner(self, mode: str, user_text: str, speculation=None):
+        if not (self.stream_persona and self.ui_on_stream_update and self.ui_on_stream_end):
+            if speculation is not None:
+                reply = speculation.future.result()
+            else:
+                reply = self._run_behavior(mode, user_text)
+            self._send_ai_message(reply)
+            return
+
+        parts: List[str] = []
 
-        # 1）小触发器：是否应该继续说话？（LLM）
-        if not self.talk_trigger.should_reply(recent_lines, user_triggered=True):
+        def on_chunk(delta: str):
+            parts.append(delta)
+            self._call_ui(self.ui_on_stream_update, "".join(parts), latest_key="stream_bubble")
+
+        if speculation is not None:
+            # 先补发已经攒下的增量，后面的直接转发到气泡
+            speculation.relay.attach(on_chunk)
+            reply = speculation.future.result()
+        else:
+            reply = self._run_behavior(mode, user_text, on_chunk=on_chunk)
+        if not parts:
+            # 一个字都没流出来（失败走了兜底文案），按普通消息发
+            self._send_ai_message(reply)
             return
+        self._send_ai_message(reply or "".join(parts), streamed=True)
+
+    # === 观点树维护（T 回复之后，后台执行） ===
+    def _schedule_tree_maintenance(self, user_text, ai_text, snapshot, talk_his, full_tree, tree_version: int):
+        try:
+            self._tree_job = self._tree_executor.submit(
+                self._maintain_tree, user_text, ai_text, snapshot, talk_his, full_tree, tree_version
+            )
+        except RuntimeError:
+            # 已经 stop()
+            self._tree_job = None
 
-        # 2）节奏保护：避免 AI 一直说个没完
-        if not self.timing_engine.allow_ai_speak():
+    def _wait_tree_maintenance(self):
+        job = self._tree_job
+        if job is None or job.done():
             return
+        with self._span("tree_wait"):
+            try:
+                job.result()
+            except Exception as e:
+                print("[Orchestrator] 观点树后台维护异常:", e)
 
-        # 3）选择人格（Q/T/L/SUM）——通过 EngineSelectTrigger
-        snapshot = self.snapshot_manager.get()
-        history = self.history_manager.get_recent(limit=10)
-        mode = self.engine_select_trigger.select(
-            user_text=user_text,
-            snapshot=snapshot,
-            history=history,
-            user_triggered=True,
-        )
-        
-        # 4）执行人格行为
-        reply = self._run_behavior(mode, user_text)
-        self._send_ai_message(reply)
+    def _maintain_tree(self, user_text, ai_text, snapshot, talk_his, full_tree, tree_version: int):
+        """
+        让观点树触发器判断下一步（移动 / 重建），再按 version 落地：
+        这期间树被换过（时光飞逝 / 回到初见）就丢弃结果。自成一轮追踪。
+        """
+        cancel = self._tree_cancel
+        with self.tracer.turn("tree_maintenance", tree_version=tree_version):
+            current_node = self.perspective_tree.get_current_node()
+
+            # 1）判断下一步动作：本地预测有把握就直接用，否则让观点树触发器（LLM）决定
+            with self._span("perspective_move") as span:
+                move_info, decision = self.move_predictor.decide(
+                    current_node,
+                    full_tree,
+                    user_text,
+                    fallback=lambda: self.perspective_move_trigger.decide_move(
+                        current_node=current_node,
+                        user_text=user_text,
+                        ai_text=ai_text,
+                        snapshot=snapshot,
+                        talk_history=talk_his,
+                        full_tree=full_tree,
+                        cancel=cancel,
+                    ),
+                )
+                span.set(
+                    need_new_tree=bool(move_info and move_info.get("need_new_tree")),
+                    topic_drift=decision["drift"],
+                    source=decision["source"],
+                )
+            if not move_info:
+                self.perspective_tree_pool.refill(snapshot, talk_his)
+                return
+
+            # 2）如果 LLM 判断“这棵树方向不对，需要重建”：先从预生成池里挑一棵相关的，
+            #    再看树库里有没有足够相关的旧树，都没有才用本轮对话现场生成
+            if move_info.get("need_new_tree"):
+                try:
+                    with self._span("tree_pool_take") as span:
+                        new_tree = self.perspective_tree_pool.take(user_text, snapshot, talk_his)
+                        span.set(hit=bool(new_tree))
+                    from_pool = bool(new_tree)
+                    if not new_tree:
+                        with self._span("tree_library_reuse") as span:
+                            new_tree = self._reuse_library_tree(user_text, snapshot, talk_his)
+                            span.set(hit=bool(new_tree))
+                    if not new_tree:
+                        # 预生成占着 perspective_generate_engine 的唯一名额：先掐掉，现场生成优先
+                        self.perspective_tree_pool.cancel_pending()
+                        with self._span("perspective_generate"):
+                            new_tree = self.perspective_generate_engine.generate_tree(
+                                user_text=user_text,
+                                snapshot=snapshot,
+                                talk_history=talk_his,
+                                cancel=cancel,
+                            )
+                    # 池里被拿走一棵（或刚换了话题），后台再补
+                    self.perspective_tree_pool.refill(snapshot, talk_his)
+                    if not new_tree:
+                        return
+                    if self.perspective_tree.load_tree_if_version(new_tree, tree_version):
+                        if from_pool:
+                            # 池里的候选树只在内存里，真正用上了才落盘进树库
+                            self.perspective_generate_engine.save_generated_tree(new_tree)
+                        self.tree_library.mark_active(new_tree.get("tree_id"))
+                        print("[Orchestrator] 观点树已根据 need_new_tree 生成并加载新树")
+                    else:
+                        print("[Orchestrator] 生成新树期间观点树已被替换，丢弃这次结果")
+                except Exception as e:
+                    print("[Orchestrator] generate_tree error:", e)
+                return
+
+            # 3）否则按原逻辑，只做节点移动
+            try:
+                if not self.perspective_tree.apply_move_if_version(move_info, tree_version):
+                    print("[Orchestrator] 观点树已被替换，丢弃这次节点移动")
+            except Exception as e:
+                print("[Orchestrator] apply_move error:", e)
+
+            # 4）顺手在后台补一棵候选树，下次要换树时直接用
+            self.perspective_tree_pool.refill(snapshot, talk_his)
 
     # === 行为执行：Q / T / L 等===
-    def _run_behavior(self, mode: str, user_text: str) -> str:
+    def _run_behavior(self, mode: str, user_text: str, on_chunk=None, user_state=None) -> str:
         """
         根据引擎选择器给出的 mode，调用对应人格引擎：
         - Q  : 快人格（收集信息）
         - T  : 慢人格（观点树 + 深度讨论）
         - SUM: 总结人格（复盘整理）
         - L  : 直答人格（给结论 / 给方案）
+
+        on_chunk 不为空时，人格引擎走流式接口，把增量文本交给它。
+        user_state 为空时读当前 snapshot（投机执行会传入当时的 snapshot）。
         """
         mode = (mode or "Q").upper()
-        user_state = self.snapshot_manager.get()
+        with self._span(f"persona:{mode}", stream=on_chunk is not None):
+            return self._run_behavior_inner(mode, user_text, on_chunk, user_state)
+
+    def _run_behavior_inner(self, mode: str, user_text: str, on_chunk=None, user_state=None) -> str:
+        if user_state is None:
+            user_state = self.snapshot_manager.get()
 
         # ===== Q 引擎 =====
         if mode == "Q":
             talk_his = self.history_manager.get_talk_his(limit=10)
-            return self.fast_engine.respond(user_text, user_state, talk_his)
+            return self.fast_engine.respond(user_text, user_state, talk_his, on_chunk=on_chunk)
 
         # ===== T 引擎 =====
         if mode == "T":
+            # 0）上一轮 T 的观点树维护还在后台跑的话，先等它落地
+            self._wait_tree_maintenance()
+
             # 1）准备 T 引擎和观点树触发器需要的上下文
             snapshot = user_state
             talk_his = self.history_manager.get_talk_his(limit=10)
@@ -441,6 +855,7 @@ class ConversationOrchestrator:
                     "current_node_id": cid,
                     "nodes": {cid: current_node_tmp},
                 }
+            tree_version = self.perspective_tree.version
 
             # 2）让 T 引擎根据观点树 + 历史 + snapshot 生成本轮回复
             ai_text = self.slow_engine.respond(
@@ -448,44 +863,12 @@ class ConversationOrchestrator:
                 snapshot,
                 talk_his,
                 full_tree,
+                on_chunk=on_chunk,
             )
 
-            # 3）当前节点（注意：respond 期间树理论上可能会变，这里重新拿一次）
-            current_node = self.perspective_tree.get_current_node()
-
-            # 4）让观点树触发器基于当前节点 & 对话，判断下一步动作
-            move_info = self.perspective_move_trigger.decide_move(
-                current_node=current_node,
-                user_text=user_text,
-                ai_text=ai_text,
-                snapshot=snapshot,
-                talk_history=talk_his,
-                full_tree=full_tree,
-            )
-
-            # 5）根据 move_info 推进观点树 / 或者生成新树
-            if move_info:
-                # 如果 LLM 判断“这棵树方向不对，需要重建”
-                if move_info.get("need_new_tree"):
-                    try:
-                        # 用本轮的 user_text + 当前 snapshot + 最近对话，生成一棵新树
-                        new_tree = self.perspective_generate_engine.generate_tree(
-                            user_text=user_text,
-                            snapshot=snapshot,
-                            talk_history=talk_his,
-                        )
-                        if new_tree:
-                            self.perspective_tree.load_tree(new_tree)
-                            print("[Orchestrator] 观点树已根据 need_new_tree 生成并加载新树")
-                    except Exception as e:
-                        print("[Orchestrator] generate_tree error:", e)
-                else:
-                    # 否则按原逻辑，只做节点移动
-                    try:
-                        self.perspective_tree.apply_move(move_info)
-                    except Exception as e:
-                        print("[Orchestrator] apply_move error:", e)
-        
+            # 3）观点树推进 / 重建放到回复之后的后台阶段：回复先上屏，
+            #    结果按 version 落地，下一轮 T 开始前会等它做完
+            self._schedule_tree_maintenance(user_text, ai_text, snapshot, talk_his, full_tree, tree_version)
             return ai_text
 
 
@@ -503,11 +886,12 @@ class ConversationOrchestrator:
                 user_state=user_state,
                 talk_history=talk_his,
                 current_tree=current_tree,
+                on_chunk=on_chunk,
             )
 
         # ===== L 引擎 =====
         if mode == "L":
-            return self.direct_engine.answer(user_text, user_state)
+            return self.direct_engine.answer(user_text, user_state, on_chunk=on_chunk)
             
         # ===== D 引擎 =====
         if mode == "D":
@@ -516,8 +900,9 @@ class ConversationOrchestrator:
                 user_text=user_text,
                 user_state=user_state,
                 talk_history=talk_his,
+                on_chunk=on_chunk,
             )
             
         # ===== 兜底：模式异常时退回 Q =====
         talk_his = self.history_manager.get_talk_his(limit=10)
-        return self.fast_engine.respond(user_text, user_state, talk_his)
+        return self.fast_engine.respond(user_text, user_state, talk_his, on_chunk=on_chunk)
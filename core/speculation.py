@@ -0,0 +1,128 @@
+import json
+import threading
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional
+
+# 可以投机执行的人格：输入只有 user_text / snapshot / 对话历史，没有观点树副作用
+SPECULATABLE_MODES = ("Q", "L", "D")
+
+# 这些结果算“投机白跑了”，计入最近命中率；silenced 是这一轮不说话，和预测准不准无关
+MISS_REASONS = ("wrong_mode", "snapshot_changed")
+
+
+def snapshot_persona_key(snapshot: Optional[Dict[str, Any]]) -> str:
+    """
+    人格读的是整份 user_state（每个字段的具体值），所以投机结果能不能用要按值比较，
+    只忽略 timestamp；字段集合不变但情绪 / 处境改了，旧 snapshot 生成的回复也不能用。
+    """
+    data = {k: v for k, v in (snapshot or {}).items() if k != "timestamp"}
+    return json.dumps(data, ensure_ascii=False, sort_keys=True, default=str)
+
+
+class ChunkRelay:
+    """
+    投机人格的流式输出中转：
+
+    - 还没确认采用时，增量文本先攒在缓冲里，不上屏；
+    - attach(on_chunk)：确认采用，先把缓冲一次性补发，之后的增量直接转发；
+    - discard()：放弃，缓冲清空，之后的增量全部丢掉。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buffer: List[str] = []
+        self._target: Optional[Callable[[str], None]] = None
+        self._discarded = False
+
+    def push(self, delta: str):
+        # 在锁里转发，保证补发的缓冲和后续增量不会乱序
+        with self._lock:
+            if self._discarded:
+                return
+            if self._target is None:
+                self._buffer.append(delta)
+                return
+            self._target(delta)
+
+    def attach(self, on_chunk: Callable[[str], None]):
+        with self._lock:
+            for delta in self._buffer:
+                on_chunk(delta)
+            self._buffer.clear()
+            self._target = on_chunk
+
+    def discard(self):
+        with self._lock:
+            self._discarded = True
+            self._buffer.clear()
+
+
+class Speculation:
+    """一次投机执行：预测的模式、当时 snapshot 的取值 key、结果 future 和输出中转。"""
+
+    def __init__(self, mode: str, confidence: float, snapshot_key: str, future: Future, relay: ChunkRelay):
+        self.mode = mode
+        self.confidence = confidence
+        self.snapshot_key = snapshot_key
+        self.future = future
+        self.relay = relay
+
+
+class SpeculationStats:
+    """
+    投机命中率统计，顺带按最近 window 次的命中率决定要不要继续投机：
+    攒够 window 次结果后命中率低于下限就暂停（每多人格一次调用却几乎用不上），
+    暂停期间每 probe_every 轮仍放行一次，用来发现对话节奏变了、预测又准了。
+    """
+
+    def __init__(self, window: int = 20, probe_every: int = 5):
+        self._lock = threading.Lock()
+        self._recent: deque = deque(maxlen=max(1, int(window)))
+        self.probe_every = max(1, int(probe_every))
+        self._paused_turns = 0
+        self.stats: Dict[str, int] = {
+            "predicted": 0,        # 做过预测的轮次
+            "started": 0,          # 置信度够、真的提前跑了人格
+            "committed": 0,        # 预测对了，直接采用
+            "wrong_mode": 0,       # 引擎选择结果和预测不一致
+            "snapshot_changed": 0, # 状态更新改了人格要读的字段值
+            "silenced": 0,         # 这一轮最后不说话
+            "paused": 0,           # 最近命中率太低，这一轮没投机
+        }
+
+    def bump(self, key: str):
+        with self._lock:
+            self.stats[key] += 1
+            if key == "committed":
+                self._recent.append(True)
+            elif key in MISS_REASONS:
+                self._recent.append(False)
+
+    def recent_hit_rate(self) -> Optional[float]:
+        """最近 window 次的命中率；样本还没攒够时返回 None。"""
+        with self._lock:
+            if len(self._recent) < self._recent.maxlen:
+                return None
+            return sum(self._recent) / len(self._recent)
+
+    def should_pause(self, min_hit_rate: float) -> bool:
+        rate = self.recent_hit_rate()
+        if rate is None or rate >= min_hit_rate:
+            return False
+        with self._lock:
+            self._paused_turns += 1
+            if self._paused_turns % self.probe_every == 0:
+                return False
+            self.stats["paused"] += 1
+        return True
+
+    def summary(self) -> Dict[str, float]:
+        with self._lock:
+            data: Dict[str, float] = dict(self.stats)
+        started = data["started"]
+        data["hit_rate"] = round(data["committed"] / started, 3) if started else 0.0
+        data["wasted"] = started - data["committed"]
+        recent = self.recent_hit_rate()
+        data["recent_hit_rate"] = round(recent, 3) if recent is not None else None
+        return data
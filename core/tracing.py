@@ -0,0 +1,279 @@
+import contextvars
+import itertools
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+# 当前线程（协程上下文）里正在进行的 turn / span
+_current_turn: contextvars.ContextVar = contextvars.ContextVar("zaio_trace_turn", default=None)
+_current_span: contextvars.ContextVar = contextvars.ContextVar("zaio_trace_span", default=None)
+
+_span_ids = itertools.count(1)
+_turn_ids = itertools.count(1)
+
+
+class Span:
+    """一段计时：名字 + 起止时间 + 父 span + 所在线程 + 附加属性。"""
+
+    __slots__ = ("span_id", "parent_id", "name", "attrs", "start", "end", "thread_id", "thread_name")
+
+    def __init__(self, name: str, parent_id: Optional[int], attrs: Dict[str, Any]):
+        self.span_id = next(_span_ids)
+        self.parent_id = parent_id
+        self.name = name
+        self.attrs = dict(attrs)
+        self.start = time.perf_counter()
+        self.end: Optional[float] = None
+        thread = threading.current_thread()
+        self.thread_id = thread.ident
+        self.thread_name = thread.name
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    @property
+    def duration_ms(self) -> float:
+        end = self.end if self.end is not None else time.perf_counter()
+        return (end - self.start) * 1000
+
+
+class Turn:
+    """
+    一轮处理（用户消息 / tick / 时光飞逝）：
+    root 是覆盖整轮的根 span，其余 span 不论在哪个线程里跑，都挂在这一轮下面。
+    """
+
+    def __init__(self, name: str, attrs: Dict[str, Any]):
+        self.turn_id = next(_turn_ids)
+        self.name = name
+        self.started_at = time.time()
+        self.root = Span(name, None, attrs)
+        self.spans: List[Span] = [self.root]
+        self.dropped = False
+        self._lock = threading.Lock()
+
+    def add(self, span: Span):
+        with self._lock:
+            self.spans.append(span)
+
+    def set(self, **attrs):
+        self.root.set(**attrs)
+
+    def drop(self):
+        """这一轮没什么可看的（例如 tick 被本地拦下），结束时不进环形缓冲。"""
+        self.dropped = True
+
+    def has_span(self, prefix: str) -> bool:
+        with self._lock:
+            return any(s.name.startswith(prefix) for s in self.spans)
+
+    @property
+    def duration_ms(self) -> float:
+        return self.root.duration_ms
+
+
+class Tracer:
+    """
+    轻量链路追踪：
+
+        with tracer.turn("user_message") as turn:      # 一轮的根
+            with tracer.span("plan"):                  # 任意嵌套
+                ...
+                submit_in_context(executor, fn)        # 线程池里的 span 也挂回这一轮
+
+    - 当前 turn / span 放在 contextvars 里，跨线程靠 submit_in_context 复制上下文；
+    - 不在任何 turn 里时 span() 只计时不记录，调用方不用关心有没有开 turn；
+    - 最近 max_turns 轮放在环形缓冲里，可以导出成 Chrome trace-event JSON
+      （chrome://tracing / Perfetto 打开）或火焰图用的 folded stacks。
+    """
+
+    def __init__(self, max_turns: int = 50):
+        self._lock = threading.Lock()
+        self._turns: deque = deque(maxlen=max_turns)
+        # perf_counter → 墙上时间的换算基准（Chrome trace 的 ts 用绝对微秒）
+        self._epoch = time.time() - time.perf_counter()
+
+    # === 记录 ===
+    @contextmanager
+    def turn(self, name: str, **attrs):
+        turn = Turn(name, attrs)
+        t_token = _current_turn.set(turn)
+        s_token = _current_span.set(turn.root)
+        try:
+            yield turn
+        except BaseException as e:
+            turn.set(error=type(e).__name__)
+            raise
+        finally:
+            turn.root.end = time.perf_counter()
+            _current_span.reset(s_token)
+            _current_turn.reset(t_token)
+            if not turn.dropped:
+                with self._lock:
+                    self._turns.append(turn)
+
+    @contextmanager
+    def span(self, name: str, **attrs):
+        turn = _current_turn.get()
+        parent = _current_span.get()
+        span = Span(name, parent.span_id if parent is not None else None, attrs)
+        if turn is None:
+            # 不在任何 turn 里：照常计时，但不记录
+            try:
+                yield span
+            finally:
+                span.end = time.perf_counter()
+            return
+
+        turn.add(span)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.set(error=type(e).__name__)
+            raise
+        finally:
+            span.end = time.perf_counter()
+            _current_span.reset(token)
+
+    @staticmethod
+    def current_turn() -> Optional[Turn]:
+        return _current_turn.get()
+
+    def recent_turns(self, limit: Optional[int] = None) -> List[Turn]:
+        with self._lock:
+            turns = list(self._turns)
+        return turns[-limit:] if limit else turns
+
+    def clear(self):
+        with self._lock:
+            self._turns.clear()
+
+    # === 导出 ===
+    def _wall_us(self, perf: float) -> int:
+        return int((perf + self._epoch) * 1_000_000)
+
+    def to_chrome_trace(self, turns: Optional[List[Turn]] = None) -> Dict[str, Any]:
+        """Chrome trace-event 格式：每个 span 一个 "X"（完整事件），线程名用 "M" 元数据事件标注。"""
+        turns = self.recent_turns() if turns is None else turns
+        events: List[Dict[str, Any]] = []
+        tids: Dict[int, int] = {}
+        for turn in turns:
+            with turn._lock:
+                spans = list(turn.spans)
+            for span in spans:
+                if span.end is None:
+                    continue
+                if span.thread_id not in tids:
+                    tids[span.thread_id] = len(tids) + 1
+                    events.append({
+                        "name": "thread_name", "ph": "M", "pid": 1, "tid": tids[span.thread_id],
+                        "args": {"name": span.thread_name},
+                    })
+                args = {"turn_id": turn.turn_id, "span_id": span.span_id}
+                if span.parent_id is not None:
+                    args["parent_id"] = span.parent_id
+                args.update({k: _jsonable(v) for k, v in span.attrs.items()})
+                events.append({
+                    "name": span.name,
+                    "cat": turn.name,
+                    "ph": "X",
+                    "ts": self._wall_us(span.start),
+                    "dur": max(0, int((span.end - span.start) * 1_000_000)),
+                    "pid": 1,
+                    "tid": tids[span.thread_id],
+                    "args": args,
+                })
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def to_folded(self, turns: Optional[List[Turn]] = None) -> str:
+        """
+        folded stacks（flamegraph.pl / speedscope 可直接读）：
+        每行 "turn;span;子span 自身耗时微秒"，同一路径的多轮累加。
+        并行的子 span 加起来可能超过父 span，这时父 span 的自身耗时记 0。
+        """
+        turns = self.recent_turns() if turns is None else turns
+        totals: Dict[str, int] = {}
+        for turn in turns:
+            with turn._lock:
+                spans = [s for s in turn.spans if s.end is not None]
+            by_id = {s.span_id: s for s in spans}
+            child_us: Dict[int, int] = {}
+            for s in spans:
+                if s.parent_id in by_id:
+                    child_us[s.parent_id] = child_us.get(s.parent_id, 0) + int((s.end - s.start) * 1_000_000)
+            for s in spans:
+                path = []
+                node = s
+                while node is not None:
+                    path.append(node.name.replace(";", ":").replace(" ", "_"))
+                    node = by_id.get(node.parent_id)
+                stack = ";".join(reversed(path))
+                self_us = max(0, int((s.end - s.start) * 1_000_000) - child_us.get(s.span_id, 0))
+                totals[stack] = totals.get(stack, 0) + self_us
+        return "\n".join(f"{stack} {us}" for stack, us in totals.items() if us > 0)
+
+    def export(self, out_dir: str) -> Dict[str, str]:
+        """把最近的轮次写成 trace-<时间>.json（Chrome）和 trace-<时间>.folded，返回两个路径。"""
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        os.makedirs(out_dir, exist_ok=True)
+        paths = {
+            "chrome": os.path.join(out_dir, f"trace-{stamp}.json"),
+            "folded": os.path.join(out_dir, f"trace-{stamp}.folded"),
+        }
+        turns = self.recent_turns()
+        with open(paths["chrome"], "w", encoding="utf-8") as f:
+            json.dump(self.to_chrome_trace(turns), f, ensure_ascii=False)
+        with open(paths["folded"], "w", encoding="utf-8") as f:
+            f.write(self.to_folded(turns) + "\n")
+        return paths
+
+    # === 文本查看 ===
+    def format_turn(self, turn: Turn) -> str:
+        """缩进树状排版：每个 span 一行，显示相对本轮开始的偏移、耗时和属性。"""
+        with turn._lock:
+            spans = list(turn.spans)
+        children: Dict[Optional[int], List[Span]] = {}
+        for s in spans:
+            children.setdefault(s.parent_id, []).append(s)
+
+        when = time.strftime("%H:%M:%S", time.localtime(turn.started_at))
+        lines = [f"#{turn.turn_id} {turn.name} @ {when}  共 {turn.duration_ms:.0f} ms"]
+
+        def walk(span: Span, depth: int):
+            offset = (span.start - turn.root.start) * 1000
+            attrs = " ".join(f"{k}={v}" for k, v in span.attrs.items())
+            lines.append(
+                f"{'  ' * depth}+{offset:>7.0f} ms  {span.name:<28}{span.duration_ms:>8.0f} ms"
+                + (f"  {attrs}" if attrs else "")
+            )
+            for child in sorted(children.get(span.span_id, []), key=lambda c: c.start):
+                walk(child, depth + 1)
+
+        for child in sorted(children.get(turn.root.span_id, []), key=lambda c: c.start):
+            walk(child, 1)
+        if turn.root.attrs:
+            lines.append("  " + " ".join(f"{k}={v}" for k, v in turn.root.attrs.items()))
+        return "\n".join(lines)
+
+    def format_recent(self, limit: int = 20) -> str:
+        turns = self.recent_turns(limit)
+        if not turns:
+            return "（还没有记录到任何一轮）"
+        return "\n\n".join(self.format_turn(t) for t in reversed(turns))
+
+
+def submit_in_context(executor, fn, *args, **kwargs):
+    """executor.submit 的替代：带上当前的 contextvars，线程池里开的 span 才能挂到当前这一轮。"""
+    ctx = contextvars.copy_context()
+    return executor.submit(ctx.run, fn, *args, **kwargs)
+
+
+def _jsonable(value: Any) -> Any:
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    return str(value)
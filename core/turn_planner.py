@@ -0,0 +1,256 @@
+import threading
+from concurrent.futures import Executor
+from contextlib import nullcontext
+from typing import Any, Dict, Optional
+
+from state.history_manager import HistoryManager
+from state.snapshot_manager import StateSnapshotManager
+from trigger.decision_trigger import DecisionTrigger
+from trigger.engine_select_trigger import EngineSelectTrigger
+from trigger.state_update_trigger import StateUpdateTrigger
+from trigger.talk_trigger import TalkTrigger
+from trigger.tick_gate import TickGate
+from trigger.timing_engine import TimingEngine
+
+from .tracing import Tracer, submit_in_context
+
+
+# snapshot 里表示“还不知道”的占位值
+UNKNOWN_VALUES = ("", "等待发掘", None)
+
+
+def snapshot_decision_key(snapshot: Dict[str, Any]) -> frozenset:
+    """
+    引擎选择真正看重的是“在哦已经掌握了哪些字段”（信息密度逻辑），
+    而不是每个字段的具体措辞。这里把 snapshot 压成“已知字段集合”，
+    只有这个集合变化时，才认为状态更新可能改变引擎选择。
+    """
+    known = set()
+    for key, value in (snapshot or {}).items():
+        if key == "timestamp":
+            continue
+        if isinstance(value, str):
+            value = value.strip()
+        if value in UNKNOWN_VALUES or value == [] or value == {}:
+            continue
+        known.add(key)
+    return frozenset(known)
+
+
+class TurnPlanner:
+    """
+    用户一轮发言的决策编排：
+
+    原来是三次串行 LLM 往返：状态更新 → 是否说话 → 引擎选择。
+    这三者里真正有依赖的只有“引擎选择要看 snapshot”，所以这里：
+
+    1）状态更新、是否说话、引擎选择（先用旧 snapshot 投机跑）同时发出；
+    2）状态更新回来后写入 snapshot；
+    3）如果更新让“已知字段集合”发生变化，才用新 snapshot 重跑一次引擎选择，
+       否则直接采用投机结果。
+
+    大多数轮次里，人格调用前的等待从三次往返降到约一次。
+
+    decision_mode：
+    - "split"：是否说话 / 引擎选择 各走一次 LLM（原始方式）；
+    - "fused"：用 DecisionTrigger 一次调用同时给出两者，再交给
+      TalkTrigger / EngineSelectTrigger 消费，tick 和用户消息都省一次调用。
+    """
+
+    DECISION_MODES = ("split", "fused")
+
+    def __init__(
+        self,
+        executor: Executor,
+        snapshot_manager: StateSnapshotManager,
+        history_manager: HistoryManager,
+        timing_engine: TimingEngine,
+        state_update_trigger: StateUpdateTrigger,
+        talk_trigger: TalkTrigger,
+        engine_select_trigger: EngineSelectTrigger,
+        decision_trigger: DecisionTrigger,
+        decision_mode: str = "split",
+        tick_gate: Optional[TickGate] = None,
+        tracer: Optional[Tracer] = None,
+    ):
+        self.executor = executor
+        self.snapshot_manager = snapshot_manager
+        self.history_manager = history_manager
+        self.timing_engine = timing_engine
+        self.state_update_trigger = state_update_trigger
+        self.talk_trigger = talk_trigger
+        self.engine_select_trigger = engine_select_trigger
+        self.decision_trigger = decision_trigger
+        self.decision_mode = decision_mode if decision_mode in self.DECISION_MODES else "split"
+        self.tick_gate = tick_gate
+        self.tracer = tracer
+
+        self._lock = threading.Lock()
+        self.stats = {
+            "turns": 0,
+            "speculative_used": 0,
+            "reselected": 0,
+            "silenced": 0,
+        }
+
+    def _bump(self, key: str):
+        with self._lock:
+            self.stats[key] += 1
+
+    # === 链路追踪 ===
+    def _span(self, stage: str, **attrs):
+        if self.tracer is None:
+            return nullcontext()
+        return self.tracer.span(stage, **attrs)
+
+    def _traced(self, stage: str, fn, *args, **kwargs):
+        with self._span(stage):
+            return fn(*args, **kwargs)
+
+    def _submit(self, stage: str, fn, *args, **kwargs):
+        """丢进线程池并记一个 stage span；带上当前上下文，span 能挂回这一轮。"""
+        return submit_in_context(self.executor, self._traced, stage, fn, *args, **kwargs)
+
+    def plan_user_turn(self, user_text: str) -> Optional[str]:
+        """
+        用户刚说完话（已写入 history）时调用。
+        返回本轮要用的人格模式；返回 None 表示这一轮不说话。
+        snapshot 的更新也在这里完成。
+        """
+        self._bump("turns")
+
+        old_snapshot = self.snapshot_manager.get()
+        state_history = self.history_manager.get_recent(30)
+        select_history = self.history_manager.get_recent(limit=10)
+        recent_lines = self.history_manager.get_recent_lines(5)
+
+        # 1）同时发出：状态更新 + 决策（split 为两路，fused 为一路）
+        f_state = self._submit(
+            "state_update", self.state_update_trigger.infer_updates, user_text, state_history, old_snapshot
+        )
+        if self.decision_mode == "fused":
+            f_decision = self._submit(
+                "decide",
+                self.decision_trigger.decide,
+                recent_lines,
+                user_text,
+                old_snapshot,
+                select_history,
+                True,
+            )
+            f_talk = f_select = None
+        else:
+            f_decision = None
+            f_talk = self._submit(
+                "talk", self.talk_trigger.should_reply, recent_lines, True
+            )
+            f_select = self._submit(
+                "select",
+                self.engine_select_trigger.select,
+                user_text=user_text,
+                snapshot=old_snapshot,
+                history=select_history,
+                user_triggered=True,
+            )
+
+        # 2）状态更新无论说不说话都要落盘
+        updates = f_state.result()
+        if updates:
+            self.snapshot_manager.update_multi(updates)
+
+        # 3）是否说话 + 节奏保护
+        if f_decision is not None:
+            decision = f_decision.result()
+            should_reply = self.talk_trigger.should_reply(recent_lines, True, decision=decision)
+        else:
+            decision = None
+            should_reply = f_talk.result()
+        if not should_reply or not self.timing_engine.allow_ai_speak():
+            self._bump("silenced")
+            return None
+
+        # 4）引擎选择：已知字段集合没变就直接用投机结果
+        if decision is not None:
+            mode = self.engine_select_trigger.select(
+                user_text=user_text,
+                snapshot=old_snapshot,
+                history=select_history,
+                user_triggered=True,
+                decision=decision,
+            )
+        else:
+            mode = f_select.result()
+        new_snapshot = self.snapshot_manager.get()
+        if snapshot_decision_key(new_snapshot) == snapshot_decision_key(old_snapshot):
+            self._bump("speculative_used")
+            return mode
+
+        self._bump("reselected")
+        with self._span("reselect"):
+            return self.engine_select_trigger.select(
+                user_text=user_text,
+                snapshot=new_snapshot,
+                history=select_history,
+                user_triggered=True,
+            )
+
+    def _mark_tick_decided(self, version: int):
+        if self.tick_gate is not None:
+            self.tick_gate.mark_decided(version)
+
+    def plan_tick_turn(self) -> Optional[str]:
+        """
+        系统 tick 时调用。返回本轮要用的人格模式；返回 None 表示保持安静。
+        tick 上多数时候是不说话的，所以 split 模式下不做投机选择，避免白白多一次调用。
+        有 tick_gate 时先走本地预筛，只有本地判断不了才问 LLM。
+        """
+        version = self.history_manager.version
+        if self.tick_gate is not None:
+            if self.tick_gate.check() is False:
+                return None
+        elif not self.timing_engine.allow_ai_speak():
+            return None
+
+        recent_lines = self.history_manager.get_recent_lines(5)
+        user_text = ""  # tick 场景下没有新的用户输入
+
+        if self.decision_mode == "fused":
+            snapshot = self.snapshot_manager.get()
+            history = self.history_manager.get_recent(limit=10)
+            with self._span("decide"):
+                decision = self.decision_trigger.decide(
+                    recent_lines, user_text, snapshot, history, False
+                )
+            # 只有 LLM 真给出了结论才记“这版对话判断过了”；失败 / 超时 / 熔断时下一个 tick 还要再问
+            if decision.get("should_reply") is not None:
+                self._mark_tick_decided(version)
+            if not self.talk_trigger.should_reply(recent_lines, False, decision=decision):
+                return None
+            return self.engine_select_trigger.select(
+                user_text=user_text,
+                snapshot=snapshot,
+                history=history,
+                user_triggered=False,
+                decision=decision,
+            )
+
+        # 1）小触发器：是否应该继续说话？（LLM；节奏保护已在上面先判断）
+        with self._span("talk"):
+            should_reply = self.talk_trigger.try_decide(recent_lines)
+        if should_reply is None:
+            # LLM 没给出结论：按纯 tick 的兜底保持安静，但不记版本，下一个 tick 再问
+            return None
+        self._mark_tick_decided(version)
+        if not should_reply:
+            return None
+
+        # 2）选择人格（Q/T/L/SUM）——通过 EngineSelectTrigger
+        snapshot = self.snapshot_manager.get()
+        history = self.history_manager.get_recent(limit=10)
+        with self._span("select"):
+            return self.engine_select_trigger.select(
+                user_text=user_text,
+                snapshot=snapshot,
+                history=history,
+                user_triggered=False,
+            )
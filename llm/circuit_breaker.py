@@ -0,0 +1,160 @@
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from llm.retry_policy import AUTH, NETWORK, PARSE, RATE_LIMIT, SERVER, TIMEOUT, error_category
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# 这些错误说明“后端整体不可用”，计入熔断；其余 4xx 说明服务是通的，按成功算
+DEFAULT_TRIP_CATEGORIES = frozenset({AUTH, RATE_LIMIT, SERVER, TIMEOUT, NETWORK, PARSE})
+
+
+class CircuitBreaker:
+    """
+    LLM 后端熔断器：
+
+    - closed：正常放行；连续 failure_threshold 次尝试失败（超时 / 连不上 / 5xx / 429 / key 无效）就打开；
+    - open：所有调用直接短路（call_llm 立刻返回 ""，各触发器 / 人格走原来的兜底），
+      等 recovery_timeout 秒后进入 half_open；
+    - half_open：只放 1 个试探请求过去，成功就关闭，失败就重新打开，
+      并把下一次的等待时间翻倍（最多 max_recovery_timeout）。
+
+    按“每次尝试”计数（不是每次 call_llm），重试中途熔断打开也会立刻停下。
+    """
+
+    def __init__(
+        self,
+        failure_threshold: int = 5,
+        recovery_timeout: float = 15.0,
+        max_recovery_timeout: float = 120.0,
+        trip_categories=DEFAULT_TRIP_CATEGORIES,
+        on_state_change: Optional[Callable[[str, str], None]] = None,
+    ):
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.recovery_timeout = recovery_timeout
+        self.max_recovery_timeout = max_recovery_timeout
+        self.trip_categories = frozenset(trip_categories)
+        self._listeners: List[Callable[[str, str], None]] = [on_state_change] if on_state_change else []
+
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._current_timeout = recovery_timeout
+        self._probe_in_flight = False
+        self.stats: Dict[str, int] = {"opened": 0, "short_circuited": 0, "probes": 0, "recovered": 0}
+
+    # === 状态 ===
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state
+
+    def add_listener(self, fn: Callable[[str, str], None]):
+        """fn(旧状态, 新状态)，状态切换时在调用线程里执行。"""
+        self._listeners.append(fn)
+
+    def _set_state(self, new_state: str) -> Optional[tuple]:
+        # 调用方持有 _lock；返回 (old, new) 交给 _notify 在锁外通知
+        old = self._state
+        if old == new_state:
+            return None
+        self._state = new_state
+        return (old, new_state)
+
+    def _notify(self, change: Optional[tuple]):
+        if change is None:
+            return
+        old, new = change
+        if new == OPEN:
+            print(f"[CircuitBreaker] LLM 后端熔断（{old} → open），{self._current_timeout:.0f}s 后试探恢复")
+        elif new == CLOSED:
+            print("[CircuitBreaker] LLM 后端已恢复（→ closed）")
+        for fn in list(self._listeners):
+            try:
+                fn(old, new)
+            except Exception:
+                pass
+
+    # === 放行判断 ===
+    def allow(self) -> bool:
+        """发一次请求之前调用：返回 False 表示熔断中，直接走兜底。"""
+        change = None
+        with self._lock:
+            if self._state == CLOSED:
+                return True
+            if self._state == OPEN:
+                if time.time() - self._opened_at < self._current_timeout:
+                    self.stats["short_circuited"] += 1
+                    return False
+                change = self._set_state(HALF_OPEN)
+            # half_open：同一时间只放一个试探请求
+            if self._probe_in_flight:
+                self.stats["short_circuited"] += 1
+                allowed = False
+            else:
+                self._probe_in_flight = True
+                self.stats["probes"] += 1
+                allowed = True
+        self._notify(change)
+        return allowed
+
+    # === 结果回报 ===
+    def record(self, error: Optional[Exception] = None):
+        """每次放行的尝试结束后调用：error 为 None 表示成功。"""
+        if error is not None and error_category(error) in self.trip_categories:
+            self._record_failure()
+        else:
+            self._record_success()
+
+    def release(self):
+        """放行的尝试被调用方主动取消：既不算成功也不算失败，只把试探名额还回去。"""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def _record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._probe_in_flight = False
+            if self._state == CLOSED:
+                return
+            self.stats["recovered"] += 1
+            self._current_timeout = self.recovery_timeout
+            change = self._set_state(CLOSED)
+        self._notify(change)
+
+    def _record_failure(self):
+        with self._lock:
+            self._probe_in_flight = False
+            if self._state == HALF_OPEN:
+                # 试探失败：重新打开，等待时间翻倍
+                self._current_timeout = min(self.max_recovery_timeout, self._current_timeout * 2)
+            else:
+                self._failures += 1
+                if self._state == OPEN or self._failures < self.failure_threshold:
+                    return
+            self._opened_at = time.time()
+            self.stats["opened"] += 1
+            change = self._set_state(OPEN)
+        self._notify(change)
+
+    def reset(self):
+        """手动恢复（例如用户刚换了 API key）。"""
+        with self._lock:
+            self._failures = 0
+            self._probe_in_flight = False
+            self._current_timeout = self.recovery_timeout
+            change = self._set_state(CLOSED)
+        self._notify(change)
+
+    def summary(self) -> Dict[str, object]:
+        with self._lock:
+            data: Dict[str, object] = dict(self.stats)
+            data["state"] = self._state
+            data["consecutive_failures"] = self._failures
+            if self._state == OPEN:
+                data["retry_in_s"] = round(max(0.0, self._opened_at + self._current_timeout - time.time()), 1)
+        return data
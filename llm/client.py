@@ -1,51 +1,64 @@
 
+import contextvars
 import json
 import os
-import urllib.request
-import urllib.error
+import queue
 import datetime
 import threading
 import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import nullcontext
+
+from llm.concurrency import ConcurrencyLimiter
+from llm.circuit_breaker import CircuitBreaker
+from llm.context_builder import ContextBuilder
+from llm.hedging import HedgePolicy
+from llm.http_pool import CancelToken, HTTPConnectionPool, RequestCancelled
+from llm.log_sink import AsyncLogSink, RotatingLogWriter
+from llm.prompt_log_store import PromptLogStore
+from llm.response_cache import ResponseCache
+from llm.retry_policy import RetryPolicy, classify_error
+from llm.telemetry import Telemetry
+from llm.token_budget import TokenBudget, estimate_tokens
 
 _BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 _PROMPT_LOG_DIR = os.path.join(os.path.dirname(_BASE_DIR), "data", "prompt_logs")
-_PROMPT_LOG_PATH = os.path.join(_PROMPT_LOG_DIR, "llm_prompt_log.txt")
+_PROMPT_LOG_NAME = "llm_prompt_log.txt"
+_TRIGGER_LOG_NAME = "llm_trigger_log.txt"
+
+# 默认走回复缓存的 role → TTL（秒）：都是低温度、输出是小段 JSON 的触发器
+DEFAULT_CACHE_ROLES = {
+    "trigger_should_speak": 120.0,
+    "trigger_select_engine": 300.0,
+    "trigger_decide_turn": 120.0,
+    "trigger_perspective_move": 300.0,
+    "trigger_state_update": 300.0,
+}
+
+def _format_log_block(title: str, final_reply: str, system_prompt: str, user_prompt: str, engine_name: str) -> str:
+    """拼一段日志文本（格式和原来逐行 write 的完全一样），真正写盘交给 AsyncLogSink。"""
+    ts = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    return (
+        f"=== {title} ===\n"
+        f"time: {ts}\n"
+        f"engine: {engine_name}\n"
+        "---- SYSTEM ----\n"
+        f"{system_prompt}\n"
+        "---- USER ----\n"
+        f"{user_prompt}\n"
+        "---- REPLY ----\n"
+        f"{final_reply}\n\n"
+    )
 
-def _append_trigger_log(final_reply: str, system_prompt: str, user_prompt: str, engine_name: str):
+def _append_trigger_log(sink: AsyncLogSink, final_reply: str, system_prompt: str, user_prompt: str, engine_name: str):
     try:
-        base = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-        log_dir = os.path.join(base, "data", "prompt_logs")
-        os.makedirs(log_dir, exist_ok=True)
-        log_path = os.path.join(log_dir, "llm_trigger_log.txt")
-
-        with open(log_path, "a", encoding="utf-8") as f:
-            ts = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            f.write("=== TRIGGER CALL ===\n")
-            f.write(f"time: {ts}\n")
-            f.write(f"engine: {engine_name}\n")
-            f.write("---- SYSTEM ----\n")
-            f.write(system_prompt + "\n")
-            f.write("---- USER ----\n")
-            f.write(user_prompt + "\n")
-            f.write("---- REPLY ----\n")
-            f.write(final_reply + "\n\n")
-    except:
+        sink.submit("trigger", _format_log_block("TRIGGER CALL", final_reply, system_prompt, user_prompt, engine_name))
+    except Exception:
         pass
 
-def _append_llm_log(final_reply: str, system_prompt: str, user_prompt: str, engine_name: str = "deepseek-chat"):
+def _append_llm_log(sink: AsyncLogSink, final_reply: str, system_prompt: str, user_prompt: str, engine_name: str = "deepseek-chat"):
     try:
-        os.makedirs(_PROMPT_LOG_DIR, exist_ok=True)
-        ts = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        with open(_PROMPT_LOG_PATH, "a", encoding="utf-8") as f:
-            f.write("=== LLM CALL ===\n")
-            f.write(f"time: {ts}\n")
-            f.write(f"engine: {engine_name}\n")
-            f.write("---- SYSTEM ----\n")
-            f.write(system_prompt + "\n")
-            f.write("---- USER ----\n")
-            f.write(user_prompt + "\n")
-            f.write("---- REPLY ----\n")
-            f.write(final_reply + "\n\n")
+        sink.submit("llm", _format_log_block("LLM CALL", final_reply, system_prompt, user_prompt, engine_name))
     except Exception:
         pass
 
@@ -56,11 +69,84 @@ class LLMClient:
         api_key_path: str = os.path.join(os.path.dirname(_BASE_DIR), "config", "api_key.txt"),
         base_url: str = "https://api.deepseek.com/beta/v1/chat/completions",
         timeout: int = 60,
+        max_in_flight: int = 4,
+        role_max_in_flight: dict = None,
+        retry_policy: RetryPolicy = None,
+        circuit_breaker: CircuitBreaker = None,
+        hedge_policy: HedgePolicy = None,
+        pool_idle_timeout: float = 60.0,
+        cache_roles: dict = None,
+        cache_path: str = None,
+        cache_max_entries: int = 512,
+        role_token_budgets: dict = None,
+        log_max_bytes: int = 5 * 1024 * 1024,
+        log_max_age_s: float = 24 * 3600,
+        log_backup_count: int = 5,
+        log_compress: bool = True,
+        text_log: bool = False,
+        prompt_log_dir: str = _PROMPT_LOG_DIR,
+        prompt_store_dir: str = None,
+        telemetry_path: str = None,
     ):
         self.api_key_path = api_key_path
         self.base_url = base_url
         self.timeout = timeout
 
+        # 并发闸门：全局 + 按 role 的最大在途请求数
+        # 观点树生成又大又慢，默认同一时间只允许 1 个，避免挤占触发器的名额
+        if role_max_in_flight is None:
+            role_max_in_flight = {"perspective_generate_engine": 1}
+        self.limiter = ConcurrencyLimiter(max_in_flight, role_max_in_flight)
+        # 重试策略：按错误类型决定是否重试，指数退避 + 抖动，按 role 设总时限
+        self.retry_policy = retry_policy or RetryPolicy()
+        # 熔断器：后端连续失败就短路，调用方直接走各自的兜底，等一会儿再放一个请求试探
+        self.circuit_breaker = circuit_breaker or CircuitBreaker()
+        # 对冲请求（可选）：关键路径上的小触发器慢了就补发一份，先回来的算数
+        self.hedge_policy = hedge_policy
+        self._hedge_executor = None
+
+        # keep-alive 连接池：池子大小跟全局并发上限一致即可
+        self.pool_idle_timeout = pool_idle_timeout
+        self._pool = None
+        self._pool_lock = threading.Lock()
+
+        self.model = "deepseek-chat"
+
+        # 触发器回复缓存：role → TTL 秒；不在表里的 role（人格等）不缓存
+        self.cache_roles = dict(DEFAULT_CACHE_ROLES if cache_roles is None else cache_roles)
+        self.response_cache = ResponseCache(cache_max_entries, persist_path=cache_path)
+
+        # user prompt 增量拼装：对话行 / 观点树的序列化结果按片段缓存
+        self.context_builder = ContextBuilder()
+        # 按 role 的 prompt token 预算：超了就裁旧对话 / 压观点树
+        self.token_budget = TokenBudget(role_token_budgets, dumps=self.context_builder.dumps)
+
+        # prompt 日志：后台线程批量写盘
+        # - 结构化日志（默认）：PromptLogStore，system prompt 按 hash 只存一次，带索引
+        # - 文本日志（text_log=True 时额外写）：按大小 / 时间轮转，旧文件压成 .gz
+        self.log_sink = AsyncLogSink()
+
+        # 调用埋点：排队 / 建连 / 首字节 / 总耗时、重试次数、token 用量、结果
+        self.telemetry = Telemetry()
+        self.telemetry_path = telemetry_path
+        self.telemetry.register_status("response_cache", self.cache_stats)
+        self.telemetry.register_status("backend", self.backend_status)
+        # 链路追踪（core.tracing.Tracer），由 orchestrator 注入；为空时不记录
+        self.tracer = None
+        # prompt 日志目录默认在 data/prompt_logs（基准测试等场景可以指到别处）
+        self.prompt_log_dir = prompt_log_dir
+        self.prompt_store = PromptLogStore(prompt_store_dir or os.path.join(prompt_log_dir, "store"))
+        self.log_sink.register_writer("store", self.prompt_store)
+        self.text_log = text_log
+        for key, name in (("llm", _PROMPT_LOG_NAME), ("trigger", _TRIGGER_LOG_NAME)):
+            self.log_sink.register_writer(key, RotatingLogWriter(
+                os.path.join(prompt_log_dir, name),
+                max_bytes=log_max_bytes,
+                max_age_s=log_max_age_s,
+                backup_count=log_backup_count,
+                compress=log_compress,
+            ))
+
         self.api_key = None
         self.load_api_key()
 
@@ -839,6 +925,44 @@ class LLMClient:
 
         }
 
+        # 合并决策：一次调用同时回答“要不要说话”和“用哪个引擎”。
+        # 直接拼接两个小触发器的规则，保证和分开调用时的判断标准一致。
+        self.role_prompts["trigger_decide_turn"] = (
+            """你是“在哦 · 合并决策触发器（Turn-Decider）”，
+            需要在一次回答里同时完成下面两个触发器的工作。
+
+            【你会在 user 的 JSON 里看到】
+            {
+              "recent_lines": [... 最近最多 5 条对话 ...],
+              "user_text": "本轮用户输入（系统 tick 时为空字符串）",
+              "user_triggered": true/false,
+              "snapshot": {... 当前用户信息快照 ...},
+              "talk_history": [... 最近 10 句对话 ...]
+            }
+
+            ============ 第一部分：是否说话（只看 recent_lines） ============
+            """
+            + self.role_prompts["trigger_should_speak"]
+            + """
+
+            ============ 第二部分：引擎选择 ============
+            """
+            + self.role_prompts["trigger_select_engine"]
+            + """
+
+            =================================================
+            【最终输出要求（覆盖以上两部分各自的输出要求）】
+            =================================================
+            你必须只输出一个 JSON 对象，字段为：
+            {
+              "should_reply": true/false,
+              "mode": "Q" / "T" / "L" / "SUM" / "D",
+              "reason": "一句简短中文，说明依据"
+            }
+            即使 should_reply 为 false，也要给出 mode。
+            不要输出任何额外文字。"""
+        )
+
         # 日志中显示的“引擎名”
         self.engine_display_name = {
             "persona_fast": "Q-Engine 快人格",
@@ -850,13 +974,18 @@ class LLMClient:
             "trigger_state_update": "触发器·StateSnapshot 更新",
             "trigger_perspective_move": "触发器·T 引擎观点树推进",
             "perspective_generate_engine": "观点树生成",
+            "trigger_decide_turn": "触发器·是否说话+引擎选择（合并）",
         }
 
         self._last_req_str_by_role = {}
+        # 只保护去重表 / 计数这类共享状态，不再包住整个网络请求
         self._call_lock = threading.Lock()
         self._last_call_end_ts = 0.0
         self.min_interval = 0.0  # 不再强制 0.2s 间隔
 
+        # 正在进行中的请求数：0→1 点亮“思考中”，1→0 熄灭
+        self._thinking_count = 0
+
     def load_api_key(self):
         try:
             with open(self.api_key_path, "r", encoding="utf-8") as f:
@@ -866,99 +995,466 @@ class LLMClient:
 
     def reload_api_key(self):
         self.load_api_key()
+        # 换了 key 之后之前的 401 不算数，立刻放行
+        self.circuit_breaker.reset()
+
+    def _get_pool(self) -> HTTPConnectionPool:
+        """按当前 base_url 取连接池；base_url 被改过就换一个新池子。"""
+        with self._pool_lock:
+            if self._pool is None or self._pool.base_url != self.base_url:
+                if self._pool is not None:
+                    self._pool.close()
+                self._pool = HTTPConnectionPool(
+                    self.base_url,
+                    timeout=self.timeout,
+                    max_size=self.limiter.max_in_flight,
+                    idle_timeout=self.pool_idle_timeout,
+                )
+            return self._pool
 
-    def _build_request(self, messages, temperature: float = 0.7):
+    def _build_request(self, messages, temperature: float = 0.7, stream: bool = False):
+        """返回 (headers, body)，交给连接池发送。"""
         headers = {
             "Content-Type": "application/json",
         }
         if self.api_key:
             headers["Authorization"] = f"Bearer {self.api_key}"
 
-        data = json.dumps({
-            "model": "deepseek-chat",
+        body = {
+            "model": self.model,
             "messages": messages,
             "temperature": temperature,
-        }).encode("utf-8")
+        }
+        if stream:
+            body["stream"] = True
+            # 让最后一个 chunk 带上 usage，流式调用也能统计 token
+            body["stream_options"] = {"include_usage": True}
+            headers["Accept"] = "text/event-stream"
+        data = json.dumps(body).encode("utf-8")
+
+        return headers, data
+
+    def _request_once(
+        self,
+        messages,
+        temperature: float,
+        meta: dict = None,
+        cancel: CancelToken = None,
+        timeout: float = None,
+    ) -> str:
+        """普通模式：一次请求拿完整回复。meta 用来带回连接耗时和 usage；timeout 不传就用连接池的超时。"""
+        headers, data = self._build_request(messages, temperature=temperature)
+        body = self._get_pool().post(data, headers, timings=meta, cancel=cancel, timeout=timeout).decode("utf-8")
+        obj = json.loads(body)
+        if meta is not None and isinstance(obj.get("usage"), dict):
+            meta["usage"] = obj["usage"]
+        return obj["choices"][0]["message"]["content"]
+
+    def _get_hedge_executor(self) -> ThreadPoolExecutor:
+        with self._pool_lock:
+            if self._hedge_executor is None:
+                # 每个在途名额最多同时挂着主请求 + 对冲请求两个线程
+                self._hedge_executor = ThreadPoolExecutor(
+                    max_workers=2 * self.limiter.max_in_flight, thread_name_prefix="zaio-hedge"
+                )
+            return self._hedge_executor
+
+    def _request_hedged(self, role: str, messages, temperature: float, meta: dict, timeout: float = None) -> str:
+        """
+        对冲请求：主请求超过该 role 的 p90 还没回来，就再发一份，谁先成功用谁，另一个掐断。
+        两个都失败时抛主请求的错误（交给重试策略照常处理）。
+        对冲请求和主请求共用同一个并发名额，额外请求量由 HedgePolicy 的令牌桶封顶。
+        """
+        policy = self.hedge_policy
+        delay = policy.delay_for(role, self.telemetry)
+        policy.on_primary()
+        executor = self._get_hedge_executor()
+
+        tokens = [CancelToken()]
+        metas = [{}]
+        t0 = time.perf_counter()
+        futures = [executor.submit(self._request_once, messages, temperature, metas[0], tokens[0], timeout)]
+        done, _ = wait(futures, timeout=delay)
+        hedge_offset_ms = 0.0
+        if not done and policy.try_acquire():
+            hedge_offset_ms = (time.perf_counter() - t0) * 1000
+            tokens.append(CancelToken())
+            metas.append({})
+            futures.append(executor.submit(self._request_once, messages, temperature, metas[1], tokens[1], timeout))
+
+        winner = None
+        pending = set(futures)
+        while pending and winner is None:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for f in done:
+                if f.exception() is None:
+                    winner = futures.index(f)
+                    break
+        for i, token in enumerate(tokens):
+            if i != winner:
+                token.cancel()
+
+        if len(futures) > 1:
+            policy.on_result(hedge_won=winner == 1)
+        if winner is None:
+            raise futures[0].exception()
+        meta.update(metas[winner])
+        if winner == 1 and meta.get("ttfb_ms") is not None:
+            # 对冲请求自己的首字节时间是从它发出时算的；埋点要的是从主请求发出起等了多久
+            meta["ttfb_ms"] = round(hedge_offset_ms + meta["ttfb_ms"], 1)
+        meta["hedged"] = len(futures) > 1
+        meta["hedge_won"] = winner == 1
+        return futures[winner].result()
+
+    def _request_stream(
+        self,
+        messages,
+        temperature: float,
+        on_chunk,
+        parts: list,
+        meta: dict = None,
+        timeout: float = None,
+        cancel: CancelToken = None,
+    ) -> str:
+        """
+        流式模式（SSE）：每收到一段 delta.content 就追加到 parts 并回调 on_chunk。
+        parts 由调用方传入，出错时调用方仍能知道已经吐出了多少内容。
+        meta 用来带回连接耗时、首段内容到达时间和 usage。
+        """
+        headers, data = self._build_request(messages, temperature=temperature, stream=True)
+        t0 = time.perf_counter()
+        with self._get_pool().stream(data, headers, timings=meta, timeout=timeout, cancel=cancel) as resp:
+            while True:
+                line = resp.readline()
+                if not line:
+                    break
+                line = line.decode("utf-8").strip()
+                if not line.startswith("data:"):
+                    # 空行 / 注释行（: keep-alive）直接跳过
+                    continue
+                event = line[len("data:"):].strip()
+                if event == "[DONE]":
+                    break
+                obj = json.loads(event)
+                if meta is not None and isinstance(obj.get("usage"), dict):
+                    meta["usage"] = obj["usage"]
+                choices = obj.get("choices") or []
+                if not choices:
+                    continue
+                delta = (choices[0].get("delta") or {}).get("content")
+                if not delta:
+                    continue
+                if meta is not None and not parts:
+                    meta["first_token_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+                parts.append(delta)
+                if on_chunk:
+                    try:
+                        on_chunk(delta)
+                    except Exception:
+                        # UI 回调出错不能打断流
+                        pass
+        return "".join(parts)
 
-        req = urllib.request.Request(self.base_url, data=data, headers=headers, method="POST")
-        return req
+    def _thinking_enter(self):
+        with self._call_lock:
+            self._thinking_count += 1
+            first = self._thinking_count == 1
+        if first and hasattr(self, "on_thinking_start") and self.on_thinking_start:
+            try:
+                self.on_thinking_start()
+            except Exception:
+                # UI 回调出错不能影响主流程
+                pass
 
-    def call_llm(self, role: str, payload: dict, temperature: float = 0.7) -> str:
+    def _thinking_exit(self):
         with self._call_lock:
-            now = time.time()
-            delta = now - self._last_call_end_ts
-            wait = self.min_interval - delta
+            self._thinking_count = max(0, self._thinking_count - 1)
+            last = self._thinking_count == 0
+            self._last_call_end_ts = time.time()
+        if last and hasattr(self, "on_thinking_end") and self.on_thinking_end:
+            try:
+                self.on_thinking_end()
+            except Exception:
+                pass
+
+    def call_llm(
+        self,
+        role: str,
+        payload: dict,
+        temperature: float = 0.7,
+        stream: bool = False,
+        on_chunk=None,
+        cancel: CancelToken = None,
+    ) -> str:
+        """
+        调用一次 LLM，返回完整回复文本（失败返回空字符串）。
+
+        stream=True 时走 SSE 流式接口：每到一段增量文本就调用 on_chunk(delta)，
+        最终仍然返回拼好的完整文本。已经吐出过内容后就不再重试，
+        以免 UI 上出现重复的半句话。
+
+        cancel：可以从别的线程 cancel() 掐断这次调用（正在等的请求立刻断开，不再重试），
+        被取消时返回空字符串，不计入熔断。
+        """
+        tracer = self.tracer
+        with tracer.span(f"llm:{role}") if tracer is not None else nullcontext() as span:
+            return self._call_llm(role, payload, temperature, stream, on_chunk, span, cancel)
+
+    def _call_llm(
+        self,
+        role: str,
+        payload: dict,
+        temperature: float,
+        stream: bool,
+        on_chunk,
+        span,
+        cancel: CancelToken = None,
+    ) -> str:
+        if self.min_interval > 0:
+            with self._call_lock:
+                wait = self.min_interval - (time.time() - self._last_call_end_ts)
             if wait > 0:
                 time.sleep(wait)
 
-            # 1）构造 system / user prompt
-            override_system = payload.get("system_prompt")
-            if override_system is None:
-                system_prompt = self.role_prompts.get(role, "你是一个中文 AI 助手。")
-            else:
-                system_prompt = override_system
+        # 1）构造 system / user prompt
+        override_system = payload.get("system_prompt")
+        if override_system is None:
+            system_prompt = self.role_prompts.get(role, "你是一个中文 AI 助手。")
+        else:
+            system_prompt = override_system
 
-            user_prompt = json.dumps(payload, ensure_ascii=False)
+        payload = self.token_budget.fit(role, payload, system_prompt)
+        user_prompt = self.context_builder.dumps(payload)
 
-            # 2）重复请求去重（这里还不灭灯）
-            last_req_str = self._last_req_str_by_role.get(role)
+        # 2）可缓存的 role 先查缓存：命中直接返回上次的回复，不点灯、不走网络
+        cache_ttl = 0.0 if stream else self.cache_roles.get(role, 0.0)
+        cache_key = None
+        if cache_ttl > 0:
+            cache_key = ResponseCache.make_key(role, system_prompt, user_prompt, temperature, self.model)
+            cached = self.response_cache.get(cache_key, role)
+            if cached is not None:
+                self.telemetry.record({"role": role, "outcome": "cache_hit", "attempts": 0})
+                if span is not None:
+                    span.set(outcome="cache_hit")
+                return cached
+        else:
+            # 不缓存的 role 仍保留原来的重复请求去重（这里还不灭灯）
             cur_req_str = system_prompt + "\n" + user_prompt
-            if last_req_str == cur_req_str:
-                # 完全重复的请求，直接返回空，不触发思考状态
-                return ""
-
-            self._last_req_str_by_role[role] = cur_req_str
-
-            messages = [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt},
-            ]
-
-            # 3）真正开始调用 LLM：在这里点亮“思考中（OFF灯）”
-            if hasattr(self, "on_thinking_start") and self.on_thinking_start:
-                try:
-                    self.on_thinking_start()
-                except Exception:
-                    # UI 回调出错不能影响主流程
-                    pass
-
-            last_error = None
-            final_reply = ""
+            with self._call_lock:
+                last_req_str = self._last_req_str_by_role.get(role)
+                if last_req_str == cur_req_str:
+                    # 完全重复的请求，直接返回空，不触发思考状态
+                    self.telemetry.record({"role": role, "outcome": "dedupe", "attempts": 0})
+                    if span is not None:
+                        span.set(outcome="dedupe")
+                    return ""
+                self._last_req_str_by_role[role] = cur_req_str
 
-            try:
-                # 4）网络请求 + 最多 3 次重试
-                for attempt in range(3):
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt},
+        ]
+
+        last_error = None
+        final_reply = ""
+        attempts = 0
+        errors = []
+        meta = {}
+        outcome = "ok"
+        queue_wait = 0.0
+        backoff_s = 0.0
+        started = None
+        latency_ms = 0
+
+        try:
+            while True:
+                if cancel is not None and cancel.cancelled:
+                    outcome = "cancelled"
+                    break
+                # 熔断中：不排队、不发请求，直接返回空串走兜底
+                if not self.circuit_breaker.allow():
+                    outcome = "circuit_open"
+                    break
+                # 3）每次尝试都重新拿并发名额：退避等待时名额已经还回去了，不挡别人
+                with self.limiter.slot(role) as waited:
+                    queue_wait += waited
+                    if started is None:
+                        # 第一次拿到名额才真正开始调用 LLM：在这里点亮“思考中（OFF灯）”
+                        self._thinking_enter()
+                        started = time.time()
+                    attempts += 1
+                    parts = []
+                    meta = {}
+                    # 单次尝试的超时也不能越过该 role 的总时限
+                    timeout = self.retry_policy.attempt_timeout(role, time.time() - started, self.timeout)
                     try:
-                        req = self._build_request(messages, temperature=temperature)
-                        with urllib.request.urlopen(req, timeout=self.timeout) as resp:
-                            body = resp.read().decode("utf-8")
-                            obj = json.loads(body)
-                        content = obj["choices"][0]["message"]["content"]
-                        final_reply = content
+                        if stream:
+                            final_reply = self._request_stream(
+                                messages, temperature, on_chunk, parts, meta, timeout, cancel
+                            )
+                        elif (
+                            cancel is None
+                            and self.hedge_policy is not None
+                            and self.hedge_policy.enabled_for(role)
+                        ):
+                            # 对冲请求各自带自己的 CancelToken，调用方要能取消时就不对冲
+                            final_reply = self._request_hedged(role, messages, temperature, meta, timeout)
+                        else:
+                            final_reply = self._request_once(messages, temperature, meta, cancel, timeout)
                         last_error = None
-                        break
+                    except RequestCancelled as e:
+                        last_error = e
+                        outcome = "cancelled"
                     except Exception as e:
                         last_error = e
-                        time.sleep(0.5)
-
-                # 5）写 log（只有成功才写）
-                if last_error is None and final_reply:
-                    try:
-                        engine_name = self.engine_display_name.get(role, role)
-                        if role.startswith("trigger_"):
-                            _append_trigger_log(final_reply, system_prompt, user_prompt, engine_name)
+                        errors.append(classify_error(e))
+                    finally:
+                        if outcome == "cancelled":
+                            # 调用方主动放弃：不算后端失败，只把可能占着的试探名额还回去
+                            self.circuit_breaker.release()
                         else:
-                            _append_llm_log(final_reply, system_prompt, user_prompt, engine_name)
-                    except Exception:
-                        pass
+                            self.circuit_breaker.record(last_error)
+                        if parts:
+                            # 流已经吐出一部分：保留已展示的内容，不再重试
+                            final_reply = "".join(parts)
+                            outcome = "partial"
+
+                if last_error is None or outcome in ("partial", "cancelled"):
+                    break
+                # 4）按错误类型决定要不要再试、等多久（key 错了之类的直接失败）
+                delay = self.retry_policy.next_delay(role, last_error, attempts, time.time() - started)
+                if delay is None:
+                    print(f"[LLMClient] {role} 调用失败，不再重试: {errors[-1]}（第 {attempts} 次）")
+                    break
+                backoff_s += delay
+                time.sleep(delay)
+        finally:
+            # 5）无论成功失败，都认为这轮调用结束了
+            if started is not None:
+                self._thinking_exit()
+                latency_ms = int((time.time() - started) * 1000)
+
+        if outcome == "circuit_open" and not attempts:
+            pass  # 熔断中，一次都没发出去
+        elif outcome == "cancelled":
+            final_reply = ""
+            if cache_key is None:
+                # 被取消的请求不算“上一次请求”，同样的请求马上再发不能被去重吃掉
+                with self._call_lock:
+                    if self._last_req_str_by_role.get(role) == cur_req_str:
+                        self._last_req_str_by_role.pop(role, None)
+        elif last_error is not None and outcome != "partial":
+            outcome = errors[-1]
+        elif last_error is None and not final_reply:
+            outcome = "empty"
+        usage = meta.get("usage") or {}
+        if span is not None:
+            span.set(
+                outcome=outcome,
+                attempts=attempts,
+                queue_wait_ms=round(queue_wait * 1000, 1),
+                ttfb_ms=meta.get("ttfb_ms"),
+                tokens_in=usage.get("prompt_tokens", 0),
+                tokens_out=usage.get("completion_tokens", 0),
+            )
+        self.telemetry.record({
+            "role": role,
+            "outcome": outcome,
+            "attempts": attempts,
+            "errors": errors,
+            "stream": bool(stream),
+            "queue_wait_ms": round(queue_wait * 1000, 1),
+            "connect_ms": meta.get("connect_ms"),
+            "ttfb_ms": meta.get("ttfb_ms"),
+            "first_token_ms": meta.get("first_token_ms"),
+            "total_ms": latency_ms,
+            "backoff_ms": round(backoff_s * 1000, 1),
+            "reused_conn": meta.get("reused"),
+            "hedged": meta.get("hedged", False),
+            "prompt_tokens": usage.get("prompt_tokens", 0),
+            "completion_tokens": usage.get("completion_tokens", 0),
+        })
+
+        # 6）写缓存 + 写 log（只有成功才写）
+        if last_error is None and final_reply and cache_key is not None:
+            self.response_cache.put(cache_key, final_reply, cache_ttl, role)
+
+        if last_error is None and final_reply:
+            try:
+                engine_name = self.engine_display_name.get(role, role)
+                now = time.time()
+                # ts 由 PromptLogStore.write_many 持锁分配，保证和写入顺序一致
+                self.log_sink.submit("store", {
+                    "time": datetime.datetime.fromtimestamp(now).strftime("%Y-%m-%d %H:%M:%S"),
+                    "role": role,
+                    "engine": engine_name,
+                    "latency_ms": latency_ms,
+                    "attempts": attempts,
+                    "stream": bool(stream),
+                    "prompt_tokens_est": estimate_tokens(system_prompt) + estimate_tokens(user_prompt),
+                    "reply_tokens_est": estimate_tokens(final_reply),
+                    "prompt_tokens": usage.get("prompt_tokens"),
+                    "completion_tokens": usage.get("completion_tokens"),
+                    "system_prompt": system_prompt,
+                    "user": user_prompt,
+                    "reply": final_reply,
+                })
+                if self.text_log:
+                    if role.startswith("trigger_"):
+                        _append_trigger_log(self.log_sink, final_reply, system_prompt, user_prompt, engine_name)
+                    else:
+                        _append_llm_log(self.log_sink, final_reply, system_prompt, user_prompt, engine_name)
+            except Exception:
+                pass
+
+        return final_reply or ""
 
+    def telemetry_summary(self) -> str:
+        """按 role 汇总的调用耗时 / 重试 / token 文本表。"""
+        return self.telemetry.format_summary()
+
+    def backend_status(self) -> dict:
+        """熔断器状态（closed / open / half_open）和短路、试探次数。"""
+        return self.circuit_breaker.summary()
+
+    def cache_stats(self) -> dict:
+        """回复缓存的命中 / 未命中统计。"""
+        return self.response_cache.summary()
+
+    def close(self):
+        """退出前调用：缓存落盘，日志写完，埋点汇总落盘，关闭空闲连接。"""
+        self.response_cache.save()
+        self.log_sink.close()
+        if self.telemetry_path:
+            self.telemetry.dump(self.telemetry_path)
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.close()
+            if self._hedge_executor is not None:
+                self._hedge_executor.shutdown(wait=False)
+                self._hedge_executor = None
+
+    def stream_llm(self, role: str, payload: dict, temperature: float = 0.7):
+        """
+        生成器版本的流式调用：
+            for delta in client.stream_llm("persona_slow", payload):
+                ...
+        内部在后台线程里跑 call_llm(stream=True)，把增量文本逐段 yield 出来。
+        """
+        q = queue.Queue()
+        done = object()
+        # 后台线程沿用当前上下文，LLM span 仍然挂在调用方这一轮下面
+        ctx = contextvars.copy_context()
+
+        def _run():
+            try:
+                self.call_llm(role, payload, temperature=temperature, stream=True, on_chunk=q.put)
             finally:
-                # 6）无论成功失败，都认为这轮调用结束了
-                self._last_call_end_ts = time.time()
-                if hasattr(self, "on_thinking_end") and self.on_thinking_end:
-                    try:
-                        self.on_thinking_end()
-                    except Exception:
-                        pass
+                q.put(done)
 
-            return final_reply or ""
+        threading.Thread(target=ctx.run, args=(_run,), daemon=True).start()
+        while True:
+            item = q.get()
+            if item is done:
+                return
+            yield item
@@ -0,0 +1,72 @@
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+
+class ConcurrencyLimiter:
+    """
+    LLM 请求并发闸门：
+
+    - 全局最多 max_in_flight 个请求同时在网络上；
+    - 每个 role 可以单独再限一层（例如观点树生成同一时间只跑 1 个）；
+    - 没有单独配置的 role，只受全局上限约束。
+
+    先拿 role 名额、再拿全局名额，避免“排队等 role 的请求”白白占着全局名额。
+    """
+
+    def __init__(self, max_in_flight: int = 4, role_limits: Optional[Dict[str, int]] = None):
+        self.max_in_flight = max(1, int(max_in_flight))
+        self.role_limits: Dict[str, int] = dict(role_limits or {})
+
+        self._global_sem = threading.BoundedSemaphore(self.max_in_flight)
+        self._role_sems: Dict[str, threading.BoundedSemaphore] = {}
+        self._lock = threading.Lock()
+
+        # 简单计数，方便排查“谁在占着名额”
+        self._in_flight_by_role: Dict[str, int] = {}
+
+    def _get_role_sem(self, role: str):
+        limit = self.role_limits.get(role)
+        if not limit:
+            return None
+        with self._lock:
+            sem = self._role_sems.get(role)
+            if sem is None:
+                sem = threading.BoundedSemaphore(max(1, int(limit)))
+                self._role_sems[role] = sem
+            return sem
+
+    @contextmanager
+    def slot(self, role: str):
+        """
+        占用一个请求名额，yield 出排队等待的秒数。
+
+        用法：
+            with limiter.slot("trigger_should_speak") as waited:
+                ...
+        """
+        t0 = time.time()
+        role_sem = self._get_role_sem(role)
+        if role_sem is not None:
+            role_sem.acquire()
+        try:
+            self._global_sem.acquire()
+            try:
+                with self._lock:
+                    self._in_flight_by_role[role] = self._in_flight_by_role.get(role, 0) + 1
+                try:
+                    yield time.time() - t0
+                finally:
+                    with self._lock:
+                        self._in_flight_by_role[role] = max(0, self._in_flight_by_role.get(role, 1) - 1)
+            finally:
+                self._global_sem.release()
+        finally:
+            if role_sem is not None:
+                role_sem.release()
+
+    def in_flight(self) -> Dict[str, int]:
+        """返回当前各 role 正在进行中的请求数（只含非 0 项）。"""
+        with self._lock:
+            return {k: v for k, v in self._in_flight_by_role.items() if v > 0}
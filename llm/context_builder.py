@@ -0,0 +1,115 @@
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Tuple
+
+# 和 json.dumps(obj, ensure_ascii=False) 完全同样的输出
+_encode = json.JSONEncoder(ensure_ascii=False).encode
+
+
+class ContextBuilder:
+    """
+    user prompt 的增量拼装器：
+
+    原来每次调用都对整个 payload 做一次 json.dumps，
+    最近 30 条对话、snapshot、整棵观点树每轮都从头序列化。
+    这里把 payload 拆成片段，各自缓存序列化结果，只重算变化的部分：
+
+    - 版本化的大对象（观点树）：register_source 注册 “取对象 / 取版本号” 两个函数，
+      对象本身 + 版本号没变就直接复用上次的整段 JSON，树再大也只在变化时序列化一次；
+    - 列表里的扁平对话行（值全是字符串的 dict，例如 history 的每一条）：
+      按内容缓存每一行的 JSON，新一轮只需要序列化新增的那几行；
+    - 其他字段（snapshot、user_text 等）照常序列化。
+
+    拼出来的字符串和 json.dumps(payload, ensure_ascii=False) 逐字节一致，
+    所以日志、回复缓存的 key 都不受影响。
+    """
+
+    def __init__(self, max_fragments: int = 1024):
+        self.max_fragments = max(1, int(max_fragments))
+        self._lines: "OrderedDict[Tuple, str]" = OrderedDict()
+        # name -> (取对象函数, 取版本号函数)
+        self._sources: Dict[str, Tuple[Callable[[], Any], Callable[[], int]]] = {}
+        # name -> (对象 id, 版本号, 序列化结果)
+        self._source_cache: Dict[str, Tuple[int, int, str]] = {}
+        self._lock = threading.Lock()
+        self.stats = {"line_hits": 0, "line_misses": 0, "source_hits": 0, "source_misses": 0}
+
+    def register_source(self, name: str, get_obj: Callable[[], Any], get_version: Callable[[], int]):
+        """
+        注册一个版本化对象。payload 里出现的值如果正是 get_obj() 返回的那个对象，
+        就按 get_version() 判断能否复用缓存。对象每次改动都必须让版本号变化。
+        """
+        with self._lock:
+            self._sources[name] = (get_obj, get_version)
+            self._source_cache.pop(name, None)
+
+    # === 序列化 ===
+    def dumps(self, payload: Any) -> str:
+        if not isinstance(payload, dict) or not all(type(k) is str for k in payload):
+            return _encode(payload)
+        # 所有片段最后只 join 一次：大片段（整棵树）只拷贝一遍
+        parts = ["{"]
+        for key, value in payload.items():
+            if len(parts) > 1:
+                parts.append(", ")
+            parts.append(_encode(key))
+            parts.append(": ")
+            parts.append(self._fragment(value))
+        parts.append("}")
+        return "".join(parts)
+
+    def _fragment(self, value: Any) -> str:
+        if isinstance(value, dict) and self._sources:
+            frag = self._source_fragment(value)
+            if frag is not None:
+                return frag
+        if type(value) is list:
+            return "[" + ", ".join(self._line_fragment(item) for item in value) + "]"
+        return _encode(value)
+
+    def _source_fragment(self, value: Dict[str, Any]):
+        with self._lock:
+            sources = list(self._sources.items())
+        for name, (get_obj, get_version) in sources:
+            try:
+                if get_obj() is not value:
+                    continue
+                version = get_version()
+            except Exception:
+                continue
+
+            with self._lock:
+                cached = self._source_cache.get(name)
+                if cached is not None and cached[0] == id(value) and cached[1] == version:
+                    self.stats["source_hits"] += 1
+                    return cached[2]
+                self.stats["source_misses"] += 1
+            frag = _encode(value)
+            with self._lock:
+                self._source_cache[name] = (id(value), version, frag)
+            return frag
+        return None
+
+    def _line_fragment(self, item: Any) -> str:
+        # 只缓存“扁平对话行”：键、值都是 str，内容本身就是缓存 key，不怕被原地修改
+        if type(item) is not dict:
+            return _encode(item)
+        for k, v in item.items():
+            if type(k) is not str or type(v) is not str:
+                return _encode(item)
+
+        key = tuple(item.items())
+        # 命中路径不加锁（单次 dict 读取本身是原子的），淘汰按写入先后
+        frag = self._lines.get(key)
+        if frag is not None:
+            self.stats["line_hits"] += 1
+            return frag
+
+        frag = _encode(item)
+        with self._lock:
+            self.stats["line_misses"] += 1
+            self._lines[key] = frag
+            while len(self._lines) > self.max_fragments:
+                self._lines.popitem(last=False)
+        return frag
@@ -0,0 +1,87 @@
+import threading
+from typing import Dict, Iterable, Optional
+
+from llm.telemetry import Telemetry
+
+# 默认只对关键路径上的小触发器对冲：每轮必经、输出很短、重复请求成本低
+DEFAULT_HEDGE_ROLES = ("trigger_should_speak", "trigger_select_engine")
+
+
+class HedgePolicy:
+    """
+    对冲请求（hedged request）策略：
+
+    - 只对 roles 里的 role 生效（需要显式开启）；
+    - 主请求发出后超过“该 role 历史首字节耗时的 p{percentile}”还没回来，
+      就再发一个一模一样的请求，谁先成功用谁，另一个直接掐断；
+    - 历史样本不足 min_samples 时用 default_delay，算出来的延迟夹在 [min_delay, max_delay]；
+    - 额外请求量用令牌桶封顶：每个主请求攒 budget_ratio 个令牌（最多攒 burst 个），
+      每发一次对冲花 1 个，长期看对冲请求不超过主请求的 budget_ratio。
+    """
+
+    def __init__(
+        self,
+        roles: Iterable[str] = DEFAULT_HEDGE_ROLES,
+        percentile: float = 90.0,
+        metric: str = "ttfb_ms",
+        min_samples: int = 20,
+        default_delay: float = 1.5,
+        min_delay: float = 0.1,
+        max_delay: float = 10.0,
+        budget_ratio: float = 0.1,
+        burst: float = 3.0,
+    ):
+        self.roles = frozenset(roles)
+        self.percentile = percentile
+        self.metric = metric
+        self.min_samples = min_samples
+        self.default_delay = default_delay
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.budget_ratio = budget_ratio
+        self.burst = burst
+
+        self._lock = threading.Lock()
+        self._tokens = burst
+        self.stats: Dict[str, int] = {
+            "primary": 0,       # 走了对冲逻辑的主请求数
+            "hedged": 0,        # 实际发出的对冲请求数
+            "hedge_won": 0,     # 对冲请求先回来
+            "primary_won": 0,   # 发了对冲但主请求先回来
+            "no_budget": 0,     # 该对冲但令牌不够
+        }
+
+    def enabled_for(self, role: str) -> bool:
+        return role in self.roles
+
+    def delay_for(self, role: str, telemetry: Optional[Telemetry]) -> float:
+        """主请求发出多少秒后还没回来就对冲。"""
+        delay = self.default_delay
+        if telemetry is not None and telemetry.sample_count(role, self.metric) >= self.min_samples:
+            delay = telemetry.percentile(role, self.metric, self.percentile) / 1000.0
+        return min(self.max_delay, max(self.min_delay, delay))
+
+    def on_primary(self):
+        with self._lock:
+            self.stats["primary"] += 1
+            self._tokens = min(self.burst, self._tokens + self.budget_ratio)
+
+    def try_acquire(self) -> bool:
+        """要发对冲请求前调用：令牌够就扣掉并返回 True。"""
+        with self._lock:
+            if self._tokens < 1.0:
+                self.stats["no_budget"] += 1
+                return False
+            self._tokens -= 1.0
+            self.stats["hedged"] += 1
+            return True
+
+    def on_result(self, hedge_won: bool):
+        with self._lock:
+            self.stats["hedge_won" if hedge_won else "primary_won"] += 1
+
+    def summary(self) -> Dict[str, float]:
+        with self._lock:
+            data: Dict[str, float] = dict(self.stats)
+            data["tokens"] = round(self._tokens, 2)
+        return data
@@ -0,0 +1,322 @@
+import http.client
+import select
+import socket
+import threading
+import time
+import urllib.parse
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+
+class HTTPStatusError(Exception):
+    """服务端返回了非 2xx 状态码（body 已经读完，连接可以继续复用）。"""
+
+    def __init__(self, status: int, reason: str, headers: Dict[str, str], body: bytes):
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self.body = body
+        super().__init__(f"HTTP {status} {reason}")
+
+
+class RequestCancelled(Exception):
+    """请求被 CancelToken.cancel() 掐断了。"""
+
+
+class CancelToken:
+    """
+    从别的线程取消一个正在进行的请求：cancel() 直接 shutdown 它的 socket，
+    阻塞在读响应上的线程会立刻出错返回，连接随之丢弃。
+    请求结束（连接放回池子 / 丢弃）时会自动解绑，之后再 cancel() 不会误伤复用这条连接的别的请求。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._conn: Optional[http.client.HTTPConnection] = None
+        self.cancelled = False
+
+    def _bind(self, conn: http.client.HTTPConnection) -> bool:
+        with self._lock:
+            if self.cancelled:
+                return False
+            self._conn = conn
+            return True
+
+    def _detach(self):
+        with self._lock:
+            self._conn = None
+
+    def cancel(self):
+        with self._lock:
+            self.cancelled = True
+            conn, self._conn = self._conn, None
+        sock = conn.sock if conn is not None else None
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+
+# 复用旧连接时可能遇到的“对端早就断开了”类错误：换一条新连接重发一次即可
+_STALE_CONN_ERRORS = (
+    http.client.RemoteDisconnected,
+    http.client.CannotSendRequest,
+    http.client.BadStatusLine,
+    BrokenPipeError,
+    ConnectionResetError,
+    ConnectionAbortedError,
+)
+
+
+class _PooledConn:
+    def __init__(self, conn: http.client.HTTPConnection):
+        self.conn = conn
+        self.created_at = time.time()
+        self.last_used = self.created_at
+        self.uses = 0
+        self.cancel: Optional[CancelToken] = None
+
+    def detach_cancel(self):
+        if self.cancel is not None:
+            self.cancel._detach()
+            self.cancel = None
+
+
+class HTTPConnectionPool:
+    """
+    chat-completions 用的 keep-alive 连接池：
+
+    - 同一个 host 的 HTTP(S) 连接用完放回池子，下次直接复用，省掉 TCP + TLS 握手；
+    - idle_timeout：空闲太久的连接视为过期，直接丢弃（服务端多半已经关掉了）；
+    - max_size：池子里最多保留多少条空闲连接，多出来的用完就关；
+    - 取出时做一次健康检查：socket 已关闭 / 对端已发 FIN 的连接不再复用。
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        timeout: float = 60,
+        max_size: int = 4,
+        idle_timeout: float = 60.0,
+    ):
+        parsed = urllib.parse.urlsplit(base_url)
+        self.base_url = base_url
+        self.scheme = parsed.scheme or "https"
+        self.host = parsed.hostname or ""
+        self.port = parsed.port
+        self.path = parsed.path or "/"
+        if parsed.query:
+            self.path += "?" + parsed.query
+
+        self.timeout = timeout
+        self.max_size = max(1, int(max_size))
+        self.idle_timeout = idle_timeout
+
+        self._idle: List[_PooledConn] = []
+        self._lock = threading.Lock()
+
+        # 简单计数，方便确认复用率
+        self.stats = {"created": 0, "reused": 0, "discarded": 0}
+
+    # === 连接管理 ===
+    def _new_conn(self) -> _PooledConn:
+        if self.scheme == "http":
+            conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        else:
+            conn = http.client.HTTPSConnection(self.host, self.port, timeout=self.timeout)
+        with self._lock:
+            self.stats["created"] += 1
+        return _PooledConn(conn)
+
+    def _is_healthy(self, pc: _PooledConn) -> bool:
+        if time.time() - pc.last_used > self.idle_timeout:
+            return False
+        sock = pc.conn.sock
+        if sock is None:
+            return False
+        try:
+            # 空闲连接上不应该有可读数据；可读通常意味着对端已经关闭
+            readable, _, _ = select.select([sock], [], [], 0)
+            return not readable
+        except (OSError, ValueError):
+            return False
+
+    def _checkout(self) -> Tuple[_PooledConn, bool]:
+        """取一条可用连接，返回 (连接, 是否复用)。"""
+        while True:
+            with self._lock:
+                pc = self._idle.pop() if self._idle else None
+            if pc is None:
+                return self._new_conn(), False
+            if self._is_healthy(pc):
+                with self._lock:
+                    self.stats["reused"] += 1
+                return pc, True
+            self._discard(pc)
+
+    def _checkin(self, pc: _PooledConn):
+        pc.detach_cancel()
+        pc.last_used = time.time()
+        with self._lock:
+            if len(self._idle) < self.max_size:
+                self._idle.append(pc)
+                return
+        self._discard(pc)
+
+    def _discard(self, pc: _PooledConn):
+        pc.detach_cancel()
+        with self._lock:
+            self.stats["discarded"] += 1
+        try:
+            pc.conn.close()
+        except Exception:
+            pass
+
+    def close(self):
+        """关闭池子里所有空闲连接。"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for pc in idle:
+            try:
+                pc.conn.close()
+            except Exception:
+                pass
+
+    # === 请求 ===
+    def _send(
+        self,
+        body: bytes,
+        headers: Dict[str, str],
+        timings: Optional[Dict] = None,
+        cancel: Optional[CancelToken] = None,
+        timeout: Optional[float] = None,
+    ):
+        """
+        发出 POST 并拿到响应头，返回 (连接, response)。
+        复用的旧连接如果已经失效，自动换新连接重发一次（被取消的请求不重发）。
+        timeout 为这一次请求的 socket 超时（建连 / 每次读写），不传就用池子的 timeout。
+
+        timings 不为空时写入：
+            reused      是否复用了旧连接
+            connect_ms  新建连接（TCP + TLS）耗时，复用时为 0
+            ttfb_ms     从发出请求到收到响应头的耗时
+        """
+        for retry_on_stale in (True, False):
+            pc, reused = self._checkout()
+            if cancel is not None:
+                if not cancel._bind(pc.conn):
+                    self._checkin(pc)
+                    raise RequestCancelled()
+                pc.cancel = cancel
+            try:
+                self._set_timeout(pc, timeout)
+                connect_ms = 0.0
+                if not reused:
+                    # 显式先连上，才能把握手时间和首字节时间分开
+                    t0 = time.perf_counter()
+                    pc.conn.connect()
+                    connect_ms = (time.perf_counter() - t0) * 1000
+                if cancel is not None and cancel.cancelled:
+                    raise RequestCancelled()
+                t1 = time.perf_counter()
+                pc.conn.request("POST", self.path, body=body, headers=headers)
+                resp = pc.conn.getresponse()
+                if timings is not None:
+                    timings["reused"] = reused
+                    timings["connect_ms"] = round(connect_ms, 1)
+                    timings["ttfb_ms"] = round((time.perf_counter() - t1) * 1000, 1)
+                    timings["status"] = resp.status
+            except _STALE_CONN_ERRORS:
+                self._discard(pc)
+                if cancel is not None and cancel.cancelled:
+                    raise RequestCancelled()
+                if reused and retry_on_stale:
+                    continue
+                raise
+            except BaseException:
+                self._discard(pc)
+                if cancel is not None and cancel.cancelled:
+                    raise RequestCancelled()
+                raise
+            return pc, resp
+
+        raise RuntimeError("unreachable")
+
+    def _set_timeout(self, pc: _PooledConn, timeout: Optional[float]):
+        """每次请求前重设超时：复用的连接可能还带着上一个请求的短超时。"""
+        t = self.timeout if timeout is None else timeout
+        pc.conn.timeout = t
+        if pc.conn.sock is not None:
+            pc.conn.sock.settimeout(t)
+
+    def _release(self, pc: _PooledConn, resp):
+        pc.uses += 1
+        if resp.will_close:
+            self._discard(pc)
+        else:
+            self._checkin(pc)
+
+    def _raise_for_status(self, pc: _PooledConn, resp):
+        if 200 <= resp.status < 300:
+            return
+        try:
+            data = resp.read()
+        except BaseException:
+            self._discard(pc)
+            raise
+        self._release(pc, resp)
+        raise HTTPStatusError(resp.status, resp.reason, dict(resp.getheaders()), data)
+
+    def post(
+        self,
+        body: bytes,
+        headers: Dict[str, str],
+        timings: Optional[Dict] = None,
+        cancel: Optional[CancelToken] = None,
+        timeout: Optional[float] = None,
+    ) -> bytes:
+        """
+        POST 到 base_url，返回完整 body。
+        - 非 2xx 抛 HTTPStatusError；
+        - timings / timeout 见 _send；
+        - cancel：可以从别的线程掐断这次请求，被掐断时抛 RequestCancelled。
+        """
+        pc, resp = self._send(body, headers, timings, cancel, timeout)
+        self._raise_for_status(pc, resp)
+        try:
+            data = resp.read()
+        except BaseException:
+            self._discard(pc)
+            if cancel is not None and cancel.cancelled:
+                raise RequestCancelled()
+            raise
+        self._release(pc, resp)
+        return data
+
+    @contextmanager
+    def stream(
+        self,
+        body: bytes,
+        headers: Dict[str, str],
+        timings: Optional[Dict] = None,
+        timeout: Optional[float] = None,
+        cancel: Optional[CancelToken] = None,
+    ):
+        """
+        流式 POST：yield 出 response，调用方自己逐行读取（SSE）。
+        - 非 2xx 直接抛 HTTPStatusError，不进入 with 块；
+        - 正常读完后把剩余 body 读干净，连接放回池子；中途出错则丢弃连接；
+        - timings / timeout 见 _send，cancel 同 post。
+        """
+        pc, resp = self._send(body, headers, timings, cancel, timeout)
+        self._raise_for_status(pc, resp)
+        try:
+            yield resp
+            resp.read()
+        except BaseException:
+            self._discard(pc)
+            if cancel is not None and cancel.cancelled:
+                raise RequestCancelled()
+            raise
+        self._release(pc, resp)
@@ -0,0 +1,231 @@
+import datetime
+import gzip
+import os
+import queue
+import shutil
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+
+class RotatingLogWriter:
+    """
+    追加写一个文本日志，按大小 / 时间轮转：
+
+    - 当前文件超过 max_bytes，或者从创建起超过 max_age_s，就把它改名成
+      <文件名>.<时间戳>，再新开一个空文件继续写；
+    - compress=True 时轮转出去的旧文件压成 .gz；
+    - 最多保留 backup_count 个旧文件，更早的删掉。
+
+    只应在单个线程里使用（AsyncLogSink 的后台线程）。
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_bytes: int = 5 * 1024 * 1024,
+        max_age_s: Optional[float] = 24 * 3600,
+        backup_count: int = 5,
+        compress: bool = True,
+    ):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age_s = max_age_s
+        self.backup_count = max(0, int(backup_count))
+        self.compress = compress
+        self._opened_at: Optional[float] = None
+
+    def _file_started_at(self) -> float:
+        if self._opened_at is None:
+            try:
+                self._opened_at = os.path.getmtime(self.path) if os.path.exists(self.path) else time.time()
+            except OSError:
+                self._opened_at = time.time()
+        return self._opened_at
+
+    def _need_rotate(self, incoming: int) -> bool:
+        try:
+            size = os.path.getsize(self.path)
+        except OSError:
+            return False
+        if size == 0:
+            return False
+        if self.max_bytes and size + incoming > self.max_bytes:
+            return True
+        if self.max_age_s and time.time() - self._file_started_at() > self.max_age_s:
+            return True
+        return False
+
+    def rotate(self):
+        if not os.path.exists(self.path):
+            return
+        stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+        rotated = f"{self.path}.{stamp}"
+        n = 1
+        while os.path.exists(rotated) or os.path.exists(rotated + ".gz"):
+            rotated = f"{self.path}.{stamp}-{n}"
+            n += 1
+        os.replace(self.path, rotated)
+        self._opened_at = time.time()
+
+        if self.compress:
+            try:
+                with open(rotated, "rb") as src, gzip.open(rotated + ".gz", "wb") as dst:
+                    shutil.copyfileobj(src, dst)
+                os.remove(rotated)
+            except Exception as e:
+                print("[LogSink] 压缩旧日志失败，保留原文件:", rotated, e)
+        self._prune()
+
+    def _prune(self):
+        folder = os.path.dirname(self.path) or "."
+        prefix = os.path.basename(self.path) + "."
+        try:
+            backups = [
+                os.path.join(folder, name) for name in os.listdir(folder)
+                if name.startswith(prefix) and not name.endswith(".tmp")
+            ]
+            # 按修改时间从旧到新（同一秒内轮转多次时文件名排序不可靠）
+            backups.sort(key=lambda p: (os.path.getmtime(p), p))
+        except OSError:
+            return
+        for path in backups[: max(0, len(backups) - self.backup_count)]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def write(self, text: str):
+        data = text.encode("utf-8")
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        if self._need_rotate(len(data)):
+            self.rotate()
+        with open(self.path, "ab") as f:
+            f.write(data)
+
+    def write_many(self, texts: List[str]):
+        self.write("".join(texts))
+
+
+class AsyncLogSink:
+    """
+    后台日志线程：
+
+    - submit(key, item)：只往有界队列里放一下就返回，不碰磁盘；
+      队列满了直接丢弃这条（记到 stats["dropped"]），宁可少一条日志也不拖慢 LLM 调用；
+    - 后台线程攒一批（最多 batch_size 条 / 最多等 flush_interval 秒）后，
+      按 key 分组，整组交给对应 writer 的 write_many(items) 一次写完
+      （RotatingLogWriter 收文本，PromptLogStore 收结构化记录）；
+    - flush() 等当前队列写完，close() 写完并停掉线程（之后再 submit 会自动重启）。
+    """
+
+    def __init__(self, max_queue: int = 1000, batch_size: int = 64, flush_interval: float = 0.5):
+        self.batch_size = max(1, int(batch_size))
+        self.flush_interval = flush_interval
+        self._queue: "queue.Queue[Optional[Tuple[str, Any]]]" = queue.Queue(maxsize=max_queue)
+        # key -> 带 write_many(items) 方法的 writer
+        self._writers: Dict[str, Any] = {}
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.stats = {"submitted": 0, "written": 0, "dropped": 0, "batches": 0, "errors": 0}
+
+    def register_writer(self, key: str, writer: Any):
+        with self._lock:
+            self._writers[key] = writer
+
+    def _ensure_worker(self):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._worker_loop, name="zaio-log-sink", daemon=True)
+            self._thread.start()
+
+    def submit(self, key: str, item: Any) -> bool:
+        self._ensure_worker()
+        try:
+            self._queue.put_nowait((key, item))
+        except queue.Full:
+            with self._lock:
+                self.stats["dropped"] += 1
+            return False
+        with self._lock:
+            self.stats["submitted"] += 1
+        return True
+
+    def _worker_loop(self):
+        while True:
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+
+            batch: List[Tuple[str, Any]] = []
+            stop = item is None
+            if not stop:
+                batch.append(item)
+            deadline = time.time() + self.flush_interval
+            while not stop and len(batch) < self.batch_size:
+                timeout = deadline - time.time()
+                if timeout <= 0:
+                    break
+                try:
+                    nxt = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if nxt is None:
+                    stop = True
+                    break
+                batch.append(nxt)
+
+            self._write_batch(batch)
+            for _ in range(len(batch) + (1 if stop else 0)):
+                self._queue.task_done()
+            if stop:
+                return
+
+    def _write_batch(self, batch: List[Tuple[str, Any]]):
+        if not batch:
+            return
+        grouped: Dict[str, List[Any]] = {}
+        for key, item in batch:
+            grouped.setdefault(key, []).append(item)
+
+        for key, items in grouped.items():
+            with self._lock:
+                writer = self._writers.get(key)
+            if writer is None:
+                continue
+            try:
+                writer.write_many(items)
+                with self._lock:
+                    self.stats["written"] += len(items)
+            except Exception as e:
+                with self._lock:
+                    self.stats["errors"] += 1
+                print("[LogSink] 写日志失败:", key, e)
+        with self._lock:
+            self.stats["batches"] += 1
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """等队列里已提交的日志全部写完；超时返回 False。"""
+        deadline = time.time() + timeout
+        while self._queue.unfinished_tasks:
+            if time.time() > deadline:
+                return False
+            with self._lock:
+                alive = self._thread is not None and self._thread.is_alive()
+            if not alive:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def close(self, timeout: float = 5.0):
+        with self._lock:
+            thread = self._thread
+        if thread is None or not thread.is_alive():
+            return
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            return
+        thread.join(timeout)
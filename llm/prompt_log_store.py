@@ -0,0 +1,288 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from heapq import merge
+from itertools import islice
+from typing import Any, Dict, List, Optional, Tuple
+
+
+class PromptLogStore:
+    """
+    结构化的 LLM 调用日志（替代原来的纯文本 prompt 日志）：
+
+    目录结构（默认 data/prompt_logs/store/）：
+        prompts.jsonl          ← system prompt 按 hash 只存一次：{"hash", "text"}
+        calls-000001.jsonl     ← 调用记录分段追加，单段超过 max_segment_bytes 就换下一段
+        index.jsonl            ← 每条记录一行：[ts, role, 段号, 偏移, 长度]
+
+    调用记录字段：
+        ts / time / role / engine / latency_ms / attempts / stream /
+        prompt_tokens_est / reply_tokens_est / system_hash / user / reply
+
+    - 启动时只把 index 读进内存（几十字节一条），按 role 另建一份位置表（位置递增，天然有序）；
+    - ts 在 write_many 里持锁分配（单调不减），所以位置顺序就是时间顺序，时间范围可以直接二分；
+    - query() 在内存索引里按 role / 时间二分出范围，从各 role 位置表的尾部往前合并，
+      只走 skip + limit 条，再按偏移 seek 读出需要的那几条，
+      耗时只和页大小有关，和日志总条数无关；
+    - 超过 max_segments 的旧分段整段删除，索引里指向它们的条目一起丢掉。
+
+    写入由 AsyncLogSink 的后台线程调用 write_many()，查询可以在任意线程。
+    """
+
+    PROMPTS_FILE = "prompts.jsonl"
+    INDEX_FILE = "index.jsonl"
+
+    def __init__(self, root_dir: str, max_segment_bytes: int = 8 * 1024 * 1024, max_segments: int = 20):
+        self.root_dir = root_dir
+        self.max_segment_bytes = max_segment_bytes
+        self.max_segments = max(1, int(max_segments))
+
+        self._lock = threading.RLock()
+        self._prompts: Dict[str, str] = {}
+        # 内存索引：按写入顺序（也就是时间顺序）排列
+        self._index: List[Tuple[float, str, int, int, int]] = []
+        self._ts: List[float] = []
+        self._by_role: Dict[str, List[int]] = {}
+        self._segment = 1
+
+        self._load()
+
+    # === 路径 ===
+    def _segment_path(self, seg: int) -> str:
+        return os.path.join(self.root_dir, f"calls-{seg:06d}.jsonl")
+
+    def _existing_segments(self) -> List[int]:
+        segs = []
+        try:
+            for name in os.listdir(self.root_dir):
+                if name.startswith("calls-") and name.endswith(".jsonl"):
+                    try:
+                        segs.append(int(name[len("calls-"):-len(".jsonl")]))
+                    except ValueError:
+                        continue
+        except OSError:
+            pass
+        return sorted(segs)
+
+    # === 启动加载 ===
+    def _load(self):
+        with self._lock:
+            self._prompts.clear()
+            self._index = []
+            self._ts = []
+            self._by_role = {}
+
+            prompts_path = os.path.join(self.root_dir, self.PROMPTS_FILE)
+            if os.path.exists(prompts_path):
+                try:
+                    with open(prompts_path, "r", encoding="utf-8") as f:
+                        for line in f:
+                            try:
+                                obj = json.loads(line)
+                                self._prompts[obj["hash"]] = obj["text"]
+                            except Exception:
+                                continue
+                except Exception as e:
+                    print("[PromptLogStore] 读取 prompts 失败:", e)
+
+            segs = self._existing_segments()
+            alive = set(segs)
+            self._segment = segs[-1] if segs else 1
+
+            index_path = os.path.join(self.root_dir, self.INDEX_FILE)
+            if os.path.exists(index_path):
+                try:
+                    with open(index_path, "r", encoding="utf-8") as f:
+                        for line in f:
+                            try:
+                                ts, role, seg, offset, length = json.loads(line)
+                            except Exception:
+                                continue
+                            if seg in alive:
+                                self._add_to_index((float(ts), role, int(seg), int(offset), int(length)))
+                except Exception as e:
+                    print("[PromptLogStore] 读取 index 失败:", e)
+
+    def _add_to_index(self, entry: Tuple[float, str, int, int, int]):
+        pos = len(self._index)
+        self._index.append(entry)
+        self._ts.append(entry[0])
+        self._by_role.setdefault(entry[1], []).append(pos)
+
+    # === 写入 ===
+    @staticmethod
+    def prompt_hash(text: str) -> str:
+        return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+    def write_many(self, records: List[Dict[str, Any]]):
+        """
+        records 里每条可以带 "system_prompt" 原文，这里换成 system_hash，
+        同一个 system prompt 只会在 prompts.jsonl 里出现一次。
+        """
+        if not records:
+            return
+        with self._lock:
+            os.makedirs(self.root_dir, exist_ok=True)
+            new_prompts: List[str] = []
+            seg_path = self._segment_path(self._segment)
+            try:
+                offset = os.path.getsize(seg_path)
+            except OSError:
+                offset = 0
+            if offset >= self.max_segment_bytes:
+                self._segment += 1
+                seg_path = self._segment_path(self._segment)
+                offset = 0
+
+            index_lines: List[str] = []
+            with open(seg_path, "ab") as seg_f:
+                for rec in records:
+                    rec = dict(rec)
+                    system_prompt = rec.pop("system_prompt", None)
+                    if system_prompt is not None:
+                        h = self.prompt_hash(system_prompt)
+                        if h not in self._prompts:
+                            self._prompts[h] = system_prompt
+                            new_prompts.append(json.dumps({"hash": h, "text": system_prompt}, ensure_ascii=False))
+                        rec["system_hash"] = h
+
+                    # ts 持锁分配且不早于上一条：并发提交时调用方各自取的时间可能乱序，
+                    # 索引的二分查找要求 ts 和写入顺序一致
+                    ts = max(time.time(), self._ts[-1] if self._ts else 0.0)
+                    rec["ts"] = ts
+                    data = (json.dumps(rec, ensure_ascii=False) + "\n").encode("utf-8")
+                    seg_f.write(data)
+                    entry = (ts, str(rec.get("role", "")), self._segment, offset, len(data))
+                    self._add_to_index(entry)
+                    index_lines.append(json.dumps(list(entry), ensure_ascii=False))
+                    offset += len(data)
+
+            # 先落 prompts 再落 index：index 指向的记录一定能查到它的 system prompt
+            if new_prompts:
+                with open(os.path.join(self.root_dir, self.PROMPTS_FILE), "a", encoding="utf-8") as f:
+                    f.write("\n".join(new_prompts) + "\n")
+            with open(os.path.join(self.root_dir, self.INDEX_FILE), "a", encoding="utf-8") as f:
+                f.write("\n".join(index_lines) + "\n")
+
+            self._prune_segments()
+
+    def _prune_segments(self):
+        segs = self._existing_segments()
+        drop = segs[: max(0, len(segs) - self.max_segments)]
+        if not drop:
+            return
+        for seg in drop:
+            try:
+                os.remove(self._segment_path(seg))
+            except OSError:
+                pass
+        # 重建索引（内存 + 文件），去掉已删除分段的条目
+        dropped = set(drop)
+        entries = [e for e in self._index if e[2] not in dropped]
+        self._index, self._ts, self._by_role = [], [], {}
+        for e in entries:
+            self._add_to_index(e)
+        index_path = os.path.join(self.root_dir, self.INDEX_FILE)
+        tmp_path = index_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for e in entries:
+                f.write(json.dumps(list(e), ensure_ascii=False) + "\n")
+        os.replace(tmp_path, index_path)
+
+    # === 查询 ===
+    def _read_entry(self, entry: Tuple[float, str, int, int, int], with_system: bool) -> Optional[Dict[str, Any]]:
+        _, _, seg, offset, length = entry
+        try:
+            with open(self._segment_path(seg), "rb") as f:
+                f.seek(offset)
+                rec = json.loads(f.read(length).decode("utf-8"))
+        except Exception:
+            return None
+        if with_system:
+            rec["system_prompt"] = self._prompts.get(rec.get("system_hash", ""), "")
+        return rec
+
+    def count(self, roles: Optional[List[str]] = None) -> int:
+        with self._lock:
+            if roles is None:
+                return len(self._index)
+            return sum(len(self._by_role.get(r, [])) for r in roles)
+
+    def roles(self) -> List[str]:
+        with self._lock:
+            return sorted(self._by_role.keys())
+
+    def query(
+        self,
+        roles: Optional[List[str]] = None,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+        limit: int = 50,
+        skip: int = 0,
+        with_system: bool = True,
+    ) -> List[Dict[str, Any]]:
+        """
+        从新到旧返回记录：
+        - roles：只要这些 role（None 表示全部）；
+        - since / until：时间范围（秒级时间戳，含 since 不含 until）；
+        - skip / limit：跳过最新的 skip 条后取 limit 条（分页用）。
+        """
+        with self._lock:
+            lo = bisect_left(self._ts, since) if since is not None else 0
+            hi = bisect_left(self._ts, until) if until is not None else len(self._ts)
+            if roles is None:
+                positions = range(hi - 1, lo - 1, -1)
+            else:
+                # 每个 role 的位置表本身有序：二分出 [lo, hi) 的范围，从尾部倒着走，多个 role 归并
+                tails = []
+                for r in set(roles):
+                    plist = self._by_role.get(r)
+                    if not plist:
+                        continue
+                    start, end = bisect_left(plist, lo), bisect_left(plist, hi)
+                    tails.append(map(plist.__getitem__, range(end - 1, start - 1, -1)))
+                positions = merge(*tails, reverse=True)
+
+            picked = [self._index[p] for p in islice(positions, max(0, skip), max(0, skip) + max(0, limit))]
+
+        result = []
+        for entry in picked:
+            rec = self._read_entry(entry, with_system)
+            if rec is not None:
+                result.append(rec)
+        return result
+
+    def clear(self):
+        """删除所有分段、prompts 和 index（例如“回到初见”）。"""
+        with self._lock:
+            if os.path.isdir(self.root_dir):
+                for name in os.listdir(self.root_dir):
+                    path = os.path.join(self.root_dir, name)
+                    if os.path.isfile(path):
+                        try:
+                            os.remove(path)
+                        except OSError as e:
+                            print("[PromptLogStore] 删除失败:", path, e)
+            self._prompts.clear()
+            self._index, self._ts, self._by_role = [], [], {}
+            self._segment = 1
+
+
+def format_record(rec: Dict[str, Any]) -> str:
+    """把一条结构化记录排成原来文本日志的样子，给 UI 查看用。"""
+    title = "TRIGGER CALL" if str(rec.get("role", "")).startswith("trigger_") else "LLM CALL"
+    return (
+        f"=== {title} ===\n"
+        f"time: {rec.get('time', '')}\n"
+        f"engine: {rec.get('engine', '')}\n"
+        f"latency: {rec.get('latency_ms', 0)} ms\n"
+        "---- SYSTEM ----\n"
+        f"{rec.get('system_prompt', '')}\n"
+        "---- USER ----\n"
+        f"{rec.get('user', '')}\n"
+        "---- REPLY ----\n"
+        f"{rec.get('reply', '')}\n"
+    )
@@ -0,0 +1,164 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+
+class ResponseCache:
+    """
+    LLM 回复缓存（LRU + TTL，按内容寻址）：
+
+    - key = hash(role, system prompt, user prompt, temperature, model)，
+      同样的输入直接拿上次算好的回复，不再走网络；
+    - 每条记录带过期时间，过期即丢；总条数超过 max_entries 时淘汰最久没用的；
+    - persist_path 不为空时，启动时从磁盘读回，写入后节流落盘（跨重启复用）；
+    - stats / role_stats 记录命中、未命中、过期、淘汰次数。
+
+    只应该给低温度、输出确定性强的触发器 role 用，具体哪些 role 由 LLMClient 配置。
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 512,
+        persist_path: Optional[str] = None,
+        save_interval: float = 5.0,
+    ):
+        self.max_entries = max(1, int(max_entries))
+        self.persist_path = persist_path
+        self.save_interval = save_interval
+
+        # key -> {"role": ..., "value": ..., "expires_at": wall-clock 秒}
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._last_save_ts = 0.0
+
+        self.stats = {"hits": 0, "misses": 0, "expired": 0, "evictions": 0, "puts": 0}
+        self.role_stats: Dict[str, Dict[str, int]] = {}
+
+        if self.persist_path:
+            self.load()
+
+    # === key ===
+    @staticmethod
+    def make_key(role: str, system_prompt: str, user_prompt: str, temperature: float, model: str) -> str:
+        h = hashlib.sha256()
+        for part in (role, model, repr(float(temperature)), system_prompt, user_prompt):
+            h.update(part.encode("utf-8"))
+            h.update(b"\x00")
+        return h.hexdigest()
+
+    def _count(self, role: str, field: str):
+        self.stats[field] += 1
+        rs = self.role_stats.setdefault(role, {"hits": 0, "misses": 0})
+        if field in rs:
+            rs[field] += 1
+
+    # === 读写 ===
+    def get(self, key: str, role: str = "") -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._count(role, "misses")
+                return None
+            if entry["expires_at"] <= now:
+                del self._entries[key]
+                self._dirty = True
+                self.stats["expired"] += 1
+                self._count(role, "misses")
+                return None
+            self._entries.move_to_end(key)
+            self._count(role, "hits")
+            return entry["value"]
+
+    def put(self, key: str, value: str, ttl: float, role: str = ""):
+        if not value or ttl <= 0:
+            return
+        with self._lock:
+            self._entries[key] = {
+                "role": role,
+                "value": value,
+                "expires_at": time.time() + ttl,
+            }
+            self._entries.move_to_end(key)
+            self.stats["puts"] += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats["evictions"] += 1
+            self._dirty = True
+            need_save = (
+                self.persist_path is not None
+                and time.time() - self._last_save_ts >= self.save_interval
+            )
+        if need_save:
+            self.save()
+
+    def clear(self):
+        """清空内存和磁盘上的缓存（例如“回到初见”）。"""
+        with self._lock:
+            self._entries.clear()
+            self._dirty = False
+        if self.persist_path and os.path.exists(self.persist_path):
+            try:
+                os.remove(self.persist_path)
+            except Exception as e:
+                print("[ResponseCache] 删除缓存文件失败:", e)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.stats)
+            stats["size"] = len(self._entries)
+            stats["roles"] = {r: dict(v) for r, v in self.role_stats.items()}
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+    # === 持久化 ===
+    def load(self):
+        if not self.persist_path or not os.path.exists(self.persist_path):
+            return
+        try:
+            with open(self.persist_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except Exception as e:
+            print("[ResponseCache] 读取缓存文件失败，忽略:", e)
+            return
+
+        now = time.time()
+        with self._lock:
+            for key, entry in (data.get("entries") or {}).items():
+                try:
+                    if float(entry["expires_at"]) > now and entry.get("value"):
+                        self._entries[key] = entry
+                except Exception:
+                    continue
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def save(self):
+        """把未过期的条目写回磁盘（先写临时文件再替换，避免写一半）。"""
+        if not self.persist_path:
+            return
+        now = time.time()
+        with self._lock:
+            if not self._dirty:
+                return
+            entries = {k: v for k, v in self._entries.items() if v["expires_at"] > now}
+            self._dirty = False
+            self._last_save_ts = now
+        try:
+            os.makedirs(os.path.dirname(self.persist_path) or ".", exist_ok=True)
+            tmp_path = self.persist_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"entries": entries}, f, ensure_ascii=False)
+            os.replace(tmp_path, self.persist_path)
+        except Exception as e:
+            print("[ResponseCache] 写入缓存文件失败:", e)
@@ -0,0 +1,177 @@
+import email.utils
+import http.client
+import random
+import socket
+import threading
+import time
+from typing import Dict, Optional
+
+from llm.http_pool import HTTPStatusError
+
+# 错误大类：决定要不要重试
+AUTH = "auth"               # 401 / 403：key 不对，重试多少次都一样
+CLIENT = "client"           # 其余 4xx：请求本身有问题
+RATE_LIMIT = "rate_limit"   # 429：等一会儿（优先听 Retry-After）
+SERVER = "server"           # 5xx：服务端临时故障
+TIMEOUT = "timeout"
+NETWORK = "network"         # 连接被拒 / 被重置 / 读到一半断了
+PARSE = "parse"             # 返回的 JSON 结构不对
+UNKNOWN = "unknown"         # 其它异常（多半是代码 bug），不重试
+
+DEFAULT_RETRYABLE = frozenset({RATE_LIMIT, SERVER, TIMEOUT, NETWORK, PARSE})
+
+# 各 role 从第一次发请求起最多折腾多久（秒）：触发器过时就没意义了，人格可以多等一会儿
+DEFAULT_ROLE_DEADLINES = {
+    "trigger_should_speak": 20.0,
+    "trigger_select_engine": 25.0,
+    "trigger_decide_turn": 25.0,
+    "trigger_state_update": 30.0,
+    "trigger_perspective_move": 30.0,
+    "perspective_generate_engine": 150.0,
+}
+
+
+def classify_error(e: Exception) -> str:
+    """把异常归成几类，方便在埋点里按结果统计（http_429 / timeout / bad_response ...）。"""
+    if isinstance(e, HTTPStatusError):
+        return f"http_{e.status}"
+    if isinstance(e, (socket.timeout, TimeoutError)):
+        return "timeout"
+    if isinstance(e, (ValueError, KeyError, IndexError, TypeError)):
+        # JSON 解析失败 / 返回结构不对
+        return "bad_response"
+    if isinstance(e, (OSError, http.client.HTTPException)):
+        return "conn_error"
+    return type(e).__name__
+
+
+def error_category(e: Exception) -> str:
+    """异常 → 错误大类（见模块开头的常量）。"""
+    if isinstance(e, HTTPStatusError):
+        if e.status in (401, 403):
+            return AUTH
+        if e.status == 429:
+            return RATE_LIMIT
+        if e.status >= 500:
+            return SERVER
+        return CLIENT
+    if isinstance(e, (socket.timeout, TimeoutError)):
+        return TIMEOUT
+    if isinstance(e, (ValueError, KeyError, IndexError, TypeError)):
+        return PARSE
+    if isinstance(e, (OSError, http.client.HTTPException)):
+        return NETWORK
+    return UNKNOWN
+
+
+def retry_after_seconds(e: Exception) -> Optional[float]:
+    """读 429 / 503 响应里的 Retry-After（秒数或 HTTP 日期），没有就返回 None。"""
+    headers = getattr(e, "headers", None)
+    if not isinstance(headers, dict):
+        return None
+    value = None
+    for key, v in headers.items():
+        if key.lower() == "retry-after":
+            value = str(v).strip()
+            break
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+        return max(0.0, when.timestamp() - time.time())
+    except Exception:
+        return None
+
+
+class RetryPolicy:
+    """
+    LLM 调用的重试策略：
+
+    - 先把异常分类：auth / client / unknown 不重试，直接失败；
+      rate_limit / server / timeout / network / parse 才重试；
+    - 等待时间：指数退避 base_delay × 2^(第几次重试-1)，上限 max_delay，
+      再做 full jitter（在 0 ~ 上限之间随机），避免一堆请求同时重试；
+    - 429 / 503 带了 Retry-After 就至少等那么久（但不超过 max_retry_after）；
+    - 每个 role 有总时限（从第一次发请求算起），等完再试会超时限的就不试了；
+      单次尝试的超时也按时限里剩下的时间收紧（attempt_timeout）。
+
+    next_delay() 只负责算“要不要再试、等多久”，真正的 sleep 由调用方在
+    释放并发名额之后再做，等待期间不占任何人的位置。
+    """
+
+    def __init__(
+        self,
+        max_attempts: int = 3,
+        base_delay: float = 0.5,
+        max_delay: float = 8.0,
+        max_retry_after: float = 30.0,
+        role_deadlines: Optional[Dict[str, float]] = None,
+        default_deadline: float = 90.0,
+        retryable=DEFAULT_RETRYABLE,
+        seed: Optional[int] = None,
+    ):
+        self.max_attempts = max(1, int(max_attempts))
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_retry_after = max_retry_after
+        self.role_deadlines = dict(DEFAULT_ROLE_DEADLINES if role_deadlines is None else role_deadlines)
+        self.default_deadline = default_deadline
+        self.retryable = frozenset(retryable)
+
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.stats: Dict[str, int] = {"retries": 0, "gave_up": 0, "fail_fast": 0, "deadline": 0}
+
+    def deadline_for(self, role: str) -> float:
+        return self.role_deadlines.get(role, self.default_deadline)
+
+    def attempt_timeout(self, role: str, elapsed: float, cap: float) -> float:
+        """
+        这一次尝试最多等多久：不超过 cap（连接池的超时），也不超过该 role 时限里剩下的时间。
+        否则单次尝试卡住时会把整个 cap 等满，时限形同虚设。
+        """
+        remaining = self.deadline_for(role) - elapsed
+        return max(0.1, min(cap, remaining))
+
+    def backoff(self, retry_index: int) -> float:
+        """第 retry_index 次重试（从 1 开始）的退避时间，带 full jitter。"""
+        cap = min(self.max_delay, self.base_delay * (2 ** max(0, retry_index - 1)))
+        with self._lock:
+            return self._rng.uniform(0.0, cap)
+
+    def _bump(self, key: str):
+        with self._lock:
+            self.stats[key] += 1
+
+    def next_delay(self, role: str, error: Exception, attempts: int, elapsed: float) -> Optional[float]:
+        """
+        第 attempts 次尝试失败后调用；elapsed 是从第一次尝试开始过了多少秒。
+        返回 None 表示别再试了，否则返回下一次尝试前要等的秒数。
+        """
+        category = error_category(error)
+        if category not in self.retryable:
+            self._bump("fail_fast")
+            return None
+        if attempts >= self.max_attempts:
+            self._bump("gave_up")
+            return None
+
+        delay = self.backoff(attempts)
+        if category in (RATE_LIMIT, SERVER):
+            hinted = retry_after_seconds(error)
+            if hinted is not None:
+                delay = max(delay, min(hinted, self.max_retry_after))
+
+        if elapsed + delay >= self.deadline_for(role):
+            self._bump("deadline")
+            return None
+        self._bump("retries")
+        return delay
+
+    def summary(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self.stats)
@@ -0,0 +1,210 @@
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional
+
+# 直方图桶上界（毫秒），大致按 2~2.5 倍递增，覆盖 1ms ~ 2min
+DEFAULT_BUCKETS_MS = (
+    1, 2, 5, 10, 25, 50, 100, 250, 500,
+    1000, 2000, 5000, 10000, 20000, 30000, 60000, 120000,
+)
+
+
+class Histogram:
+    """固定桶直方图：只记计数，内存恒定；分位数按桶内线性插值估算。"""
+
+    def __init__(self, bounds=DEFAULT_BUCKETS_MS):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)  # 最后一个桶是 +inf
+        self.count = 0
+        self.total = 0.0
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+
+    def add(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def percentile(self, p: float) -> float:
+        if not self.count:
+            return 0.0
+        rank = p / 100.0 * self.count
+        seen = 0
+        for i, c in enumerate(self.counts):
+            if not c:
+                continue
+            if seen + c >= rank:
+                lo = self.bounds[i - 1] if i > 0 else 0.0
+                hi = self.bounds[i] if i < len(self.bounds) else (self.max or lo)
+                lo = max(lo, self.min or 0.0)
+                hi = min(hi, self.max if self.max is not None else hi)
+                frac = (rank - seen) / c
+                return round(lo + (hi - lo) * frac, 1)
+            seen += c
+        return round(self.max or 0.0, 1)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "avg": round(self.total / self.count, 1) if self.count else 0.0,
+            "min": round(self.min or 0.0, 1),
+            "p50": self.percentile(50),
+            "p90": self.percentile(90),
+            "p99": self.percentile(99),
+            "max": round(self.max or 0.0, 1),
+        }
+
+
+class _RoleStats:
+    METRICS = ("queue_wait_ms", "connect_ms", "ttfb_ms", "first_token_ms", "total_ms")
+
+    def __init__(self):
+        self.hist = {m: Histogram() for m in self.METRICS}
+        self.outcomes: Dict[str, int] = {}
+        self.calls = 0
+        self.attempts = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+
+class Telemetry:
+    """
+    LLM 调用埋点：
+
+    每次 call_llm 结束（包括命中缓存 / 去重 / 失败）记一条 record：
+        role / outcome / attempts / errors
+        queue_wait_ms    等并发名额的时间
+        connect_ms       新建连接耗时（复用连接为 0）
+        ttfb_ms          发请求到收到响应头
+        first_token_ms   流式调用第一段内容到达的时间
+        total_ms         拿到名额到调用结束
+        prompt_tokens / completion_tokens   来自 API 返回的 usage 字段
+
+    - 按 role 汇总成直方图（内存恒定），最近 max_records 条原始记录放在环形缓冲里；
+    - summary() 给结构化汇总，format_summary() 给一张文本表，dump(path) 写 JSON 文件；
+    - register_status(name, fn)：别的模块（回复缓存 / 熔断器 / 事件队列……）挂一个取状态的函数，
+      dump 时一起写进文件的 status 字段。
+    """
+
+    def __init__(self, max_records: int = 500):
+        self._lock = threading.Lock()
+        self._records: deque = deque(maxlen=max_records)
+        self._roles: Dict[str, _RoleStats] = {}
+        self._status: Dict[str, Callable[[], Dict[str, Any]]] = {}
+        self.started_at = time.time()
+
+    def register_status(self, name: str, fn: Callable[[], Dict[str, Any]]):
+        with self._lock:
+            self._status[name] = fn
+
+    def status(self) -> Dict[str, Any]:
+        """各模块登记的状态快照；某一项取失败只记下错误，不影响其他项。"""
+        with self._lock:
+            providers = list(self._status.items())
+        result: Dict[str, Any] = {}
+        for name, fn in providers:
+            try:
+                result[name] = fn()
+            except Exception as e:
+                result[name] = {"error": repr(e)}
+        return result
+
+    def record(self, rec: Dict[str, Any]):
+        rec = dict(rec)
+        rec.setdefault("ts", time.time())
+        role = rec.get("role", "")
+        with self._lock:
+            self._records.append(rec)
+            st = self._roles.get(role)
+            if st is None:
+                st = self._roles[role] = _RoleStats()
+            st.calls += 1
+            st.attempts += int(rec.get("attempts", 0) or 0)
+            outcome = rec.get("outcome", "")
+            st.outcomes[outcome] = st.outcomes.get(outcome, 0) + 1
+            st.prompt_tokens += int(rec.get("prompt_tokens", 0) or 0)
+            st.completion_tokens += int(rec.get("completion_tokens", 0) or 0)
+            # 缓存命中 / 去重没有走网络，不计入延迟直方图
+            if rec.get("attempts"):
+                for metric in _RoleStats.METRICS:
+                    value = rec.get(metric)
+                    if value is not None:
+                        st.hist[metric].add(float(value))
+
+    def recent(self, limit: int = 50, role: Optional[str] = None) -> List[Dict[str, Any]]:
+        with self._lock:
+            records = list(self._records)
+        if role is not None:
+            records = [r for r in records if r.get("role") == role]
+        return records[-limit:]
+
+    def percentile(self, role: str, metric: str, p: float) -> float:
+        with self._lock:
+            st = self._roles.get(role)
+            if st is None:
+                return 0.0
+            return st.hist[metric].percentile(p)
+
+    def sample_count(self, role: str, metric: str) -> int:
+        """某个 role 某项指标已经记了多少个样本（分位数样本太少时不可信）。"""
+        with self._lock:
+            st = self._roles.get(role)
+            return st.hist[metric].count if st is not None else 0
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            roles = {}
+            for role, st in self._roles.items():
+                roles[role] = {
+                    "calls": st.calls,
+                    "attempts": st.attempts,
+                    "outcomes": dict(st.outcomes),
+                    "prompt_tokens": st.prompt_tokens,
+                    "completion_tokens": st.completion_tokens,
+                    **{m: st.hist[m].snapshot() for m in _RoleStats.METRICS},
+                }
+        return {
+            "since": self.started_at,
+            "uptime_s": round(time.time() - self.started_at, 1),
+            "roles": roles,
+        }
+
+    def format_summary(self) -> str:
+        """按总耗时（调用次数 × 平均延迟）从高到低排一张表，一眼看出谁最占时间。"""
+        summary = self.summary()["roles"]
+        rows = sorted(
+            summary.items(),
+            key=lambda kv: kv[1]["total_ms"]["avg"] * kv[1]["total_ms"]["count"],
+            reverse=True,
+        )
+        lines = [
+            f"{'role':<30}{'calls':>6}{'err':>5}{'wait p50':>10}{'ttfb p50':>10}"
+            f"{'total p50':>11}{'p90':>9}{'p99':>9}{'tok in':>9}{'tok out':>9}"
+        ]
+        for role, st in rows:
+            errors = sum(v for k, v in st["outcomes"].items() if k not in ("ok", "cache_hit", "dedupe"))
+            lines.append(
+                f"{role:<30}{st['calls']:>6}{errors:>5}"
+                f"{st['queue_wait_ms']['p50']:>10}{st['ttfb_ms']['p50']:>10}"
+                f"{st['total_ms']['p50']:>11}{st['total_ms']['p90']:>9}{st['total_ms']['p99']:>9}"
+                f"{st['prompt_tokens']:>9}{st['completion_tokens']:>9}"
+            )
+        return "\n".join(lines)
+
+    def dump(self, path: str, recent: int = 200):
+        """把汇总 + 最近若干条原始记录写成 JSON 文件。"""
+        data = self.summary()
+        data["status"] = self.status()
+        data["recent"] = self.recent(recent)
+        try:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+        except Exception as e:
+            print("[Telemetry] 写入失败:", e)
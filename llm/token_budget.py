@@ -0,0 +1,225 @@
+import json
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# DeepSeek 官方给的粗略换算：1 个中文字符 ≈ 0.6 token，1 个英文字符 ≈ 0.3 token
+CJK_TOKEN_RATIO = 0.6
+OTHER_TOKEN_RATIO = 0.3
+
+# payload 里“对话历史”类字段：超预算时从最旧的开始裁
+# 各 prompt 里的叫法：persona_fast 是 talk_his，state_update 是 history，是否说话 / 合并决策是 recent_lines
+HISTORY_FIELDS = ("talk_history", "talk_his", "history", "recent_lines")
+
+# 各 role 的 prompt 上限（system + user，估算 token）
+# system prompt 本身就不小（引擎选择约 3000、合并决策约 3800），这里给 user 部分留 2000~6000 的余量
+DEFAULT_ROLE_BUDGETS = {
+    "trigger_should_speak": 2500,
+    "trigger_select_engine": 6000,
+    "trigger_decide_turn": 7000,
+    "trigger_state_update": 4000,
+    "trigger_perspective_move": 6000,
+    "persona_fast": 5000,
+    "persona_direct": 4000,
+    "persona_deep_engine": 5000,
+    "persona_slow": 8000,
+    "persona_sum": 7000,
+}
+
+# 观点树字段：trigger_perspective_move 已经单独带了 current / previous / next 节点，
+# full_tree 是重复信息，超预算时最先压成骨架；人格引擎的树只在裁完历史还超时才压
+TREE_FIELDS_FIRST = {"trigger_perspective_move": ("full_tree",)}
+TREE_FIELDS_LAST = {"persona_slow": ("current_tree",), "persona_sum": ("current_tree",)}
+
+_dumps = json.JSONEncoder(ensure_ascii=False).encode
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    离线估算 token 数（不依赖 tokenizer）。
+    中文字符在 UTF-8 里占 3 字节、ASCII 占 1 字节，用字节数和字符数之差推出中文字符数，
+    整个过程都在 C 层完成，长文本也很快。
+    """
+    if not text:
+        return 0
+    n_chars = len(text)
+    n_bytes = len(text.encode("utf-8", errors="ignore"))
+    cjk = min(n_chars, max(0, (n_bytes - n_chars) // 2))
+    return int(cjk * CJK_TOKEN_RATIO + (n_chars - cjk) * OTHER_TOKEN_RATIO) + 1
+
+
+def compact_tree(tree: Any) -> Any:
+    """观点树压成骨架：只保留节点 id 和父子关系，去掉各节点的观点文字。"""
+    if not isinstance(tree, dict):
+        return tree
+    nodes = tree.get("nodes")
+    skeleton: Dict[str, Any] = {}
+    if isinstance(nodes, dict):
+        for nid, node in nodes.items():
+            children = node.get("children", []) if isinstance(node, dict) else []
+            skeleton[nid] = {"id": nid, "children": children}
+    return {
+        "tree_id": tree.get("tree_id", ""),
+        "root_id": tree.get("root_id", ""),
+        "current_node_id": tree.get("current_node_id", ""),
+        "nodes": skeleton,
+        "_compacted": True,
+    }
+
+
+class TokenBudget:
+    """
+    按 role 控制 prompt 大小：
+
+    1）估算 system + user prompt 的 token 数，没超预算就原样返回；
+    2）trigger_perspective_move 先把 full_tree 压成骨架；
+    3）对话历史去掉连续重复的行；
+    4）还超就从最旧的对话开始裁，被裁掉的部分合成一条本地摘要放在最前面
+       （至少保留最近 min_keep_lines 条）；
+    5）T / SUM 人格最后才压 current_tree。
+
+    只生成新的 payload，不改调用方传进来的 dict / list。
+    """
+
+    def __init__(
+        self,
+        role_budgets: Optional[Dict[str, int]] = None,
+        default_budget: int = 6000,
+        min_keep_lines: int = 4,
+        min_user_tokens: int = 1000,
+        summary_chars: int = 240,
+        dumps: Callable[[Any], str] = _dumps,
+    ):
+        self.role_budgets = dict(DEFAULT_ROLE_BUDGETS if role_budgets is None else role_budgets)
+        self.default_budget = default_budget
+        self.min_keep_lines = max(1, int(min_keep_lines))
+        self.min_user_tokens = min_user_tokens
+        self.summary_chars = summary_chars
+        self.dumps = dumps
+
+        self._lock = threading.Lock()
+        self.stats = {"checked": 0, "trimmed": 0, "over_budget": 0, "tokens_saved": 0}
+        # 按 role 记裁剪情况（次数 / 省下的 token / 最近一次裁剪前后的估算值），代替每次打印
+        self.role_stats: Dict[str, Dict[str, int]] = {}
+
+    def budget_for(self, role: str) -> int:
+        return self.role_budgets.get(role, self.default_budget)
+
+    # === 主入口 ===
+    def fit(self, role: str, payload: Dict[str, Any], system_prompt: str = "") -> Dict[str, Any]:
+        with self._lock:
+            self.stats["checked"] += 1
+        if not isinstance(payload, dict):
+            return payload
+
+        # system prompt 裁不了；就算它把预算吃光，也给 user 部分留一个保底
+        budget = max(self.min_user_tokens, self.budget_for(role) - estimate_tokens(system_prompt))
+        before = estimate_tokens(self.dumps(payload))
+        if before <= budget:
+            return payload
+
+        fitted = dict(payload)
+        sizes = {k: estimate_tokens(self.dumps(v)) for k, v in fitted.items()}
+
+        def total() -> int:
+            # 每个字段的 key 和分隔符大约几个 token，按 4 个粗估
+            return sum(sizes.values()) + 4 * len(sizes)
+
+        for field in TREE_FIELDS_FIRST.get(role, ()):
+            if total() > budget and field in fitted:
+                self._compact_field(fitted, sizes, field)
+
+        for field in HISTORY_FIELDS:
+            if total() <= budget:
+                break
+            if isinstance(fitted.get(field), list):
+                self._trim_history(fitted, sizes, field, total() - budget)
+
+        for field in TREE_FIELDS_LAST.get(role, ()):
+            if total() > budget and field in fitted:
+                self._compact_field(fitted, sizes, field)
+
+        after = estimate_tokens(self.dumps(fitted))
+        with self._lock:
+            self.stats["trimmed"] += 1
+            self.stats["tokens_saved"] += max(0, before - after)
+            if after > budget:
+                self.stats["over_budget"] += 1
+            per_role = self.role_stats.setdefault(role, {"trimmed": 0, "tokens_saved": 0})
+            per_role["trimmed"] += 1
+            per_role["tokens_saved"] += max(0, before - after)
+            per_role.update(last_before=before, last_after=after, budget=budget)
+        return fitted
+
+    def _compact_field(self, fitted: Dict[str, Any], sizes: Dict[str, int], field: str):
+        fitted[field] = compact_tree(fitted[field])
+        sizes[field] = estimate_tokens(self.dumps(fitted[field]))
+
+    # === 对话历史 ===
+    @staticmethod
+    def _line_key(item: Any) -> Tuple:
+        if not isinstance(item, dict):
+            return ("", str(item))
+        speaker = item.get("role") or item.get("who") or ""
+        return (speaker, item.get("text", ""))
+
+    def _dedupe(self, lines: List[Any]) -> List[Any]:
+        result: List[Any] = []
+        for item in lines:
+            if result and self._line_key(result[-1]) == self._line_key(item):
+                continue
+            result.append(item)
+        return result
+
+    def _summarize(self, dropped: List[Any], template: Any) -> Dict[str, Any]:
+        """把裁掉的旧对话压成一条摘要行，字段名沿用原列表的格式。"""
+        # 每条只留开头几个字，条数越多留得越短，保证摘要整体不超过 summary_chars
+        per_line = max(8, min(30, self.summary_chars // max(1, len(dropped))))
+        pieces = []
+        for item in dropped:
+            speaker, text = self._line_key(item)
+            who = "用户" if speaker == "user" else "在哦"
+            text = " ".join(str(text).split())
+            pieces.append(f"{who}：{text[:per_line]}")
+        summary = f"（更早的 {len(dropped)} 条对话摘要）" + "；".join(pieces)
+        if len(summary) > self.summary_chars:
+            summary = summary[: self.summary_chars - 1] + "…"
+
+        times = [str(it.get("time", "")) for it in dropped if isinstance(it, dict) and it.get("time")]
+        line: Dict[str, Any] = {}
+        keys = list(template.keys()) if isinstance(template, dict) else ["time", "role", "text"]
+        for key in keys:
+            line[key] = ""
+        if "time" in line:
+            line["time"] = f"{times[0]} ~ {times[-1]}" if times else ""
+        if "who" in line:
+            line["who"] = "summary"
+        else:
+            line["role"] = "summary"
+        line["text"] = summary
+        return line
+
+    def _trim_history(self, fitted: Dict[str, Any], sizes: Dict[str, int], field: str, excess: int):
+        lines = self._dedupe(fitted[field])
+        item_sizes = [estimate_tokens(self.dumps(it)) for it in lines]
+
+        # 从最旧的开始丢，直到省下 excess（摘要本身约 summary_chars 个字，先预留）
+        reserve = int(self.summary_chars * CJK_TOKEN_RATIO)
+        need = excess + reserve
+        cut = 0
+        saved = 0
+        max_cut = max(0, len(lines) - self.min_keep_lines)
+        while cut < max_cut and saved < need:
+            saved += item_sizes[cut]
+            cut += 1
+
+        if cut == 0:
+            fitted[field] = lines
+        else:
+            fitted[field] = [self._summarize(lines[:cut], lines[0])] + lines[cut:]
+        sizes[field] = estimate_tokens(self.dumps(fitted[field]))
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            data: Dict[str, Any] = dict(self.stats)
+            data["roles"] = {role: dict(v) for role, v in self.role_stats.items()}
+        return data
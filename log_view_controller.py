@@ -1,11 +1,162 @@
 import os
 import textwrap
+from typing import List, Optional
 
-def load_and_format_llm_log(base_dir: str = None, max_chars: int = 80) -> str:
+from llm.prompt_log_store import PromptLogStore, format_record
+
+# 文本日志里每段调用的开头
+_BLOCK_MARKERS = (b"=== LLM CALL ===", b"=== TRIGGER CALL ===")
+
+# 角色筛选下拉框里的两个特殊选项
+FILTER_PERSONA = "全部人格"
+FILTER_ALL = "全部（含触发器）"
+
+
+def wrap_page(content: str, max_chars: int = 80) -> str:
+    """只对当前页按宽度换行，保留原有的换行。"""
+    lines: List[str] = []
+    for line in content.splitlines():
+        if not line.strip():
+            lines.append("")
+            continue
+        lines.extend(textwrap.wrap(line, width=max_chars) or [""])
+    return "\n".join(lines)
+
+
+def read_tail_blocks(path: str, skip: int = 0, limit: int = 20, chunk_size: int = 64 * 1024) -> List[str]:
+    """
+    从文本日志末尾往前按块读取，返回从新到旧的第 skip ~ skip+limit 段调用记录。
+    只读到够用为止，不会把整份日志读进内存。
+    """
+    if not os.path.exists(path):
+        return []
+
+    # 段落开头必须在行首，避免把 prompt 正文里的同名字符串当成分界
+    markers = tuple(b"\n" + m for m in _BLOCK_MARKERS)
+    blocks: List[str] = []
+    need = skip + limit
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        pos = f.tell()
+        tail = b""
+        while len(blocks) < need:
+            cut = max(tail.rfind(m) for m in markers)
+            if cut >= 0:
+                blocks.append(tail[cut + 1:].decode("utf-8", errors="replace"))
+                tail = tail[:cut + 1]
+                continue
+            if pos == 0:
+                # 文件开头那一段前面没有换行
+                if tail.strip():
+                    blocks.append(tail.decode("utf-8", errors="replace"))
+                break
+            step = min(chunk_size, pos)
+            pos -= step
+            f.seek(pos)
+            tail = f.read(step) + tail
+
+    return [b.strip() for b in blocks[skip:need]]
+
+
+class LLMLogPager:
     """
-    读取 data/prompt_logs/llm_prompt_log.txt，并按 UI 传入的 max_chars 自动换行。
+    LLM 调用日志的分页查看：
+
+    - 默认先看最新一页（tail-first），older() / newer() 前后翻页；
+    - 有结构化日志（PromptLogStore）时按 role 过滤并用索引直接定位到这一页；
+    - 没有 store 时退回文本日志，从文件末尾往前按块读取；
+    - 只对当前这一页做换行排版。
     """
 
+    def __init__(self, store: Optional[PromptLogStore] = None, text_path: Optional[str] = None, page_size: int = 20):
+        self.store = store
+        self.text_path = text_path
+        self.page_size = max(1, int(page_size))
+        self.page = 0  # 0 = 最新一页
+        self.role_filter = FILTER_PERSONA
+
+    # === 过滤 ===
+    def filter_options(self) -> List[str]:
+        options = [FILTER_PERSONA, FILTER_ALL]
+        if self._use_store():
+            options.extend(self.store.roles())
+        return options
+
+    def set_filter(self, role_filter: str):
+        self.role_filter = role_filter or FILTER_PERSONA
+        self.page = 0
+
+    def _roles(self) -> Optional[List[str]]:
+        if self.role_filter == FILTER_ALL:
+            return None
+        if self.role_filter == FILTER_PERSONA:
+            return [r for r in self.store.roles() if not r.startswith("trigger_")]
+        return [self.role_filter]
+
+    def _use_store(self) -> bool:
+        return self.store is not None and self.store.count() > 0
+
+    # === 翻页 ===
+    def total(self) -> int:
+        if self._use_store():
+            return self.store.count(self._roles())
+        return -1  # 文本日志不统计总数（统计就得全读一遍）
+
+    def page_count(self) -> int:
+        total = self.total()
+        if total < 0:
+            return -1
+        return max(1, (total + self.page_size - 1) // self.page_size)
+
+    def latest(self):
+        self.page = 0
+
+    def older(self):
+        pages = self.page_count()
+        if pages < 0 or self.page + 1 < pages:
+            self.page += 1
+
+    def newer(self):
+        if self.page > 0:
+            self.page -= 1
+
+    # === 渲染当前页 ===
+    def render(self, max_chars: int = 80) -> str:
+        skip = self.page * self.page_size
+        try:
+            if self._use_store():
+                records = self.store.query(roles=self._roles(), limit=self.page_size, skip=skip)
+                blocks = [format_record(rec) for rec in records]
+            elif self.text_path:
+                blocks = read_tail_blocks(self.text_path, skip=skip, limit=self.page_size)
+            else:
+                blocks = []
+        except Exception as e:
+            return f"⚠ 无法读取 LLM 日志：{e}"
+
+        if not blocks:
+            if self.page > 0:
+                # 翻过头了：回到上一页
+                self.page -= 1
+                return self.render(max_chars)
+            return "（暂无 LLM 调用日志）"
+
+        # 页内按时间先后排列，和原来文本日志的阅读顺序一致
+        content = "\n\n".join(b.strip() for b in reversed(blocks))
+        return wrap_page(content, max_chars)
+
+    def status(self) -> str:
+        pages = self.page_count()
+        if pages < 0:
+            return f"第 {self.page + 1} 页（文本日志，从最新开始）"
+        return f"第 {self.page + 1} / {pages} 页，共 {self.total()} 条"
+
+
+def load_and_format_llm_log(base_dir: str = None, max_chars: int = 80, store: PromptLogStore = None) -> str:
+    """
+    读取最近一页 LLM 调用日志并按 max_chars 换行（兼容旧接口）。
+    传了 store（结构化日志）且里面有记录时，优先从 store 读。
+    """
     # 如果传入的是完整路径，就直接用；否则认为是目录
     if base_dir and base_dir.endswith(".txt"):
         log_path = base_dir
@@ -14,18 +165,4 @@ def load_and_format_llm_log(base_dir: str = None, max_chars: int = 80) -> str:
             base_dir = os.path.dirname(os.path.abspath(__file__))
         log_path = os.path.join(base_dir, "data", "prompt_logs", "llm_prompt_log.txt")
 
-    if not os.path.exists(log_path):
-        return "（暂无 LLM 调用日志）"
-
-    try:
-        with open(log_path, "r", encoding="utf-8") as f:
-            content = f.read().strip()
-        if not content:
-            return "（暂无 LLM 调用日志）"
-
-        # 自动按字符宽度换行
-        wrapped = textwrap.fill(content, width=max_chars)
-        return wrapped
-
-    except Exception as e:
-        return f"⚠ 无法读取 LLM 日志：{e}"
+    return LLMLogPager(store=store, text_path=log_path).render(max_chars)
@@ -5,9 +5,10 @@ import random
 import threading
 import datetime
 import json
-from log_view_controller import load_and_format_llm_log
+from log_view_controller import LLMLogPager
 import dearpygui.dearpygui as dpg
 from core.orchestrator import ConversationOrchestrator
+from ui.dispatcher import UIDispatcher
 
 # ================================
 # 基本参数（固定窗口）
@@ -80,8 +81,15 @@ TITLE_Y_OFFSET = -30    # 负数 = 向上一点
 # 聊天区当前高度偏移
 chat_y_offset = 0
 
+# 流式气泡：正在逐字生成的那一个（同一时间只有一个），画在 chat_y_offset 处
+stream_node = None
+stream_text = ""
+
 orchestrator = None
 
+# 后台线程的 UI 操作统一排队，由渲染循环每帧执行
+ui_dispatcher = UIDispatcher()
+
 # 字体 tag
 TITLE_FONT_TAG = "title_font"
 MAIN_FONT_TAG = "cn_font"
@@ -123,6 +131,18 @@ PROMPT_LOG_TEXT_TAG = "prompt_log_text"
 # ==== 人格引擎查看窗口 ====
 PERSONA_WINDOW_TAG = "persona_engine_window"
 PERSONA_TEXT_TAG = "persona_engine_text"
+PERSONA_FILTER_TAG = "persona_engine_filter"
+PERSONA_STATUS_TAG = "persona_engine_status"
+PERSONA_WRAP_CHARS = 90
+
+# 日志分页器：打开窗口时才创建（需要 orchestrator 里的 prompt_store）
+log_pager = None
+
+# ==== 链路追踪窗口 ====
+TRACE_WINDOW_TAG = "trace_window"
+TRACE_TEXT_TAG = "trace_text"
+TRACE_STATUS_TAG = "trace_status"
+TRACE_EXPORT_DIR = os.path.join(BASE_DIR, "data", "traces")
 
 def doll_set_off():
     """让娃娃显示 OFF 态图片"""
@@ -183,12 +203,20 @@ def sanitize_text(text: str) -> str:
     
 def _get_latest_perspective_tree_path() -> str:
     """
-    返回最新的观点树 JSON 文件路径：
-    1）优先 data/perspective_trees 目录中，按修改时间取最新的 .json；
-    2）如果目录不存在或为空，退回 data/tree_default.json；
-    3）如果都没有，返回空字符串。
+    返回当前观点树的 JSON 文件路径：
+    1）优先问观点树库（清单里记着当前加载在用的那棵，不用扫目录）；
+    2）还没有 orchestrator 时，在 data/perspective_trees 目录中按修改时间取最新的 .json；
+    3）如果目录不存在或为空，退回 data/tree_default.json；
+    4）如果都没有，返回空字符串。
     """
-    # 先看目录
+    if orchestrator is not None:
+        # 在用的树可能比目录里最新的文件旧（从树池 / 树库加载的），所以有 orchestrator 时不再按时间扫目录
+        path = orchestrator.tree_library.latest_path()
+        if path and os.path.isfile(path):
+            return path
+        return DEFAULT_TREE_PATH if os.path.isfile(DEFAULT_TREE_PATH) else ""
+
+    # 再看目录
     if os.path.isdir(PERSPECTIVE_DIR):
         candidates = [
             os.path.join(PERSPECTIVE_DIR, f)
@@ -327,8 +355,10 @@ def draw_outlined_text(drawlist_tag, x, y, text, size, main_color, outline_color
 #   左边：粉色（娃娃）
 #   右边：青色（用户）
 # ------------------------------------
-def add_bubble(text, side="left"):
+def _draw_bubble(text, side, y, parent):
     """
+    在 parent（drawlist 或 draw_node）里画一个气泡，顶端在 y，返回气泡高度。
+
     气泡逻辑：
     - 基于字数粗略换行（MAX_CHARS_PER_LINE）
     - 计算最长一行的估算宽度，得出基础宽度
@@ -336,11 +366,7 @@ def add_bubble(text, side="left"):
     - 文本全部左对齐
     - 右侧气泡整体左移 RIGHT_BUBBLE_MARGIN，预留滚动条区域
     """
-    text = sanitize_text(text)
-    _append_log(side, text)
-    global chat_y_offset, CHAT_INNER_WIDTH, CHAT_VIEW_H
-
-    drawlist_tag = "chat_drawlist"
+    drawlist_tag = parent
 
     padding_x = 30
     padding_y = 18
@@ -380,8 +406,6 @@ def add_bubble(text, side="left"):
         fill_color = BUBBLE_CYAN_FILL
         outline_color = BUBBLE_CYAN_OUTLINE
 
-    y = chat_y_offset
-
     # 画气泡矩形
     dpg.draw_rectangle(
         pmin=(x, y),
@@ -408,25 +432,81 @@ def add_bubble(text, side="left"):
             outline_color
         )
 
-    # 5）更新下一条气泡的位置
-    chat_y_offset += bubble_h + 24
+    return bubble_h
 
-    # 6）根据当前内容底部位置，动态调节 drawlist 的高度（控制滚动区域）
-    content_height = chat_y_offset + 20
+
+def _scroll_chat_to(bottom, focus_input=True):
+    """根据当前内容底部位置，动态调节 drawlist 的高度（控制滚动区域）。"""
+    content_height = bottom + 20
     try:
         dpg.configure_item("chat_drawlist", height=max(CHAT_VIEW_H, content_height))
         dpg.set_y_scroll("chat_scroll", content_height)  # 新：强制滚到底
-        dpg.focus_item("input_field")
+        if focus_input:
+            dpg.focus_item("input_field")
     except Exception:
         pass
 
 
+def add_bubble(text, side="left"):
+    """画一个完整气泡，写入对话日志，并把下一条气泡的位置往下推。"""
+    text = sanitize_text(text)
+    _append_log(side, text)
+    global chat_y_offset
+
+    bubble_h = _draw_bubble(text, side, chat_y_offset, "chat_drawlist")
+
+    # 更新下一条气泡的位置
+    chat_y_offset += bubble_h + 24
+    _scroll_chat_to(chat_y_offset)
+
+    # 流式气泡还在生成中：把它挪到新的底部，始终保持在最后一条
+    if stream_node is not None:
+        update_stream_bubble(stream_text)
+
+
+def update_stream_bubble(text):
+    """流式生成中：在聊天区底部重画“正在长出来”的左侧气泡（不写日志、不推进位置）。"""
+    global stream_node, stream_text
+    stream_text = text
+    try:
+        if stream_node is None or not dpg.does_item_exist(stream_node):
+            stream_node = dpg.add_draw_node(parent="chat_drawlist")
+        dpg.delete_item(stream_node, children_only=True)
+        bubble_h = _draw_bubble(sanitize_text(text), "left", chat_y_offset, stream_node)
+        _scroll_chat_to(chat_y_offset + bubble_h + 24, focus_input=False)
+    except Exception as e:
+        print("[UI] update_stream_bubble 出错：", e)
+
+
+def finish_stream_bubble(text):
+    """流式生成结束：撤掉临时气泡，换成一个正式气泡（写日志 + 推进位置）。"""
+    global stream_node, stream_text
+    node = stream_node
+    stream_node = None
+    stream_text = ""
+    try:
+        if node is not None and dpg.does_item_exist(node):
+            dpg.delete_item(node)
+    except Exception:
+        pass
+    if text:
+        add_bubble(text, "left")
+
 
 def on_ai_message(text):
     if text:
         add_bubble(text, "left")
 
 
+def on_ai_stream_update(text):
+    if text:
+        update_stream_bubble(text)
+
+
+def on_ai_stream_end(text):
+    finish_stream_bubble(text)
+
+
 CONFIG_API_PATH = os.path.join("config", "api_key.txt")
 API_KEY_WINDOW_TAG = "api_key_window"
 API_KEY_INPUT_TAG = "api_key_input"
@@ -570,11 +650,52 @@ def open_state_snapshot_dialog(sender=None, app_data=None, user_data=None):
         )
 
 
+def _refresh_persona_log_view():
+    """按分页器当前的页码 / 过滤条件，只读取并排版这一页。"""
+    if log_pager is None:
+        return
+    if dpg.does_item_exist(PERSONA_TEXT_TAG):
+        dpg.set_value(PERSONA_TEXT_TAG, log_pager.render(max_chars=PERSONA_WRAP_CHARS))
+    if dpg.does_item_exist(PERSONA_STATUS_TAG):
+        dpg.set_value(PERSONA_STATUS_TAG, log_pager.status())
+    if dpg.does_item_exist(PERSONA_FILTER_TAG):
+        dpg.configure_item(PERSONA_FILTER_TAG, items=log_pager.filter_options())
+
+
+def on_persona_log_latest(sender=None, app_data=None, user_data=None):
+    if log_pager is not None:
+        log_pager.latest()
+    _refresh_persona_log_view()
+
+
+def on_persona_log_older(sender=None, app_data=None, user_data=None):
+    if log_pager is not None:
+        log_pager.older()
+    _refresh_persona_log_view()
+
+
+def on_persona_log_newer(sender=None, app_data=None, user_data=None):
+    if log_pager is not None:
+        log_pager.newer()
+    _refresh_persona_log_view()
+
+
+def on_persona_log_filter(sender=None, app_data=None, user_data=None):
+    if log_pager is not None:
+        log_pager.set_filter(app_data)
+    _refresh_persona_log_view()
+
+
 def open_persona_engine_dialog(sender=None, app_data=None, user_data=None):
-    """查看人格引擎：使用大窗口显示格式化后的 llm_prompt_log 内容。"""
+    """查看人格引擎：大窗口分页显示 LLM 调用日志（先看最新一页，可往前翻、按角色过滤）。"""
+    global log_pager
 
-    # 使用外部模块读取日志并按字符宽度排版
-    content = load_and_format_llm_log(PROMPT_LOG_PATH, max_chars=90)
+    if log_pager is None:
+        store = orchestrator.llm_client.prompt_store if orchestrator is not None else None
+        log_pager = LLMLogPager(store=store, text_path=PROMPT_LOG_PATH, page_size=20)
+    # 每次打开都回到最新一页
+    log_pager.latest()
+    content = log_pager.render(max_chars=PERSONA_WRAP_CHARS)
 
     # ---- 新版窗口尺寸：与软件窗口同宽 ----
     win_w = WINDOW_W
@@ -596,7 +717,22 @@ def open_persona_engine_dialog(sender=None, app_data=None, user_data=None):
             height=win_h,
             pos=(pos_x, pos_y),
         ):
-            dpg.add_text("以下为解析并重排后的 LLM 调用日志：")
+            dpg.add_text("以下为解析并重排后的 LLM 调用日志（每页按时间先后排列）：")
+            dpg.add_spacer(height=6)
+
+            with dpg.group(horizontal=True):
+                dpg.add_combo(
+                    tag=PERSONA_FILTER_TAG,
+                    items=log_pager.filter_options(),
+                    default_value=log_pager.role_filter,
+                    width=220,
+                    callback=on_persona_log_filter,
+                )
+                dpg.add_button(label="最新", width=60, callback=on_persona_log_latest)
+                dpg.add_button(label="更早", width=60, callback=on_persona_log_older)
+                dpg.add_button(label="较新", width=60, callback=on_persona_log_newer)
+                dpg.add_text(log_pager.status(), tag=PERSONA_STATUS_TAG)
+
             dpg.add_spacer(height=6)
 
             dpg.add_input_text(
@@ -605,7 +741,7 @@ def open_persona_engine_dialog(sender=None, app_data=None, user_data=None):
                 multiline=True,
                 readonly=True,
                 width=-1,
-                height=win_h - 90
+                height=win_h - 120
             )
 
             dpg.add_spacer(height=6)
@@ -616,16 +752,81 @@ def open_persona_engine_dialog(sender=None, app_data=None, user_data=None):
             )
 
     else:
-        if dpg.does_item_exist(PERSONA_TEXT_TAG):
-            dpg.set_value(PERSONA_TEXT_TAG, content)
+        _refresh_persona_log_view()
         dpg.configure_item(PERSONA_WINDOW_TAG, show=True)
         
+def _refresh_trace_view():
+    if orchestrator is None:
+        return
+    if dpg.does_item_exist(TRACE_TEXT_TAG):
+        dpg.set_value(TRACE_TEXT_TAG, orchestrator.tracer.format_recent(limit=20))
+
+
+def on_trace_export(sender=None, app_data=None, user_data=None):
+    """把最近的轮次导出到 data/traces/：.json 用 chrome://tracing 打开，.folded 给火焰图工具。"""
+    if orchestrator is None:
+        return
+    try:
+        paths = orchestrator.tracer.export(TRACE_EXPORT_DIR)
+        msg = "已导出：" + "  ".join(os.path.basename(p) for p in paths.values())
+    except Exception as e:
+        msg = f"导出失败：{e}"
+    print("[Trace]", msg)
+    if dpg.does_item_exist(TRACE_STATUS_TAG):
+        dpg.set_value(TRACE_STATUS_TAG, msg)
+
+
+def open_trace_dialog(sender=None, app_data=None, user_data=None):
+    """链路追踪：最近 20 轮的各阶段耗时（最新在上），可导出 Chrome trace / folded stacks。"""
+    if orchestrator is None:
+        return
+    content = orchestrator.tracer.format_recent(limit=20)
+
+    if dpg.does_item_exist(TRACE_WINDOW_TAG):
+        _refresh_trace_view()
+        dpg.configure_item(TRACE_WINDOW_TAG, show=True)
+        return
+
+    win_h = int(WINDOW_H * 0.9)
+    with dpg.window(
+        tag=TRACE_WINDOW_TAG,
+        label="链路追踪（最近 20 轮）",
+        modal=True,
+        no_collapse=True,
+        no_resize=False,
+        width=WINDOW_W,
+        height=win_h,
+        pos=(0, int(TOP_GRADIENT_H * 1.2)),
+    ):
+        with dpg.group(horizontal=True):
+            dpg.add_button(label="刷新", width=80, callback=_refresh_trace_view)
+            dpg.add_button(label="导出", width=80, callback=on_trace_export)
+            dpg.add_text(f"导出目录：{TRACE_EXPORT_DIR}", tag=TRACE_STATUS_TAG)
+
+        dpg.add_spacer(height=6)
+        dpg.add_input_text(
+            tag=TRACE_TEXT_TAG,
+            default_value=content,
+            multiline=True,
+            readonly=True,
+            width=-1,
+            height=win_h - 120
+        )
+        dpg.add_spacer(height=6)
+        dpg.add_button(
+            label="关闭",
+            width=80,
+            callback=lambda: dpg.configure_item(TRACE_WINDOW_TAG, show=False)
+        )
+
+
 def reset_to_first_meet(sender=None, app_data=None, user_data=None):
     """
     “回到初见”按钮回调：
     - 删除 data/logs/ 下所有对话日志
-    - 删除 data/prompt_logs/ 下所有 LLM 日志
+    - 删除 data/prompt_logs/ 下所有 LLM 日志（文本日志 + store/ 结构化日志）
     - 删除 data/current_state_snapshot.json
+    - 清空触发器回复缓存（data/llm_response_cache.json）
     （不动 user_profile.json，让长期画像保留）
     """
     base_dir = os.path.dirname(os.path.abspath(__file__))
@@ -644,11 +845,13 @@ def reset_to_first_meet(sender=None, app_data=None, user_data=None):
                 except Exception as e:
                     print("删除对话日志失败:", path, e)
 
-    # 删除 LLM 日志（人格 & 触发器）
+    # 删除 LLM 日志（人格 & 触发器，含轮转出去的旧文件 / .gz 归档）
+    # 先等后台日志线程把排队的内容写完，避免删完又写回来
+    orchestrator.llm_client.log_sink.flush()
     if os.path.exists(prompt_logs_dir):
         for name in os.listdir(prompt_logs_dir):
             path = os.path.join(prompt_logs_dir, name)
-            if os.path.isfile(path) and name.endswith(".txt"):
+            if os.path.isfile(path) and ".txt" in name:
                 try:
                     os.remove(path)
                 except Exception as e:
@@ -660,7 +863,13 @@ def reset_to_first_meet(sender=None, app_data=None, user_data=None):
             os.remove(snapshot_path)
         except Exception as e:
             print("删除 snapshot 失败:", snapshot_path, e)
-            
+
+    # 删除结构化 LLM 日志（data/prompt_logs/store/）
+    orchestrator.llm_client.prompt_store.clear()
+
+    # 清空触发器回复缓存：旧对话的判断不该带到“初见”里
+    orchestrator.llm_client.response_cache.clear()
+
     orchestrator.reset_perspective_tree_to_default()
     
     # 用在哦自己说一句话当作提示（左侧粉色气泡）
@@ -683,7 +892,8 @@ def send_message():
         return
 
     # 丢给 Orchestrator 的任务队列，后台线程会统一处理并通过 ui_callback 画出 AI 气泡
-    orchestrator.handle_user_message(txt)
+    if not orchestrator.submit_user_message(txt):
+        add_bubble("（我这边消息有点堆积，稍等一下再说～）", "left")
     
 def handle_time_jump_button():
     global orchestrator
@@ -692,7 +902,7 @@ def handle_time_jump_button():
         return
 
     try:
-        orchestrator.handle_time_jump()
+        orchestrator.submit_time_jump()
     except Exception as e:
         print("时光飞逝执行出错:", e)
 
@@ -705,7 +915,7 @@ def time_jump():
         return
 
     try:
-        orchestrator.handle_time_jump()
+        orchestrator.submit_time_jump()
     except Exception as e:
         print("⚠ 时光飞逝一下 调用失败：", e)
         add_bubble("（我刚刚有点卡壳，再点一次试试？）", "left")
@@ -869,7 +1079,7 @@ def build_ui():
         
         button_labels = [
             "输入 API KEY", "查看人格引擎", "回到初见", "在哦理解你", "观点树", "模拟忙碌",
-            "时光飞逝下", "时光飞逝下", "时光飞逝下", "时光飞逝下"
+            "时光飞逝下", "时光飞逝下", "时光飞逝下", "链路追踪"
         ]
         
         btn_h = 56
@@ -893,6 +1103,8 @@ def build_ui():
                 callback = simulate_busy
             elif label == "时光飞逝下":
                 callback = handle_time_jump_button
+            elif label == "链路追踪":
+                callback = open_trace_dialog
         
             btn = dpg.add_button(
                 label=label,
@@ -1015,13 +1227,15 @@ def main():
 
     global orchestrator
     orchestrator = ConversationOrchestrator(ui_callback=on_ai_message)
+    orchestrator.register_ui_dispatch(ui_dispatcher.post, ui_dispatcher.post_latest)
     orchestrator.start_trigger_loop()
     orchestrator.register_thinking_start(doll_set_off)
     orchestrator.register_thinking_end(doll_set_on)
+    orchestrator.register_stream_callbacks(on_ai_stream_update, on_ai_stream_end)
     
-    # 也要给 llm_client 注册
-    orchestrator.llm_client.on_thinking_start = doll_set_off
-    orchestrator.llm_client.on_thinking_end = doll_set_on
+    # 也要给 llm_client 注册（LLM 在后台线程里调用，同样转回渲染线程）
+    orchestrator.llm_client.on_thinking_start = lambda: ui_dispatcher.post(doll_set_off)
+    orchestrator.llm_client.on_thinking_end = lambda: ui_dispatcher.post(doll_set_on)
     # --- 每次启动时重置 snapshot：所有字段写成“等待发掘” ---
     try:
         from state.snapshot_manager import StateSnapshotManager
@@ -1055,9 +1269,13 @@ def main():
     dpg.show_viewport()
     dpg.set_primary_window("root", True)
 
-    dpg.start_dearpygui()
+    # 手动渲染循环：每帧先执行后台线程排过来的 UI 操作
+    while dpg.is_dearpygui_running():
+        ui_dispatcher.drain()
+        dpg.render_dearpygui_frame()
         
-    orchestrator.stop_trigger_loop()
+    # 停 tick / 工作线程，并把回复缓存落盘
+    orchestrator.stop()
     dpg.destroy_context()
 
 
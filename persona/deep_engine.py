@@ -30,6 +30,7 @@ class DeepEngine:
         user_text: str,
         user_state: Dict[str, Any],
         talk_history: List[Dict[str, Any]],
+        on_chunk=None,
     ) -> str:
         """
         user_text:
@@ -40,13 +41,18 @@ class DeepEngine:
         talk_history:
             - 最近若干轮对话，格式为：
               [{"time": "...", "who": "user/assistant", "text": "..."}, ...]
+        on_chunk:
+            - 可选，流式回调；传了就边生成边把增量文本交给它。
         """
         payload: Dict[str, Any] = {
             "user_text": user_text,
             "user_state": user_state,
             "talk_history": talk_history,
         }
-        raw = self.llm.call_llm(self.ROLE, payload, temperature=0.7)
+        raw = self.llm.call_llm(
+            self.ROLE, payload, temperature=0.7,
+            stream=on_chunk is not None, on_chunk=on_chunk,
+        )
         if not raw:
             return ""
         # persona_deep_engine 的 prompt 约定：直接返回一段自然语言文本
@@ -9,12 +9,15 @@ class DirectEngine:
     def __init__(self, llm_client: LLMClient):
         self.llm = llm_client
 
-    def answer(self, text: str, user_state: Dict[str, Any]) -> str:
+    def answer(self, text: str, user_state: Dict[str, Any], on_chunk=None) -> str:
         payload = {
             "question": text,
             "user_state": user_state,
         }
-        reply = self.llm.call_llm("persona_direct", payload, temperature=0.3)
+        reply = self.llm.call_llm(
+            "persona_direct", payload, temperature=0.3,
+            stream=on_chunk is not None, on_chunk=on_chunk,
+        )
         if not reply:
             reply = "这个问题我先给你一个大致方向，如果你愿意，我们可以再慢慢细化。"
         return reply
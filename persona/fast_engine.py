@@ -29,18 +29,22 @@ class FastEngine:
         meta = {"opening_type": "Q", "mode": "opening"}
         return text, meta
 
-    def respond(self, text: str, user_state: Dict[str, Any], talk_his: List[Dict[str, Any]]) -> str:
+    def respond(self, text: str, user_state: Dict[str, Any], talk_his: List[Dict[str, Any]], on_chunk=None) -> str:
         """
         text: 用户本轮输入
         user_state: 当前快照
         talk_his: 最近 10 句对话，包含 time / who / text
+        on_chunk: 可选，流式回调；传了就边生成边把增量文本交给它
         """
         payload = {
             "user_text": text,
             "user_state": user_state,
             "talk_his": talk_his,
         }
-        reply = self.llm.call_llm("persona_fast", payload, temperature=0.5)
+        reply = self.llm.call_llm(
+            "persona_fast", payload, temperature=0.5,
+            stream=on_chunk is not None, on_chunk=on_chunk,
+        )
         if not reply:
             reply = "我在听，你可以多跟我说说。"
         return reply
@@ -44,6 +44,7 @@ class SlowEngine:
         snapshot: Dict[str, Any],
         talk_history: List[Dict[str, Any]],
         current_tree: Dict[str, Any],
+        on_chunk=None,
     ) -> str:
         """
         T 引擎主力回复：
@@ -53,6 +54,7 @@ class SlowEngine:
         - current_tree: 当前观点树结构（含当前节点、上一节点、children 等）
 
         会把这四个字段打包成 JSON，发给 persona_slow 对应的 system prompt。
+        传了 on_chunk 时走流式接口，边生成边回调增量文本。
         """
         payload = {
             "user_text": text,
@@ -65,6 +67,8 @@ class SlowEngine:
             role=self.ROLE,
             payload=payload,
             temperature=0.6,
+            stream=on_chunk is not None,
+            on_chunk=on_chunk,
         )
 
         if not reply:
@@ -29,10 +29,11 @@ class SumEngine:
         user_text: str,
         user_state: Dict[str, Any],
         talk_history: List[Dict[str, Any]],
-        current_tree: Dict[str, Any]
+        current_tree: Dict[str, Any],
+        on_chunk=None,
     ) -> str:
         """
-        生成总结文字。
+        生成总结文字。传了 on_chunk 时走流式接口。
         """
         payload = {
             "user_text": user_text,
@@ -45,6 +46,8 @@ class SumEngine:
             role=self.ROLE,
             payload=payload,
             temperature=0.3,
+            stream=on_chunk is not None,
+            on_chunk=on_chunk,
         )
 
         return reply or ""
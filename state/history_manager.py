@@ -14,6 +14,8 @@ class HistoryManager:
         # log_dir 现在只是占位，为兼容旧接口，仍然保留参数，但不再使用
         self.log_dir = log_dir
         self.history: List[Dict[str, Any]] = []
+        # 每追加一条就 +1，方便外部低成本判断“对话有没有变化”
+        self.version = 0
 
     def get_recent_lines(self, limit: int = 5):
         """
@@ -62,6 +64,7 @@ class HistoryManager:
             "text": text,
             "time": ts,
         })
+        self.version += 1
         # 不再写 TXT，避免和 main._append_log 的格式冲突
 
     def append_ai(self, text: str):
@@ -73,6 +76,7 @@ class HistoryManager:
             "text": text,
             "time": ts,
         })
+        self.version += 1
         # 不再写 TXT，避免和 main._append_log 的格式冲突
 
     def get_recent(self, limit: int = 20) -> List[Dict[str, Any]]:
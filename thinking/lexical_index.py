@@ -0,0 +1,246 @@
+import math
+import re
+import threading
+import zlib
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # 没装 numpy 时退回纯 Python 稀疏向量，结果一致，只是文档多了会慢一些
+    np = None
+
+# 只保留中文 / 字母 / 数字，标点和空白都当分隔
+TOKEN_RE = re.compile(r"[一-鿿A-Za-z0-9]+")
+_CJK_RE = re.compile(r"[一-鿿]")
+
+# 特征哈希的维度：字 + 二元组哈希进 4096 个桶，几百条文档足够，冲突可以忽略
+DEFAULT_DIM = 4096
+
+# 观点树节点里参与索引的字段
+NODE_FIELDS = ("title", "user_viewpoint", "our_viewpoint", "potential_need")
+
+
+def tokenize(text: str) -> List[str]:
+    """中文按 单字 + 相邻二元组 切，英文 / 数字按整词（小写）。"""
+    tokens: List[str] = []
+    for run in TOKEN_RE.findall(text or ""):
+        if not _CJK_RE.match(run):
+            tokens.append(run.lower())
+            continue
+        tokens.extend(run)
+        tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+def _hashed_counts(text: str, dim: int) -> Counter:
+    # crc32 跨进程稳定（内置 hash() 每次启动都不一样）
+    return Counter(zlib.crc32(tok.encode("utf-8")) % dim for tok in tokenize(text))
+
+
+def _normalize(weights: Dict[int, float]) -> Dict[int, float]:
+    norm = math.sqrt(sum(w * w for w in weights.values()))
+    return {f: w / norm for f, w in weights.items()} if norm else {}
+
+
+def _sparse_dot(a: Dict[int, float], b: Dict[int, float]) -> float:
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(w * b.get(f, 0.0) for f, w in a.items())
+
+
+def similarity(a: str, b: str, dim: int = DEFAULT_DIM) -> float:
+    """两段文本的词频余弦相似度（0~1），不需要建索引。"""
+    va = _normalize({f: 1.0 + math.log(c) for f, c in _hashed_counts(a, dim).items()})
+    vb = _normalize({f: 1.0 + math.log(c) for f, c in _hashed_counts(b, dim).items()})
+    return _sparse_dot(va, vb)
+
+
+def node_text(node: Dict[str, Any]) -> str:
+    parts: List[str] = []
+    for field in NODE_FIELDS:
+        value = node.get(field)
+        if isinstance(value, list):
+            parts.extend(str(v) for v in value)
+        elif value:
+            parts.append(str(value))
+    return " ".join(parts)
+
+
+class LexicalIndex:
+    """
+    本地文本向量索引（哈希特征 TF-IDF + 余弦）：
+
+    - add(doc_id, text) / remove(doc_id)：增量维护，只动这一篇文档的那一行；
+    - query(text, k)：返回最相关的 k 条 [(score, doc_id)]，可用 ids 限定候选范围；
+    - 装了 numpy 就把各文档的对数词频放进一个按倍数扩容的矩阵，查询时两次矩阵乘法
+      现算 IDF 加权后的余弦；没装就走纯 Python 稀疏向量。
+
+    IDF 随文档数变化，所以文档行里只存词频，IDF 放到查询时再乘：
+    加一篇文档不用重建整个矩阵。
+
+    只是字面相似度（同一件事换了说法就认不出来），当作“答案很明显时省一次 LLM”的便宜信号用。
+    """
+
+    def __init__(self, dim: int = DEFAULT_DIM, capacity: int = 16):
+        self.dim = dim
+        self._lock = threading.Lock()
+        # doc_id → {特征: 1 + log(词频)}
+        self._tf: Dict[str, Dict[int, float]] = {}
+        self._df: Counter = Counter()
+        # 行号 ↔ doc_id：删除时把最后一行挪进空位，行始终是紧凑的 0..n-1
+        self._ids: List[str] = []
+        self._rows: Dict[str, int] = {}
+        if np is not None:
+            self._matrix = np.zeros((max(1, capacity), dim), dtype=np.float32)
+            # 词频的平方，算 IDF 加权后的行范数用
+            self._matrix_sq = np.zeros_like(self._matrix)
+            self._df_vec = np.zeros(dim, dtype=np.float32)
+
+    def __len__(self) -> int:
+        return len(self._tf)
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self._tf
+
+    # === 维护 ===
+    def add(self, doc_id: str, text: str):
+        tf = {f: 1.0 + math.log(c) for f, c in _hashed_counts(text, self.dim).items()}
+        with self._lock:
+            self._remove_locked(doc_id)
+            self._tf[doc_id] = tf
+            self._df.update(tf.keys())
+            row = len(self._ids)
+            self._ids.append(doc_id)
+            self._rows[doc_id] = row
+            if np is not None and tf:
+                self._ensure_capacity_locked(row + 1)
+                feats = list(tf.keys())
+                values = np.fromiter(tf.values(), dtype=np.float32, count=len(tf))
+                self._matrix[row, feats] = values
+                self._matrix_sq[row, feats] = values * values
+                self._df_vec[feats] += 1.0
+
+    def remove(self, doc_id: str):
+        with self._lock:
+            self._remove_locked(doc_id)
+
+    def _remove_locked(self, doc_id: str):
+        tf = self._tf.pop(doc_id, None)
+        if tf is None:
+            return
+        self._df.subtract(tf.keys())
+        row = self._rows.pop(doc_id)
+        last = len(self._ids) - 1
+        if row != last:
+            moved = self._ids[last]
+            self._ids[row] = moved
+            self._rows[moved] = row
+        self._ids.pop()
+        if np is not None:
+            if row != last:
+                self._matrix[row] = self._matrix[last]
+                self._matrix_sq[row] = self._matrix_sq[last]
+            self._matrix[last] = 0.0
+            self._matrix_sq[last] = 0.0
+            if tf:
+                self._df_vec[list(tf.keys())] -= 1.0
+
+    def _ensure_capacity_locked(self, rows: int):
+        cap = self._matrix.shape[0]
+        if rows <= cap:
+            return
+        while cap < rows:
+            cap *= 2
+        for name in ("_matrix", "_matrix_sq"):
+            old = getattr(self, name)
+            grown = np.zeros((cap, self.dim), dtype=np.float32)
+            grown[:old.shape[0]] = old
+            setattr(self, name, grown)
+
+    def clear(self):
+        with self._lock:
+            self._tf.clear()
+            self._df.clear()
+            self._ids = []
+            self._rows = {}
+            if np is not None:
+                self._matrix[:] = 0.0
+                self._matrix_sq[:] = 0.0
+                self._df_vec[:] = 0.0
+
+    # === 查询 ===
+    def _idf(self, f: int) -> float:
+        return math.log((1.0 + len(self._tf)) / (1.0 + self._df.get(f, 0))) + 1.0
+
+    def query(self, text: str, k: int = 5, ids: Optional[Iterable[str]] = None) -> List[Tuple[float, str]]:
+        counts = _hashed_counts(text, self.dim)
+        with self._lock:
+            if not self._ids:
+                return []
+            q = _normalize({f: (1.0 + math.log(c)) * self._idf(f) for f, c in counts.items()})
+            if not q:
+                return []
+            rows = list(range(len(self._ids))) if ids is None else [self._rows[i] for i in ids if i in self._rows]
+            if not rows:
+                return []
+            if np is not None:
+                idf = np.log((1.0 + len(self._tf)) / (1.0 + self._df_vec)) + 1.0
+                qv = np.zeros(self.dim, dtype=np.float32)
+                qv[list(q.keys())] = list(q.values())
+                # 余弦 = (词频·IDF)·q / ‖词频·IDF‖
+                sub = slice(0, len(self._ids)) if ids is None else rows
+                dots = self._matrix[sub] @ (qv * idf)
+                norms = np.sqrt(self._matrix_sq[sub] @ (idf * idf))
+                with np.errstate(divide="ignore", invalid="ignore"):
+                    cos = np.where(norms > 0, dots / norms, 0.0)
+                scores = [(float(cos[j]), self._ids[r]) for j, r in enumerate(rows)]
+            else:
+                scores = []
+                for r in rows:
+                    tf = self._tf[self._ids[r]]
+                    weighted = {f: w * self._idf(f) for f, w in tf.items()}
+                    norm = math.sqrt(sum(w * w for w in weighted.values()))
+                    scores.append((_sparse_dot(weighted, q) / norm if norm else 0.0, self._ids[r]))
+        scores.sort(reverse=True)
+        return [(round(s, 4), doc_id) for s, doc_id in scores[:k]]
+
+    def score(self, text: str, doc_id: str) -> float:
+        top = self.query(text, k=1, ids=[doc_id])
+        return top[0][0] if top else 0.0
+
+
+class TopicIndex:
+    """
+    对话主题索引：当前观点树的节点。
+
+    - 观点树 version 变了就重建节点索引；
+    - nearest_nodes(text)：哪几个节点和这句话最像；
+    - topic_drift(text)：1 - 与当前树最像节点的相似度，越大说明越跑题。
+    """
+
+    def __init__(self, perspective_tree, dim: int = DEFAULT_DIM):
+        self.perspective_tree = perspective_tree
+        self.nodes = LexicalIndex(dim)
+        self._lock = threading.Lock()
+        self._tree_version = None
+
+    def _sync(self):
+        with self._lock:
+            version = self.perspective_tree.version
+            if version == self._tree_version:
+                return
+            self.nodes.clear()
+            nodes = (self.perspective_tree.get_raw_tree() or {}).get("nodes")
+            for node_id, node in (nodes.items() if isinstance(nodes, dict) else []):
+                if isinstance(node, dict):
+                    self.nodes.add(node_id, node_text(node))
+            self._tree_version = version
+
+    def nearest_nodes(self, text: str, k: int = 3, candidates: Optional[Iterable[str]] = None) -> List[Tuple[float, str]]:
+        self._sync()
+        return self.nodes.query(text, k=k, ids=candidates)
+
+    def topic_drift(self, text: str) -> float:
+        top = self.nearest_nodes(text, k=1)
+        return round(1.0 - top[0][0], 4) if top else 1.0
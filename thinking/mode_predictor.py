@@ -0,0 +1,99 @@
+import threading
+from collections import deque
+from typing import Dict, Tuple
+
+MODES = ("Q", "T", "L", "SUM", "D")
+
+# 冷启动先验：线上大部分轮次是 Q
+DEFAULT_PRIOR = {"Q": 0.5, "T": 0.2, "L": 0.1, "SUM": 0.05, "D": 0.15}
+
+# 用户原话里的本地线索 → 倾向的模式（只做加权，不做决定）
+TEXT_CUES = {
+    "L": ("怎么办", "怎么做", "如何", "帮我", "推荐", "给我", "步骤", "方案", "哪个好", "？", "?"),
+    "SUM": ("总结", "复盘", "梳理", "理一理", "回顾", "整理一下"),
+    "T": ("为什么", "是不是", "意义", "怎么看", "想法", "纠结", "迷茫"),
+    "D": ("比如", "举个例子", "打个比方", "具体说说", "展开"),
+}
+
+
+class ModePredictor:
+    """
+    人格模式的本地预测（不走 LLM），给投机执行用：
+
+    - 最近 history_size 次实际采用的模式：按出现频率（越近权重越大）；
+    - 上一个模式 → 下一个模式的转移计数（一阶马尔可夫）；
+    - 用户原话里的关键词线索（问句 / “帮我” 倾向 L，“总结” 倾向 SUM ……）。
+
+    三者加权得到每个模式的分数，返回分数最高的模式和它的占比（当作置信度）。
+    observe() 在每次真正说话时记一下实际模式，预测会随对话节奏自适应。
+    """
+
+    def __init__(
+        self,
+        history_size: int = 20,
+        recency_decay: float = 0.85,
+        weights: Tuple[float, float, float] = (0.45, 0.35, 0.2),
+    ):
+        self.recency_decay = recency_decay
+        self.w_transition, self.w_recent, self.w_text = weights
+
+        self._lock = threading.Lock()
+        self._history: deque = deque(maxlen=history_size)
+        self._transitions: Dict[str, Dict[str, int]] = {}
+
+    # === 学习 ===
+    def observe(self, mode: str):
+        mode = (mode or "").upper()
+        if mode not in MODES:
+            return
+        with self._lock:
+            if self._history:
+                row = self._transitions.setdefault(self._history[-1], {})
+                row[mode] = row.get(mode, 0) + 1
+            self._history.append(mode)
+
+    # === 预测 ===
+    def _transition_dist(self) -> Dict[str, float]:
+        if not self._history:
+            return dict(DEFAULT_PRIOR)
+        row = self._transitions.get(self._history[-1]) or {}
+        total = sum(row.values())
+        if not total:
+            return dict(DEFAULT_PRIOR)
+        # 加一点先验平滑，样本少的时候不至于太武断
+        return {m: (row.get(m, 0) + DEFAULT_PRIOR[m]) / (total + 1.0) for m in MODES}
+
+    def _recent_dist(self) -> Dict[str, float]:
+        if not self._history:
+            return dict(DEFAULT_PRIOR)
+        scores = {m: 0.0 for m in MODES}
+        weight = 1.0
+        for mode in reversed(self._history):
+            scores[mode] += weight
+            weight *= self.recency_decay
+        total = sum(scores.values())
+        return {m: v / total for m, v in scores.items()}
+
+    @staticmethod
+    def _text_dist(user_text: str) -> Dict[str, float]:
+        text = user_text or ""
+        hits = {m: sum(1 for cue in cues if cue in text) for m, cues in TEXT_CUES.items()}
+        total = sum(hits.values())
+        if not total:
+            return dict(DEFAULT_PRIOR)
+        return {m: hits.get(m, 0) / total for m in MODES}
+
+    def predict(self, user_text: str = "") -> Tuple[str, float]:
+        """返回 (最可能的模式, 置信度 0~1)。"""
+        with self._lock:
+            transition = self._transition_dist()
+            recent = self._recent_dist()
+        text = self._text_dist(user_text)
+
+        scores = {
+            m: self.w_transition * transition[m] + self.w_recent * recent[m] + self.w_text * text[m]
+            for m in MODES
+        }
+        total = sum(scores.values()) or 1.0
+        mode = max(MODES, key=lambda m: scores[m])
+        return mode, round(scores[mode] / total, 3)
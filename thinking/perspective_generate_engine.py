@@ -2,20 +2,40 @@ import json
 import os
 import datetime
 from llm.client import LLMClient
+from llm.http_pool import CancelToken
 
 
 class PerspectiveGenerateEngine:
     ROLE = "perspective_generate_engine"
 
-    def __init__(self, llm_client: LLMClient, base_dir: str):
+    def __init__(self, llm_client: LLMClient, base_dir: str, library=None):
         self.llm = llm_client
         self.base_dir = base_dir
         self.tree_dir = os.path.join(base_dir, "data", "perspective_trees")
         os.makedirs(self.tree_dir, exist_ok=True)
+        # 观点树库（TreeLibrary）：每保存一棵树就登记进清单
+        self.library = library
 
-    def generate_tree(self, user_text: str, snapshot: dict, talk_history: list) -> dict:
+    def _register(self, tree: dict, path: str):
+        if self.library is None:
+            return
+        try:
+            self.library.add(tree, path)
+        except Exception as e:
+            print("[PerspectiveGenerateEngine] 登记观点树清单失败:", e)
+
+    def generate_tree(
+        self,
+        user_text: str,
+        snapshot: dict,
+        talk_history: list,
+        save: bool = True,
+        cancel: CancelToken = None,
+    ) -> dict:
         """
         调用 LLM 生成一棵新的观点树，并写入 data/perspective_trees 目录。
+        save=False 时只在内存里返回（预生成池的候选树，真正用上时再 save_generated_tree）。
+        cancel 不为空时可以从别的线程掐断这次生成（返回空字典）。
         """
 
         payload = {
@@ -25,7 +45,7 @@ class PerspectiveGenerateEngine:
         }
 
         # 调用 LLM（角色：perspective_generate_engine）
-        raw = self.llm.call_llm(self.ROLE, payload, temperature=0.4)
+        raw = self.llm.call_llm(self.ROLE, payload, temperature=0.4, cancel=cancel)
         if not raw:
             print("[PerspectiveGenerateEngine] LLM 返回为空，放弃生成新树")
             return {}
@@ -68,16 +88,24 @@ class PerspectiveGenerateEngine:
         tree["generated_at"] = ts
 
         # ======== ⑤ 保存到 data/perspective_trees ========
+        if save:
+            self.save_generated_tree(tree)
+
+        return tree
+
+    def save_generated_tree(self, tree: dict) -> str:
+        """把 generate_tree 生成的树写入 data/perspective_trees 并登记进树库，返回文件路径。"""
         try:
             os.makedirs(self.tree_dir, exist_ok=True)
-            path = os.path.join(self.tree_dir, f"{tree_id}.json")
+            path = os.path.join(self.tree_dir, f"{tree['tree_id']}.json")
             with open(path, "w", encoding="utf-8") as f:
                 json.dump(tree, f, indent=2, ensure_ascii=False)
             print("[PerspectiveGenerateEngine] 已保存观点树:", path)
+            self._register(tree, path)
+            return path
         except Exception as e:
             print("[PerspectiveGenerateEngine] 保存失败:", e)
-
-        return tree
+            return ""
 
     def save_tree_to_file(self, tree: dict) -> str:
         """
@@ -106,6 +134,7 @@ class PerspectiveGenerateEngine:
                 json.dump(tree, f, indent=2, ensure_ascii=False)
 
             print("[PerspectiveGenerateEngine] 已保存自定义观点树:", path)
+            self._register(tree, path)
             return path
 
         except Exception as e:
@@ -0,0 +1,223 @@
+import json
+import os
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from thinking.lexical_index import TopicIndex, similarity
+
+STAY = "stay"
+
+# 用户否定前提 / 换话题的说法：这类轮次最可能 need_new_tree，本地只看字面分数判断不了，一律交给 LLM
+DENIAL_CUES = (
+    "不是", "不对", "误会", "没在说", "没说", "我是说", "我其实", "其实我", "你理解错",
+    "说的不是", "跟这个没关系", "和这个没关系", "换个话题", "聊点别的", "说点别的", "不想聊", "算了",
+)
+
+
+def _action_of(move_info: Optional[Dict[str, Any]]) -> str:
+    """把 move_info 压成一个可比较的动作：stay / move:<id> / new_tree。"""
+    if not move_info:
+        return STAY
+    if move_info.get("need_new_tree"):
+        return "new_tree"
+    if move_info.get("move") and move_info.get("next_node_id"):
+        return f"move:{move_info['next_node_id']}"
+    return STAY
+
+
+class PerspectiveMovePredictor:
+    """
+    观点树下一步的本地预测（不走 LLM）：
+
+    候选 = 当前节点（留在原地）+ 它的 children，每个候选打分：
+    - 和用户原话的字面相似度（TopicIndex，TF-IDF）；
+    - potential_need 和用户原话的相似度；
+    - 当前节点额外加一点“停留”分，在同一节点待的轮数越多加得越少（聊久了就该往前走）。
+
+    只看 user_text：T 的回复基本是在复述当前节点，算进来会让“留在原地”永远赢。
+
+    本地只做一件事——“明显该往某个 child 走”：最高分是 child、比第二名高出 margin、
+    话题没跑偏（topic_drift ≤ max_drift）、当前节点不是终点、用户也没在否定前提 / 换话题。
+    “留在原地”和“换一棵树”本地都不判，交给 PerspectiveMoveTrigger（LLM）。
+    本地决定的轮次里再按 shadow_rate 抽一部分同时问 LLM，统计两边一致率，方便调阈值。
+    每次决策写一行 JSONL 日志（交给 LLM 的记下原因 defer）。
+    """
+
+    def __init__(
+        self,
+        topic_index: TopicIndex,
+        margin: float = 0.1,
+        max_drift: float = 0.75,
+        stay_bonus: float = 0.05,
+        lexical_weight: float = 0.6,
+        need_weight: float = 0.4,
+        shadow_rate: float = 0.1,
+        log_path: Optional[str] = None,
+        seed: Optional[int] = None,
+    ):
+        self.topic_index = topic_index
+        self.margin = margin
+        self.max_drift = max_drift
+        self.stay_bonus = stay_bonus
+        self.lexical_weight = lexical_weight
+        self.need_weight = need_weight
+        self.shadow_rate = shadow_rate
+        self.log_path = log_path
+
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._node_key: Optional[Tuple[str, str]] = None
+        self._node_turns = 0
+        self.stats: Dict[str, int] = {
+            "local": 0,      # 本地直接决定
+            "llm": 0,        # 不够确定，交给 LLM
+            "shadow": 0,     # 本地决定了，但抽样同时问了 LLM
+            "compared": 0,   # 有本地预测也有 LLM 结果的次数
+            "agree": 0,      # 其中两边动作一致的次数
+        }
+
+    # === 打分 ===
+    def _turns_on(self, tree_id: str, node_id: str) -> int:
+        with self._lock:
+            key = (tree_id, node_id)
+            if key == self._node_key:
+                self._node_turns += 1
+            else:
+                self._node_key, self._node_turns = key, 1
+            return self._node_turns
+
+    def score(
+        self,
+        current_node: Dict[str, Any],
+        full_tree: Dict[str, Any],
+        user_text: str,
+    ) -> List[Tuple[float, str]]:
+        """返回 [(score, 候选节点 id)]，从高到低；当前节点的 id 代表“留在原地”。"""
+        nodes = full_tree.get("nodes") if isinstance(full_tree, dict) else None
+        nodes = nodes if isinstance(nodes, dict) else {}
+        current_id = current_node.get("id")
+        children = [c for c in (current_node.get("children") or []) if isinstance(c, str)]
+        candidates = [current_id] + [c for c in children if c != current_id]
+
+        lexical = {
+            doc_id: s
+            for s, doc_id in self.topic_index.nearest_nodes(user_text, k=len(candidates), candidates=candidates)
+        }
+        turns = self._turns_on(str(full_tree.get("tree_id")), current_id)
+
+        scored = []
+        for node_id in candidates:
+            node = nodes.get(node_id) or {}
+            need = node.get("potential_need")
+            need_text = " ".join(need) if isinstance(need, list) else str(need or "")
+            s = self.lexical_weight * lexical.get(node_id, 0.0)
+            if need_text and user_text:
+                s += self.need_weight * similarity(need_text, user_text)
+            if node_id == current_id:
+                s += self.stay_bonus / turns
+            scored.append((round(s, 4), node_id))
+        scored.sort(reverse=True)
+        return scored
+
+    # === 决策 ===
+    def decide(
+        self,
+        current_node: Dict[str, Any],
+        full_tree: Dict[str, Any],
+        user_text: str,
+        fallback: Callable[[], Dict[str, Any]],
+    ) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """
+        返回 (move_info, 决策记录)。move_info 和 PerspectiveMoveTrigger.decide_move 的结构一致；
+        fallback() 是 LLM 决策，不够确定或者抽中影子对比时才调用。
+        """
+        scored = self.score(current_node, full_tree, user_text)
+        drift = self.topic_index.topic_drift(user_text)
+        best_score, best_id = scored[0]
+        second = scored[1][0] if len(scored) > 1 else 0.0
+        current_id = current_node.get("id")
+
+        defer = self._defer_reason(current_node, user_text, scored, drift)
+        confident = defer is None
+        local_info = {
+            "move": best_id != current_id,
+            "next_node_id": best_id if best_id != current_id else None,
+            "need_new_tree": False,
+            "reason": f"local: {best_id} {best_score:.2f} vs {second:.2f}, drift {drift:.2f}",
+        }
+
+        record: Dict[str, Any] = {
+            "ts": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "tree_id": full_tree.get("tree_id") if isinstance(full_tree, dict) else None,
+            "node_id": current_id,
+            "scores": scored[:4],
+            "drift": drift,
+            "local_action": _action_of(local_info),
+        }
+        if defer:
+            record["defer"] = defer
+
+        if confident and self._rng.random() >= self.shadow_rate:
+            source, move_info = "local", local_info
+        else:
+            source = "shadow" if confident else "llm"
+            move_info = fallback()
+            record["llm_action"] = _action_of(move_info)
+            record["agree"] = record["llm_action"] == record["local_action"]
+            if source == "shadow":
+                # 影子对比只用来统计，仍然采用本地决定（和线上行为保持一致）
+                move_info = local_info
+
+        record["source"] = source
+        self._record(record)
+        return move_info, record
+
+    def _defer_reason(
+        self,
+        current_node: Dict[str, Any],
+        user_text: str,
+        scored: List[Tuple[float, str]],
+        drift: float,
+    ) -> Optional[str]:
+        """本地不够把握的原因；返回 None 表示可以本地决定。"""
+        if current_node.get("is_end"):
+            return "end_node"
+        if len(scored) < 2:
+            return "no_children"
+        if any(cue in (user_text or "") for cue in DENIAL_CUES):
+            return "denial"
+        if drift > self.max_drift:
+            return "drift"
+        best_score, best_id = scored[0]
+        if best_id == current_node.get("id"):
+            return "stay"
+        if best_score - scored[1][0] < self.margin:
+            return "margin"
+        return None
+
+    # === 统计 / 日志 ===
+    def _record(self, record: Dict[str, Any]):
+        with self._lock:
+            self.stats[record["source"]] += 1
+            if "agree" in record:
+                self.stats["compared"] += 1
+                self.stats["agree"] += int(record["agree"])
+        # 每次决策的明细只进 jsonl 决策日志，不打到控制台
+        if not self.log_path:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.log_path) or ".", exist_ok=True)
+            with open(self.log_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        except Exception as e:
+            print("[MovePredictor] 写决策日志失败:", e)
+
+    def summary(self) -> Dict[str, float]:
+        with self._lock:
+            data: Dict[str, float] = dict(self.stats)
+        total = data["local"] + data["llm"] + data["shadow"]
+        data["local_rate"] = round((data["local"] + data["shadow"]) / total, 3) if total else 0.0
+        data["agreement_rate"] = round(data["agree"] / data["compared"], 3) if data["compared"] else 0.0
+        return data
@@ -1,3 +1,4 @@
+import threading
 from typing import Dict, Any
 
 
@@ -12,12 +13,25 @@ class PerspectiveTree:
         - move_to(node_id)
         - load_tree(tree_dict)
         - get_raw_tree()
+
+    version：树的内容每变一次就 +1（加载新树 / 移动节点 / 补占位节点），
+    外部可以据此判断之前序列化过的树还能不能复用。
+
+    观点树的推进 / 重建会在后台线程里做（回复先发出去），所以读写都加锁；
+    后台结果用 load_tree_if_version / apply_move_if_version 落地：
+    只有树在这期间没被别人换过（version 没变）才生效，否则直接丢弃。
+
+    写时复制：get_raw_tree() 交出去的 dict 之后不会再被原地修改（补占位节点 / 补字段
+    都是在锁里拷一份新的再换上），其他线程的人格拿着它序列化时，不会碰上后台维护
+    改到一半的树（dictionary changed size during iteration）。
     """
 
     def __init__(self, tree: Dict[str, Any] | None = None):
+        self._lock = threading.RLock()
         self.tree: Dict[str, Any] = {}
         self.current_node_id: str = "ROOT"
         self.previous_node_id: str | None = None
+        self.version = 0
 
         if tree:
             self.load_tree(tree)
@@ -44,6 +58,7 @@ class PerspectiveTree:
         }
         self.current_node_id = "ROOT"
         self.previous_node_id = None
+        self.version += 1
 
     # === 对外：加载一棵新的观点树（来自 LLM 生成引擎） ===
     def load_tree(self, tree: Dict[str, Any]):
@@ -55,7 +70,12 @@ class PerspectiveTree:
         - 带 nodes + current_node_id
         - 只有 root 节点
         """
-        self.tree = tree or {}
+        with self._lock:
+            self._load_tree_locked(tree)
+
+    def _load_tree_locked(self, tree: Dict[str, Any]):
+        # 拷一层：传进来的树可能还被调用方（树池 / 树库）拿着
+        self.tree = dict(tree or {})
 
         # 尝试确定 root / current 节点
         root_id = self._get_root_id_from_tree(self.tree)
@@ -69,9 +89,12 @@ class PerspectiveTree:
         # 如果树结构太简陋，至少保证有一个节点可用
         nodes = self._get_nodes_dict()
         if self.current_node_id not in nodes:
+            nodes = dict(nodes)
             nodes[self.current_node_id] = {"id": self.current_node_id, "children": []}
             self.tree["nodes"] = nodes
 
+        self.version += 1
+
     # === 获取当前节点（并附带上一节点 id、children 等信息） ===
     def get_current_node(self) -> Dict[str, Any]:
         """
@@ -81,18 +104,19 @@ class PerspectiveTree:
         - 一定包含 children（没有则给空列表）
         - 如果有上一节点，则在 _previous_node_id 里附加
         """
-        nodes = self._get_nodes_dict()
-        raw_node = nodes.get(self.current_node_id, {}) or {}
+        with self._lock:
+            nodes = self._get_nodes_dict()
+            raw_node = nodes.get(self.current_node_id, {}) or {}
 
-        node: Dict[str, Any] = dict(raw_node)  # 拷贝一份，避免改到原数据
+            node: Dict[str, Any] = dict(raw_node)  # 拷贝一份，避免改到原数据
 
-        node.setdefault("id", self.current_node_id)
-        node.setdefault("children", [])
+            node.setdefault("id", self.current_node_id)
+            node.setdefault("children", [])
 
-        if self.previous_node_id:
-            node["_previous_node_id"] = self.previous_node_id
+            if self.previous_node_id:
+                node["_previous_node_id"] = self.previous_node_id
 
-        return node
+            return node
 
     # === 对外：移动到某个节点 ===
     def move_to(self, node_id: str):
@@ -105,33 +129,60 @@ class PerspectiveTree:
         if not node_id:
             return
 
-        nodes = self._get_nodes_dict()
+        with self._lock:
+            nodes = self._get_nodes_dict()
 
-        # 记录上一节点
-        self.previous_node_id = self.current_node_id
-        self.current_node_id = node_id
+            # 记录上一节点
+            self.previous_node_id = self.current_node_id
+            self.current_node_id = node_id
 
-        # 如果该节点不存在，补一个最小占位节点
-        if node_id not in nodes:
-            nodes[node_id] = {"id": node_id, "children": []}
-            self.tree["nodes"] = nodes
+            # 如果该节点不存在，补一个最小占位节点（换成新的 tree / nodes，不改已经交出去的那份）
+            if node_id not in nodes:
+                nodes = dict(nodes)
+                nodes[node_id] = {"id": node_id, "children": []}
+                self.tree = {**self.tree, "nodes": nodes}
+
+            self.version += 1
 
     # === 对外：导出整棵树（给 T 引擎 / SUM 引擎 / 触发器用） ===
     def get_raw_tree(self) -> Dict[str, Any]:
         """
         返回整棵观点树的原始结构，并补充 current_node_id / root_id。
+        返回的是一份快照：之后树再变也只会换成新的 dict，调用方可以放心在锁外序列化，但不要改它。
         """
-        tree = self.tree or {}
-        if "current_node_id" not in tree:
-            tree["current_node_id"] = self.current_node_id
-        if "root_id" not in tree:
-            tree["root_id"] = self._get_root_id_from_tree(tree)
-        return tree
+        with self._lock:
+            tree = self.tree or {}
+            if "current_node_id" not in tree or "root_id" not in tree:
+                tree = dict(tree)
+                tree.setdefault("current_node_id", self.current_node_id)
+                tree.setdefault("root_id", self._get_root_id_from_tree(tree))
+                self.tree = tree
+                self.version += 1
+            return tree
 
     # === 可选：重置到根节点 ===
     def reset_to_root(self):
-        self.previous_node_id = None
-        self.current_node_id = self._get_root_id_from_tree(self.tree)
+        with self._lock:
+            self.previous_node_id = None
+            self.current_node_id = self._get_root_id_from_tree(self.tree)
+            self.version += 1
+
+    # === 后台结果落地：version 对得上才生效 ===
+    def load_tree_if_version(self, tree: Dict[str, Any], expected_version: int) -> bool:
+        """后台生成的新树：树从 expected_version 起没被动过才换上，返回是否换了。"""
+        with self._lock:
+            if self.version != expected_version:
+                return False
+            self._load_tree_locked(tree)
+            return True
+
+    def apply_move_if_version(self, move_info: Dict[str, Any], expected_version: int) -> bool:
+        """后台算出的节点移动：同上，树被换过 / 移动过就丢弃。"""
+        with self._lock:
+            if self.version != expected_version:
+                return False
+            self.apply_move(move_info)
+            return True
 
     # === 内部工具：获取 nodes dict ===
     def _get_nodes_dict(self) -> Dict[str, Any]:
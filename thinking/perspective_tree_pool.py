@@ -0,0 +1,221 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from typing import Any, Dict, List, Optional, Set
+
+from llm.http_pool import CancelToken
+from thinking.lexical_index import node_text, similarity
+from thinking.perspective_generate_engine import PerspectiveGenerateEngine
+
+
+def tree_text(tree: Dict[str, Any]) -> str:
+    """把一棵树里各节点的标题 / 观点 / 潜在需求拼成一段文本，给相似度打分用。"""
+    nodes = tree.get("nodes") if isinstance(tree, dict) else None
+    return " ".join(
+        node_text(node)
+        for node in (nodes.values() if isinstance(nodes, dict) else [])
+        if isinstance(node, dict)
+    )
+
+
+def context_text(user_text: str, snapshot: Optional[Dict[str, Any]], talk_history: Optional[list]) -> str:
+    """当前对话上下文：本轮原话 + 最近几句 + snapshot 里已知的字段值。"""
+    parts = [user_text or ""]
+    for item in (talk_history or [])[-6:]:
+        if isinstance(item, dict):
+            parts.append(str(item.get("text") or ""))
+    for key, value in (snapshot or {}).items():
+        if key != "timestamp" and isinstance(value, str) and value not in ("", "等待发掘"):
+            parts.append(value)
+    return " ".join(parts)
+
+
+class _PooledTree:
+    def __init__(self, tree: Dict[str, Any], seed: str):
+        self.tree = tree
+        self.seed = seed
+        self.text = tree_text(tree)
+        self.created_at = time.time()
+
+
+class PerspectiveTreePool:
+    """
+    预生成观点树池：
+
+    - refill()：池子没满、也没有正在生成的任务时，在后台（单线程）按最近的用户话题
+      预先生成一棵候选树，每次换一句没用过的原话当种子，候选之间尽量不重样；
+    - take()：need_new_tree 时按当前上下文给候选打分，最高分过了 min_score 就直接拿走，
+      不够相关就返回 None，调用方照旧现场生成；
+    - 超过 max_age 秒的候选视为过时，随时淘汰；池子最多 max_size 棵，满了挤掉最旧的；
+    - cancel_pending()：预生成和现场生成共用 perspective_generate_engine 的那一个并发名额，
+      现场要生成时先把正在跑的预生成掐掉，让出名额（种子退回，下次 refill 还能用）。
+
+    候选树只放在内存里，不写 data/perspective_trees、也不进树库：
+    调用方拿走并真正加载之后，再用 generate_engine.save_generated_tree 落盘。
+    """
+
+    def __init__(
+        self,
+        generate_engine: PerspectiveGenerateEngine,
+        max_size: int = 2,
+        max_age: float = 900.0,
+        min_score: float = 0.15,
+        tracer=None,
+    ):
+        self.generate_engine = generate_engine
+        self.max_size = max(1, int(max_size))
+        self.max_age = max_age
+        self.min_score = min_score
+        self.tracer = tracer
+
+        self._lock = threading.Lock()
+        self._trees: List[_PooledTree] = []
+        self._used_seeds: Set[str] = set()
+        self._pending = None
+        self._pending_cancel: Optional[CancelToken] = None
+        self._pending_seed: Optional[str] = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="zaio-tree-pool")
+        self.stats: Dict[str, int] = {
+            "generated": 0, "failed": 0, "cancelled": 0, "hits": 0, "misses": 0, "evicted": 0,
+        }
+
+    # === 内部 ===
+    def _evict_stale_locked(self):
+        now = time.time()
+        fresh = [t for t in self._trees if now - t.created_at <= self.max_age]
+        self.stats["evicted"] += len(self._trees) - len(fresh)
+        self._trees = fresh
+
+    @staticmethod
+    def _pick_seed(talk_history: Optional[list], used: Set[str]) -> Optional[str]:
+        # 从最近的用户原话里挑一句还没当过种子的
+        for item in reversed(talk_history or []):
+            if not isinstance(item, dict) or item.get("who") != "user":
+                continue
+            text = str(item.get("text") or "").strip()
+            if text and text not in used:
+                return text
+        return None
+
+    def _clear_pending_locked(self, cancel: CancelToken):
+        # 只清自己那一次：被 cancel_pending() 清掉之后可能已经换成了新的预生成
+        if self._pending_cancel is cancel:
+            self._pending = None
+            self._pending_cancel = None
+            self._pending_seed = None
+
+    def _generate(self, seed: str, snapshot: Dict[str, Any], talk_history: list, cancel: CancelToken):
+        # 后台预生成自成一轮追踪，不混进用户轮次
+        turn = self.tracer.turn("tree_pool_refill") if self.tracer is not None else nullcontext()
+        try:
+            with turn:
+                tree = self.generate_engine.generate_tree(
+                    user_text=seed,
+                    snapshot=snapshot,
+                    talk_history=talk_history,
+                    save=False,
+                    cancel=cancel,
+                )
+        except Exception as e:
+            print("[TreePool] 预生成观点树失败:", e)
+            tree = None
+
+        with self._lock:
+            self._clear_pending_locked(cancel)
+            if cancel.cancelled:
+                # 被现场生成抢占（或池子已关闭）：结果不要了，计数已在 cancel_pending 里记过
+                return
+            if not tree:
+                self.stats["failed"] += 1
+                return
+            self.stats["generated"] += 1
+            self._trees.append(_PooledTree(tree, seed))
+            if len(self._trees) > self.max_size:
+                self._trees.pop(0)
+                self.stats["evicted"] += 1
+            size = len(self._trees)
+        print(f"[TreePool] 已预生成候选观点树（池中 {size} 棵）")
+
+    # === 对外 ===
+    def refill(self, snapshot: Optional[Dict[str, Any]], talk_history: Optional[list]):
+        """后台补一棵候选树（池满 / 已经在生成 / 没有新话题 时什么都不做）。"""
+        with self._lock:
+            self._evict_stale_locked()
+            if self._pending is not None or len(self._trees) >= self.max_size:
+                return
+            seed = self._pick_seed(talk_history, self._used_seeds)
+            if seed is None:
+                return
+            self._used_seeds.add(seed)
+            cancel = CancelToken()
+            try:
+                self._pending = self._executor.submit(
+                    self._generate, seed, dict(snapshot or {}), list(talk_history or []), cancel
+                )
+            except RuntimeError:
+                # 已经 close()
+                self._pending = None
+                return
+            self._pending_cancel = cancel
+            self._pending_seed = seed
+
+    def cancel_pending(self) -> bool:
+        """掐掉正在跑（或排着）的预生成，让出生成名额；返回是否真的取消了一个。"""
+        with self._lock:
+            pending, cancel, seed = self._pending, self._pending_cancel, self._pending_seed
+            if pending is None or cancel is None:
+                return False
+            self._clear_pending_locked(cancel)
+            if seed is not None:
+                self._used_seeds.discard(seed)
+            self.stats["cancelled"] += 1
+        pending.cancel()
+        cancel.cancel()
+        print("[TreePool] 现场生成观点树，取消进行中的预生成")
+        return True
+
+    def take(
+        self,
+        user_text: str,
+        snapshot: Optional[Dict[str, Any]],
+        talk_history: Optional[list],
+    ) -> Optional[Dict[str, Any]]:
+        """按当前上下文挑一棵最相关的候选树并从池中取走；都不够相关返回 None。返回的树还没落盘。"""
+        ctx = context_text(user_text, snapshot, talk_history)
+        with self._lock:
+            # 这句原话马上会被拿去现场生成（没命中时），不再当预生成种子，免得请求重复
+            if user_text:
+                self._used_seeds.add(user_text.strip())
+            self._evict_stale_locked()
+            best, best_score = None, 0.0
+            for entry in self._trees:
+                score = similarity(ctx, entry.text + " " + entry.seed)
+                if score > best_score:
+                    best, best_score = entry, score
+            if best is None or best_score < self.min_score:
+                self.stats["misses"] += 1
+                return None
+            self._trees.remove(best)
+            self.stats["hits"] += 1
+        print(f"[TreePool] 命中预生成观点树 {best.tree.get('tree_id')}（相关度 {best_score:.2f}）")
+        return best.tree
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            data: Dict[str, Any] = dict(self.stats)
+            data["size"] = len(self._trees)
+            data["pending"] = self._pending is not None
+        return data
+
+    def close(self):
+        """不等后台预生成：排着的取消，正在跑的掐断请求，结果丢弃。"""
+        with self._lock:
+            pending, cancel = self._pending, self._pending_cancel
+            if cancel is not None:
+                self._clear_pending_locked(cancel)
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        if pending is not None:
+            pending.cancel()
+        if cancel is not None:
+            cancel.cancel()
@@ -0,0 +1,222 @@
+import json
+import os
+import random
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+from thinking.lexical_index import TOKEN_RE, LexicalIndex
+from thinking.perspective_tree_pool import tree_text
+
+# 每棵树保留多少个最常见的字二元组当关键词签名
+SIGNATURE_SIZE = 64
+
+
+def is_default_tree(tree_id: str) -> bool:
+    # 和原来的文件名过滤规则一致：包含 default / 默认 的算默认树
+    return "default" in (tree_id or "").lower() or "默认" in (tree_id or "")
+
+
+def keyword_signature(text: str, size: int = SIGNATURE_SIZE) -> List[str]:
+    counts: Counter = Counter()
+    for run in TOKEN_RE.findall(text or ""):
+        counts.update(run[i:i + 2] for i in range(len(run) - 1))
+    return [gram for gram, _ in counts.most_common(size)]
+
+
+def _root_title(tree: Dict[str, Any]) -> str:
+    nodes = tree.get("nodes")
+    if isinstance(nodes, dict) and nodes:
+        root = nodes.get(tree.get("root_id")) or next(iter(nodes.values()))
+    else:
+        root = tree.get("root")
+    if not isinstance(root, dict):
+        return ""
+    return str(root.get("title") or root.get("user_viewpoint") or "")[:60]
+
+
+class TreeLibrary:
+    """
+    观点树库：data/perspective_trees 目录 + 一份清单 data/perspective_tree_index.json。
+
+    清单里每棵树一条：id / 文件名 / 创建时间 / 根节点标题 / 关键词签名 / 使用次数，
+    外加 latest_id（最近写入的那棵）和 active_id（当前加载在用的那棵）：
+
+    - mark_active(tree_id)：每次 PerspectiveTree.load_tree 换树后调用。树会在后台生成、
+      从树池 / 树库直接加载而不重新写文件，“最近写入”不等于“正在用”，所以单独记；
+    - latest_path()：O(1) 拿当前在用的树（没记过 active 时退回最近写入的），不用再把目录里每个文件 stat 一遍；
+    - random_tree()：时光飞逝随机挑一棵非默认树，不用每次 listdir + 字符串过滤；
+    - top_k(context)：根节点标题 + 关键词签名建一份 TF-IDF 索引（LexicalIndex），
+      按和当前上下文的相似度找最相关的几棵历史树，
+      need_new_tree / 时光飞逝可以直接复用，不用再调 LLM 生成。
+
+    启动时和目录对一次账（清单里没有的文件补进来，文件没了的条目删掉），
+    之后由 PerspectiveGenerateEngine 每保存一棵树就 add() 一次，增量维护。
+    """
+
+    def __init__(self, tree_dir: str, index_path: str):
+        self.tree_dir = tree_dir
+        self.index_path = index_path
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._latest_id: Optional[str] = None
+        self._active_id: Optional[str] = None
+        self._index = LexicalIndex()
+        self._load_index()
+        self._reconcile()
+        for tree_id, entry in self._entries.items():
+            self._index.add(tree_id, self._entry_text(entry))
+
+    # === 清单读写 ===
+    def _load_index(self):
+        if not os.path.isfile(self.index_path):
+            return
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self._entries = {k: v for k, v in (data.get("trees") or {}).items() if isinstance(v, dict)}
+            self._latest_id = data.get("latest_id")
+            self._active_id = data.get("active_id")
+        except Exception as e:
+            print("[TreeLibrary] 读取观点树清单失败，重新建立:", e)
+            self._entries, self._latest_id, self._active_id = {}, None, None
+
+    def _save_index_locked(self):
+        try:
+            os.makedirs(os.path.dirname(self.index_path) or ".", exist_ok=True)
+            tmp_path = self.index_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(
+                    {"latest_id": self._latest_id, "active_id": self._active_id, "trees": self._entries},
+                    f,
+                    ensure_ascii=False,
+                    indent=2,
+                )
+            os.replace(tmp_path, self.index_path)
+        except Exception as e:
+            print("[TreeLibrary] 写入观点树清单失败:", e)
+
+    @staticmethod
+    def _entry_text(entry: Dict[str, Any]) -> str:
+        return " ".join([entry.get("root_title") or ""] + list(entry.get("keywords") or []))
+
+    @staticmethod
+    def _make_entry(tree: Dict[str, Any], fname: str, created_at: float) -> Dict[str, Any]:
+        return {
+            "id": os.path.splitext(fname)[0],
+            "file": fname,
+            "created_at": created_at,
+            "root_title": _root_title(tree),
+            "keywords": keyword_signature(tree_text(tree)),
+            "uses": 0,
+            "last_used": 0.0,
+        }
+
+    def _reconcile(self):
+        """和目录对账：只在启动时做一次。"""
+        if not os.path.isdir(self.tree_dir):
+            return
+        files = {f for f in os.listdir(self.tree_dir) if f.endswith(".json")}
+        changed = False
+        with self._lock:
+            for tree_id in [k for k, v in self._entries.items() if v.get("file") not in files]:
+                del self._entries[tree_id]
+                changed = True
+            known = {v.get("file") for v in self._entries.values()}
+            for fname in sorted(files - known):
+                path = os.path.join(self.tree_dir, fname)
+                try:
+                    with open(path, "r", encoding="utf-8") as f:
+                        tree = json.load(f)
+                except Exception as e:
+                    print("[TreeLibrary] 跳过无法解析的观点树:", fname, e)
+                    continue
+                entry = self._make_entry(tree, fname, os.path.getmtime(path))
+                self._entries[entry["id"]] = entry
+                changed = True
+            if self._latest_id not in self._entries:
+                self._latest_id = max(self._entries, key=lambda k: self._entries[k]["created_at"], default=None)
+                changed = True
+            if changed:
+                self._save_index_locked()
+
+    # === 增量维护 ===
+    def add(self, tree: Dict[str, Any], path: str):
+        """一棵树刚写到 path：加进清单并记为最新。"""
+        fname = os.path.basename(path)
+        entry = self._make_entry(tree, fname, time.time())
+        with self._lock:
+            old = self._entries.get(entry["id"])
+            if old:
+                entry["uses"], entry["last_used"] = old.get("uses", 0), old.get("last_used", 0.0)
+            self._entries[entry["id"]] = entry
+            self._latest_id = entry["id"]
+            self._save_index_locked()
+        self._index.add(entry["id"], self._entry_text(entry))
+
+    def mark_active(self, tree_id: Optional[str]):
+        """当前观点树换成了 tree_id（不在清单里的树也照记，latest_path 就找不到文件，而不是指错树）。"""
+        with self._lock:
+            if tree_id == self._active_id:
+                return
+            self._active_id = tree_id
+            self._save_index_locked()
+
+    def mark_used(self, tree_id: str):
+        with self._lock:
+            entry = self._entries.get(tree_id)
+            if entry is None:
+                return
+            entry["uses"] = entry.get("uses", 0) + 1
+            entry["last_used"] = time.time()
+            self._save_index_locked()
+
+    # === 查询 ===
+    def latest_path(self) -> str:
+        """当前在用的那棵树的文件路径；启动后还没换过树（没有 active）时给最近写入的。"""
+        with self._lock:
+            tree_id = self._active_id or self._latest_id
+            entry = self._entries.get(tree_id) if tree_id else None
+        return os.path.join(self.tree_dir, entry["file"]) if entry else ""
+
+    def load(self, tree_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(tree_id)
+        if entry is None:
+            return None
+        path = os.path.join(self.tree_dir, entry["file"])
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                tree = json.load(f)
+        except Exception as e:
+            print("[TreeLibrary] 加载观点树失败:", path, e)
+            return None
+        # 没有 tree_id 的话，用文件名兜底
+        tree.setdefault("tree_id", tree_id)
+        return tree
+
+    def random_tree(self, exclude_default: bool = True) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            ids = [k for k in self._entries if not (exclude_default and is_default_tree(k))]
+        if not ids:
+            return None
+        return self.load(random.choice(ids))
+
+    def top_k(self, context: str, k: int = 3, exclude_ids=(), min_score: float = 0.0) -> List[Tuple[float, str]]:
+        """按和 context 的 TF-IDF 余弦相似度给非默认树排序，返回 [(score, tree_id)]。"""
+        with self._lock:
+            candidates = [t for t in self._entries if t not in exclude_ids and not is_default_tree(t)]
+        if not candidates:
+            return []
+        scored = self._index.query(context, k=k, ids=candidates)
+        return [(score, tree_id) for score, tree_id in scored if score >= min_score]
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "trees": len(self._entries),
+                "latest_id": self._latest_id,
+                "active_id": self._active_id,
+                "used": sum(1 for v in self._entries.values() if v.get("uses")),
+            }
@@ -0,0 +1,71 @@
+from typing import Dict, Any, List
+from llm.client import LLMClient
+import json
+
+
+class DecisionTrigger:
+    """合并决策触发器：一次 LLM 调用同时给出“是否说话”和“用哪个引擎”。
+
+    对应 llm.client 里的 role = trigger_decide_turn，
+    规则直接复用 trigger_should_speak + trigger_select_engine 的 prompt。
+
+    返回：
+        {
+            "should_reply": True/False/None,   # None 表示 LLM 没给出有效值
+            "mode": "Q"/"T"/"L"/"SUM"/"D"/None,
+            "reason": "...",
+        }
+    结果交给 TalkTrigger.should_reply / EngineSelectTrigger.select 的 decision 参数消费，
+    它们会在字段缺失时走各自原有的兜底。
+    """
+
+    ROLE = "trigger_decide_turn"
+
+    def __init__(self, llm_client: LLMClient):
+        self.llm = llm_client
+
+    def decide(
+        self,
+        recent_lines: List[Dict[str, Any]],
+        user_text: str,
+        snapshot: Dict[str, Any],
+        history: List[Dict[str, Any]],
+        user_triggered: bool,
+    ) -> Dict[str, Any]:
+        payload: Dict[str, Any] = {
+            "recent_lines": recent_lines,
+            "user_text": user_text,
+            "user_triggered": user_triggered,
+            "snapshot": snapshot,
+            "talk_history": history,
+        }
+
+        decision: Dict[str, Any] = {
+            "should_reply": None,
+            "mode": None,
+            "reason": "",
+        }
+
+        raw = self.llm.call_llm(self.ROLE, payload, temperature=0.0)
+        if not raw:
+            return decision
+
+        try:
+            data = json.loads(raw)
+        except Exception:
+            return decision
+        if not isinstance(data, dict):
+            return decision
+
+        val = data.get("should_reply")
+        if isinstance(val, bool):
+            decision["should_reply"] = val
+        elif isinstance(val, str) and val.strip().lower() in ("true", "false"):
+            decision["should_reply"] = val.strip().lower() == "true"
+
+        mode = str(data.get("mode") or "").upper().strip()
+        if mode in ("Q", "T", "L", "SUM", "D"):
+            decision["mode"] = mode
+
+        decision["reason"] = data.get("reason", "") or ""
+        return decision
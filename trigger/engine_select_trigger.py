@@ -12,6 +12,8 @@ class EngineSelectTrigger:
     - snapshot: 当前用户状态快照
     - history: 最近若干轮对话（list[dict]）
     - user_triggered: 是否为用户触发（True=用户说话，False=系统 tick）
+
+    也可以直接消费 DecisionTrigger 的合并决策结果（decision 参数），省掉一次调用。
     """
 
     ROLE = "trigger_select_engine"
@@ -25,8 +27,13 @@ class EngineSelectTrigger:
         snapshot: Dict[str, Any],
         history: List[Dict[str, Any]],
         user_triggered: bool,
+        decision: Dict[str, Any] = None,
     ) -> str:
         """返回当前应该采用的引擎模式：Q / T / L / SUM / D。"""
+        if decision is not None:
+            mode = str(decision.get("mode") or "Q").upper().strip()
+            return mode if mode in ("Q", "T", "L", "SUM", "D") else "Q"
+
         payload: Dict[str, Any] = {
             "user_text": user_text,
             "user_triggered": user_triggered,
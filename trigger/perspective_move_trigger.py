@@ -1,5 +1,6 @@
 from typing import Dict, Any, List
 from llm.client import LLMClient
+from llm.http_pool import CancelToken
 import json
 
 
@@ -23,6 +24,7 @@ class PerspectiveMoveTrigger:
         snapshot: Dict[str, Any],
         talk_history: List[Dict[str, Any]],
         full_tree: Dict[str, Any],
+        cancel: CancelToken = None,
     ) -> Dict[str, Any]:
         """
         使用 LLM 判断：
@@ -65,7 +67,7 @@ class PerspectiveMoveTrigger:
             "full_tree": full_tree,
         }
 
-        raw = self.llm.call_llm(self.ROLE, payload, temperature=0.3)
+        raw = self.llm.call_llm(self.ROLE, payload, temperature=0.3, cancel=cancel)
         if not raw:
             return {
                 "move": False,
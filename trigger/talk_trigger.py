@@ -1,7 +1,7 @@
 # trigger/talk_trigger.py
 
 import json
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 from llm.client import LLMClient
 
 
@@ -23,7 +23,8 @@ class TalkTrigger:
     def should_reply(
         self,
         recent_lines: List[Dict[str, Any]],
-        user_triggered: bool
+        user_triggered: bool,
+        decision: Dict[str, Any] = None,
     ) -> bool:
         """
         参数：
@@ -34,23 +35,41 @@ class TalkTrigger:
                     "text": "……"
                 }
             user_triggered: 本轮是否是用户先开口（用于兜底策略）
+            decision: 可选，DecisionTrigger 的合并决策结果；
+                      传了就直接用其中的 should_reply，不再单独调用 LLM
 
         返回：
             True  → 此刻应该继续说话
             False → 此刻不该说话
         """
 
+        if decision is not None:
+            val = decision.get("should_reply")
+            if isinstance(val, bool):
+                return val
+            # 合并决策没给出有效值：按 LLM 失败同样的兜底
+            return bool(user_triggered)
+
+        val = self.try_decide(recent_lines)
+        # 如果 LLM 没正常返回 / 格式不对 / 没有 should_reply 字段，就用一个安全兜底策略：
+        # - 用户刚说话 → 默认回复
+        # - 纯 Tick → 默认沉默
+        if val is None:
+            return bool(user_triggered)
+        return val
+
+    def try_decide(self, recent_lines: List[Dict[str, Any]]) -> Optional[bool]:
+        """
+        只问 LLM、不兜底：返回 True / False；LLM 失败（空回复、超时、熔断）或解析不出结论时返回 None。
+        tick 预筛要靠它区分“LLM 说了不说话”和“LLM 根本没给结论”。
+        """
         payload = {
             "recent_lines": recent_lines
         }
 
         raw = self.llm.call_llm(self.ROLE, payload, temperature=0.1)
-
-        # 如果 LLM 没正常返回，就用一个安全兜底策略：
-        # - 用户刚说话 → 默认回复
-        # - 纯 Tick → 默认沉默
         if not raw:
-            return bool(user_triggered)
+            return None
 
         try:
             data = json.loads(raw)
@@ -61,10 +80,7 @@ class TalkTrigger:
                 return val
             if isinstance(val, str):
                 return val.strip().lower() == "true"
-
         except Exception:
-            # LLM 返回格式不对，也走兜底
-            return bool(user_triggered)
+            return None
 
-        # 万一没有 should_reply 字段，也兜底
-        return bool(user_triggered)
+        return None
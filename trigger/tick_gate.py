@@ -0,0 +1,129 @@
+import datetime
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from state.history_manager import HistoryManager
+from trigger.timing_engine import TimingEngine
+
+
+# 用户明确表示“先不聊了”的说法：命中后一段时间内 tick 不再主动开口
+DEFAULT_STOP_PHRASES = (
+    "别说了",
+    "不想聊了",
+    "不聊了",
+    "算了",
+    "先这样吧",
+    "先这样",
+    "安静点",
+    "闭嘴",
+    "拜拜",
+    "晚安",
+)
+
+
+class TickGate:
+    """
+    tick 本地预筛（不调用任何 LLM）：
+
+    空闲 tick 大多数时候结论都是“不说话”，没必要每 9 秒问一次 LLM。
+    这里按从便宜到贵的顺序先在本地判断：
+
+    1）节奏保护：TimingEngine 不允许说话 → 直接不说；
+    2）对话没变：history.version 和上一次 LLM 给出 tick 结论时一样 → 不说
+       （同样的输入问 LLM 只会得到同样的结论）；
+    3）静默窗口：
+       - AI 刚说完 quiet_after_ai_s 秒内不追着说；
+       - 用户最后一句带“别说了 / 算了 / 先这样吧”等，stop_silence_s 秒内保持安静；
+    4）以上都没拦下 → 返回 None，交给 LLM 决定。
+
+    check() 返回：
+        False：本地已确定不说话
+        None ：本地判断不了，需要走 LLM
+    LLM 给出结论后调用 mark_decided()，记下当时的 history.version。
+    """
+
+    def __init__(
+        self,
+        timing_engine: TimingEngine,
+        history_manager: HistoryManager,
+        quiet_after_ai_s: float = 20.0,
+        stop_silence_s: float = 600.0,
+        stop_phrases: Tuple[str, ...] = DEFAULT_STOP_PHRASES,
+    ):
+        self.timing_engine = timing_engine
+        self.history_manager = history_manager
+        self.quiet_after_ai_s = quiet_after_ai_s
+        self.stop_silence_s = stop_silence_s
+        self.stop_phrases = tuple(stop_phrases)
+
+        self._last_decided_version: Optional[int] = None
+        self._lock = threading.Lock()
+        self.stats = {
+            "checked": 0,
+            "timing": 0,
+            "unchanged": 0,
+            "quiet_after_ai": 0,
+            "stop_phrase": 0,
+            "escalated": 0,
+        }
+
+    def _skip(self, reason: str) -> bool:
+        with self._lock:
+            self.stats[reason] += 1
+        return False
+
+    @staticmethod
+    def _seconds_since(item: Dict[str, Any], now: float) -> Optional[float]:
+        ts = item.get("time", "")
+        try:
+            t = datetime.datetime.strptime(ts, "%Y-%m-%d %H:%M:%S").timestamp()
+        except Exception:
+            return None
+        return max(0.0, now - t)
+
+    def _hit_stop_phrase(self, text: str) -> bool:
+        text = (text or "").strip()
+        return any(p in text for p in self.stop_phrases)
+
+    def check(self) -> Optional[bool]:
+        with self._lock:
+            self.stats["checked"] += 1
+
+        # 1）节奏保护最便宜，放最前
+        if not self.timing_engine.allow_ai_speak():
+            return self._skip("timing")
+
+        # 2）上次 tick 问过 LLM 之后对话没有任何变化
+        version = self.history_manager.version
+        if version == self._last_decided_version:
+            return self._skip("unchanged")
+
+        # 3）规则静默窗口
+        recent = self.history_manager.get_recent(1)
+        if recent:
+            last = recent[-1]
+            elapsed = self._seconds_since(last, time.time())
+            if elapsed is not None:
+                if last.get("role") == "assistant" and elapsed < self.quiet_after_ai_s:
+                    return self._skip("quiet_after_ai")
+                if (
+                    last.get("role") == "user"
+                    and elapsed < self.stop_silence_s
+                    and self._hit_stop_phrase(last.get("text", ""))
+                ):
+                    return self._skip("stop_phrase")
+
+        with self._lock:
+            self.stats["escalated"] += 1
+        return None
+
+    def mark_decided(self, version: Optional[int] = None):
+        """
+        LLM 已对当前对话给出 tick 结论（无论说不说），记下版本号。
+        LLM 调用失败（空回复 / 超时 / 熔断）时不要调用，否则之后的 tick 会一直被当成“判断过了”。
+        version 传 check() 之前读到的版本，避免 LLM 调用期间新来的对话被误记为“已判断过”。
+        """
+        if version is None:
+            version = self.history_manager.version
+        self._last_decided_version = version
@@ -0,0 +1,55 @@
+import threading
+from collections import deque
+from typing import Any, Callable, Dict, List
+
+
+class UIDispatcher:
+    """
+    把后台线程里的 UI 操作转交给 DearPyGui 渲染线程执行。
+
+    - 后台线程调用 post(fn, *args)，只是排队，不碰 UI；
+    - 渲染循环每帧调用 drain()，在渲染线程里依次执行；
+    - post_latest(key, ...)：同一个 key 只保留最新一次（例如流式气泡的刷新），
+      保留它第一次入队时的位置，避免和后面的“收尾”操作顺序颠倒。
+    """
+
+    def __init__(self):
+        self._items: deque = deque()
+        self._latest: Dict[str, List[Any]] = {}
+        self._lock = threading.Lock()
+
+    def post(self, fn: Callable, *args):
+        with self._lock:
+            self._items.append([None, fn, args])
+
+    def post_latest(self, key: str, fn: Callable, *args):
+        with self._lock:
+            entry = self._latest.get(key)
+            if entry is not None:
+                entry[1] = fn
+                entry[2] = args
+                return
+            entry = [key, fn, args]
+            self._latest[key] = entry
+            self._items.append(entry)
+
+    def drain(self, max_items: int = 100) -> int:
+        """在渲染线程里执行排队的 UI 操作，返回本次执行了几个。"""
+        done = 0
+        while done < max_items:
+            with self._lock:
+                if not self._items:
+                    break
+                key, fn, args = self._items.popleft()
+                if key is not None:
+                    self._latest.pop(key, None)
+            try:
+                fn(*args)
+            except Exception as e:
+                print("[UIDispatcher] UI 回调出错:", e)
+            done += 1
+        return done
+
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._items)